@@ -1,26 +1,196 @@
-import openai
 from mylogger import logger
 import os 
 from dotenv import load_dotenv
-import requests
-from config import EXCEL_ANALYSIS, EXCEL_ANALYSIS_JSON_SCHEMA
+from config import EXCEL_ANALYSIS, EXCEL_ANALYSIS_TEXT, EXCEL_ANALYSIS_JSON_SCHEMA
+from searchcache import SearchCache, SEARCH_CACHE_PATH, make_key
+from recorder import event_hooks
+from conversation import count_tokens
+from excelparse import merge_resources
+from priority import PriorityLimiter
+from scenariocache import SingleFlight
+from metrics import LLM_CACHE_RATIO, LLM_LATENCY, LLM_TOKENS, SEARCH_LATENCY, SEARCH_QUERIES
+from routing import model_for
+import time
 import asyncio
 import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # openai and httpx are imported on first use, so importing this module stays cheap
+    import httpx
+    import openai
 
 
 load_dotenv()
 OPENAI_API = os.getenv("OPENAI_API_KEY")
 TAVILI_API = os.getenv("TAVILI_API_KEY")
 
+# connection pool / timeout knobs for the shared OpenAI client
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "180"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# web search (Tavily) client knobs
+TAVILY_URL = os.getenv("TAVILY_URL", "https://api.tavily.com/search")
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "6"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "20"))
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "20"))
+# OpenAI calls in flight for the whole process (streams hold their slot until done)
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "32"))
+
+# large workbooks are extracted in chunks of this many tokens, a few at a time
+EXCEL_CHUNK_TOKENS = int(os.getenv("EXCEL_CHUNK_TOKENS", "6000"))
+EXCEL_CHUNK_CONCURRENCY = int(os.getenv("EXCEL_CHUNK_CONCURRENCY", "4"))
+
 model = "gpt-4o-search-preview-2025-03-11"
 
+_openai_client: "openai.AsyncOpenAI" = None
+_search_client: "httpx.AsyncClient" = None
+_search_cache: SearchCache = None
+# cap in-flight searches / OpenAI calls for the whole process, not per round;
+# batch work queues behind interactive requests (see priority.py)
+_search_limiter = PriorityLimiter(SEARCH_CONCURRENCY)
+_llm_limiter = PriorityLimiter(OPENAI_CONCURRENCY)
+# identical searches in flight at the same time share one request
+_search_flight = SingleFlight()
+_excel_semaphore = asyncio.Semaphore(EXCEL_CHUNK_CONCURRENCY)
+# token totals that calls in the current context add to (see track_usage)
+_usage_totals: ContextVar[tuple] = ContextVar("openai_usage_totals", default=())
+
+
+def get_openai_client() -> "openai.AsyncOpenAI":
+    """
+    Return the process-wide AsyncOpenAI client, creating it on first use.
+    All callers share its keep-alive connection pool.
+    """
+    global _openai_client
+    if _openai_client is None:
+        import httpx
+        import openai
+
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            event_hooks=event_hooks("openai"),
+        )
+        _openai_client = openai.AsyncOpenAI(
+            api_key=OPENAI_API,
+            base_url=OPENAI_BASE_URL,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=http_client,
+        )
+    return _openai_client
+
+
+def get_search_client() -> "httpx.AsyncClient":
+    """
+    Return the process-wide pooled HTTP client used for Tavily searches.
+    """
+    global _search_client
+    if _search_client is None:
+        import httpx
+
+        _search_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=SEARCH_MAX_CONNECTIONS,
+                max_keepalive_connections=SEARCH_MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(SEARCH_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            headers={"Content-Type": "application/json"},
+            event_hooks=event_hooks("tavily"),
+        )
+    return _search_client
+
+
+def get_search_cache() -> SearchCache:
+    """
+    Return the process-wide search result cache (memory LRU + on-disk SQLite).
+    """
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache(SEARCH_CACHE_PATH or None)
+    return _search_cache
+
+
+def limiter_stats() -> dict:
+    """Slots in use and callers waiting, per lane, for the OpenAI and search limiters."""
+    return {"openai": _llm_limiter.stats(), "search": _search_limiter.stats()}
+
+
+async def close_clients() -> None:
+    """
+    Close the shared HTTP clients (called on application shutdown).
+    """
+    global _openai_client, _search_client
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+    if _search_client is not None:
+        await _search_client.aclose()
+        _search_client = None
+
+
+@contextmanager
+def track_usage():
+    """
+    Sum the token usage of every OpenAI call made inside the block, including
+    calls from tasks started inside it. Blocks may be nested.
+
+        with track_usage() as usage:
+            await call_openai_api(...)
+        usage["total_tokens"]
+    """
+    totals = {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    token = _usage_totals.set(_usage_totals.get() + (totals,))
+    try:
+        yield totals
+    finally:
+        _usage_totals.reset(token)
+
+
+def cached_tokens(usage) -> int:
+    """Prompt tokens the provider served from its prefix cache."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def _record_usage(usage, model: str, stage: str = "other") -> None:
+    if usage is None:
+        return
+    cached = cached_tokens(usage)
+    if usage.prompt_tokens:
+        ratio = cached / usage.prompt_tokens
+        LLM_CACHE_RATIO.observe(ratio, model=model)
+        logger.info("OpenAI %s: %d prompt tokens, %d cached (%.0f%%)", model, usage.prompt_tokens, cached, ratio * 100)
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind="prompt", stage=stage)
+    LLM_TOKENS.inc(cached, model=model, kind="cached", stage=stage)
+    LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, kind="completion", stage=stage)
+    for totals in _usage_totals.get():
+        totals["prompt_tokens"] += usage.prompt_tokens or 0
+        totals["cached_tokens"] += cached
+        totals["completion_tokens"] += usage.completion_tokens or 0
+        totals["total_tokens"] += usage.total_tokens or 0
+
 
-async def call_openai_api(conversation: list[dict], json_schema: str = None, model: str = "o4-mini-2025-04-16") -> str:
+async def call_openai_api(conversation: list[dict], json_schema: str = None, model: str = None,
+                          stage: str = "other") -> str:
     """
     Asynchronously call the OpenAI API and return the parsed response content as a string.
+    `stage` names the pipeline step; it picks the model (see routing.py) unless
+    `model` is given, and labels the latency and token metrics.
     """
-    client = openai.Client()
-    client.api_key = OPENAI_API  # Ensure OPENAI_API is defined correctly
+    client = get_openai_client()
+    model = model or model_for(stage)
 
     params = {
         "model": model,
@@ -30,8 +200,11 @@ async def call_openai_api(conversation: list[dict], json_schema: str = None, mod
         params["response_format"] = json_schema
 
     try:
-        response = client.beta.chat.completions.parse(**params)
+        async with _llm_limiter.slot():
+            with LLM_LATENCY.time(model=model, stream="false", stage=stage):
+                response = await client.beta.chat.completions.parse(**params)
         logger.info("Full response: %s", response)
+        _record_usage(response.usage, model, stage)
         
         content = response.choices[0]
         logger.info("Content: %s", content)
@@ -44,12 +217,43 @@ async def call_openai_api(conversation: list[dict], json_schema: str = None, mod
         logger.error(f"OpenAI API error: {e}")
         raise e
 
+async def stream_openai_api(conversation: list[dict], json_schema: dict = None, model: str = None,
+                            stage: str = "other"):
+    """
+    Asynchronously stream the OpenAI API reply, yielding content deltas as they arrive.
+    `model` and `stage` as for call_openai_api.
+    """
+    client = get_openai_client()
+    model = model or model_for(stage)
+
+    params = {
+        "model": model,
+        "messages": conversation,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    if json_schema is not None:
+        params["response_format"] = json_schema
+
+    try:
+        async with _llm_limiter.slot():
+            start = time.perf_counter()
+            stream = await client.chat.completions.create(**params)
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.usage is not None:
+                    _record_usage(chunk.usage, model, stage)
+            LLM_LATENCY.observe(time.perf_counter() - start, model=model, stream="true", stage=stage)
+    except Exception as e:
+        logger.error(f"OpenAI API stream error: {e}")
+        raise e
+
+
 async def call_tavilli_api(query: str) -> str:
     """
     Asynchronously call the Tavilli API and return the parsed response content as a string.
     """
-    url = "https://api.tavily.com/search"
-
     payload = {
         "query": query,
         "topic": "general",
@@ -65,28 +269,130 @@ async def call_tavilli_api(query: str) -> str:
         "include_domains": [],
         "exclude_domains": []
     }
-    headers = {
-        "Authorization": TAVILI_API,
-        "Content-Type": "application/json"
-    }
+    headers = {"Authorization": TAVILI_API} if TAVILI_API else {}
+
+    start = time.perf_counter()
+    cache = get_search_cache()
+    key = make_key(query, {k: payload[k] for k in ("search_depth", "max_results", "days")})
+    cached = await cache.get(key)
+    if cached is not None:
+        SEARCH_LATENCY.observe(time.perf_counter() - start, cache="hit")
+        return cached
 
-    response = requests.request("POST", url, json=payload, headers=headers)
+    async def fetch() -> str:
+        async with _search_limiter.slot():
+            response = await get_search_client().post(TAVILY_URL, json=payload, headers=headers)
+        response.raise_for_status()
+        await cache.set(key, response.text)
+        return response.text
 
-    return response.text
+    shared = key in _search_flight
+    text = await _search_flight.do(key, fetch)
+    SEARCH_LATENCY.observe(time.perf_counter() - start, cache="shared" if shared else "miss")
+    return text
 
 
-async def excel_str_to_resources(excel_str: str) -> list:
+async def search_many(queries: list[str], timeout: float = SEARCH_TIMEOUT, on_done=None) -> dict:
     """
-    Convert an Excel string representation to a list of resources.
+    Run several Tavily searches concurrently and return {query: response text}.
+    A query that fails or exceeds `timeout` seconds is logged and left out,
+    so one bad search never sinks the whole round.
+    `on_done(query, ok)` is awaited as each search finishes, if given.
     """
-    system_prompt = EXCEL_ANALYSIS.format(text=excel_str)
-    conversation = [{"role": "system", "content": system_prompt}]
-    
-    response = await call_openai_api(conversation, json_schema=EXCEL_ANALYSIS_JSON_SCHEMA)
-    
+    queries = list(dict.fromkeys(queries))
+
+    async def one(query: str) -> str:
+        try:
+            result = await asyncio.wait_for(call_tavilli_api(query), timeout)
+        except Exception as e:
+            SEARCH_QUERIES.inc(outcome="timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+            if on_done is not None:
+                await on_done(query, False)
+            raise
+        SEARCH_QUERIES.inc(outcome="ok")
+        if on_done is not None:
+            await on_done(query, True)
+        return result
+
+    outcomes = await asyncio.gather(*(one(q) for q in queries), return_exceptions=True)
+
+    results = {}
+    for query, outcome in zip(queries, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.warning("Search failed for %r: %r", query, outcome)
+            continue
+        results[query] = outcome
+    return results
+
+
+def split_tsv(sheet: str, max_tokens: int = EXCEL_CHUNK_TOKENS, header: int = 0) -> list[str]:
+    """
+    Split one sheet's TSV into row-aligned chunks of at most ~max_tokens tokens,
+    repeating the header row (TSV line `header`, or the first non-empty line after
+    it) at the top of every chunk. Lines above the header, such as a title, only
+    go into the first chunk.
+    """
+    lines = [(i, line) for i, line in enumerate(sheet.splitlines()) if line.strip("\t ")]
+    at = next((n for n, (i, _) in enumerate(lines) if i >= header), None)
+    if at is None:
+        return []
+    preamble = [line for _, line in lines[:at]]
+    header, rows = lines[at][1], [line for _, line in lines[at + 1:]]
+    header_tokens = count_tokens(header)
+    chunks, current, used = [], [], header_tokens + sum(count_tokens(line) + 1 for line in preamble)
+    for row in rows:
+        cost = count_tokens(row) + 1
+        if current and used + cost > max_tokens:
+            chunks.append("\n".join([header] + current))
+            current, used = [], header_tokens
+        current.append(row)
+        used += cost
+    chunks.append("\n".join([header] + current))
+    if preamble:
+        chunks[0] = "\n".join(preamble + [chunks[0]])
+    return chunks
+
+
+async def _extract_chunk(chunk: str) -> list:
+    conversation = [
+        {"role": "system", "content": EXCEL_ANALYSIS},
+        {"role": "user", "content": EXCEL_ANALYSIS_TEXT.format(text=chunk)},
+    ]
+
+    async with _excel_semaphore:
+        response = await call_openai_api(conversation, json_schema=EXCEL_ANALYSIS_JSON_SCHEMA, stage="excel")
+
     response_json = json.loads(response.message.content)
-    resources = response_json.get("resources", [])
-    return resources
+    return response_json.get("resources", [])
+
+
+async def excel_str_to_resources(excel_str, stats: dict = None, headers: list = None) -> list:
+    """
+    Convert an Excel string representation to a list of resources.
+    `excel_str` is one TSV text or a list of them (one per sheet). Texts larger than
+    EXCEL_CHUNK_TOKENS are split into chunks that are extracted concurrently and
+    merged by summing quantities per category. Per-chunk timings are written to
+    `stats["chunks"]` if a dict is passed. `headers` holds each sheet's header line
+    (see split_tsv); the first line by default.
+    """
+    sheets = [excel_str] if isinstance(excel_str, str) else list(excel_str)
+    headers = headers or [0] * len(sheets)
+    chunks = [chunk for sheet, header in zip(sheets, headers) for chunk in split_tsv(sheet, header=header)]
+    if not chunks:
+        return []
 
+    async def timed(i: int, chunk: str) -> tuple:
+        start = time.perf_counter()
+        result = await _extract_chunk(chunk)
+        elapsed = time.perf_counter() - start
+        logger.info("Excel chunk %d/%d: %d rows in %.2fs", i + 1, len(chunks), chunk.count("\n"), elapsed)
+        return result, {"chunk": i, "rows": chunk.count("\n"), "tokens": count_tokens(chunk), "seconds": round(elapsed, 3)}
 
+    outcomes = await asyncio.gather(*(timed(i, c) for i, c in enumerate(chunks)))
+    if stats is not None:
+        stats["chunks"] = [timing for _, timing in outcomes]
 
+    if len(outcomes) == 1:
+        return outcomes[0][0]
+    parts = [item for resources, _ in outcomes for item in resources if isinstance(item, dict)]
+    return [merge_resources(parts)]
@@ -0,0 +1,82 @@
+"""
+Cold start of one backend worker: import-time profile and time to first request.
+
+Prints the slowest modules imported by `import server` (python -X importtime),
+then starts uvicorn in a fresh process a few times and measures how long it takes
+until /healthz answers and until /readyz reports the warm-up as done.
+
+    cd backend && python -m bench.bench_cold_start --runs 3
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ENV = {"OPENAI_API_KEY": "sk-bench", "SEARCH_CACHE_PATH": "", "SESSION_STORE": "memory"}
+
+
+def import_profile(top: int) -> None:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"],
+                         capture_output=True, text=True, env={**os.environ, **ENV}, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if m:
+            rows.append((int(m.group(2)), len(m.group(3)), m.group(4)))
+    total = next(us for us, _, name in rows if name == "server")
+    print(f"import server: {total / 1000:.0f} ms")
+    # top-level imports of server and of our own modules
+    direct = sorted((r for r in rows if r[1] <= 3 and r[2] != "server"), reverse=True)[:top]
+    for us, _, name in direct:
+        print(f"  {us / 1000:>7.1f} ms  {name}")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, start: float, limit: float = 60.0) -> float:
+    while time.perf_counter() - start < limit:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as r:
+                if r.status == 200:
+                    return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(url)
+
+
+def first_request() -> tuple:
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+                            env={**os.environ, **ENV}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        return wait_for(base + "/healthz", start), wait_for(base + "/readyz", start)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(args):
+    import_profile(args.top)
+    runs = [first_request() for _ in range(args.runs)]
+    print(f"process start -> /healthz 200: {statistics.median(h for h, _ in runs) * 1000:.0f} ms (median of {args.runs})")
+    print(f"process start -> /readyz 200:  {statistics.median(r for _, r in runs) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,56 @@
+"""
+Prompt size per /session/solve round, with and without conversation compaction.
+
+Replays a synthetic 40-round session through ConversationManager and prints
+the tokens that would be sent to the model each round. With compaction the
+prompt (and with it the per-turn latency) stays flat once the budget is reached.
+
+    cd backend && python -m bench.bench_conversation --rounds 40
+"""
+import argparse
+
+from config import ANALYZE_INSIGHTS, ANALYZE_INSIGHTS_REQUEST, GENERATE_INSIGHTS, GENERATE_INSIGHTS_LOCATION, resources
+from conversation import ConversationManager, conversation_tokens
+from tools import dict_to_str
+
+
+def turn(i: int) -> dict:
+    feedback = f"Round {i}: the proposal moves boats and ambulances to the flooded districts. " * 12
+    return {
+        "role": "user",
+        "content": f"here is the how I proposed to solve the problem: solution {i}"
+                   + " and here is the feedback: " + feedback
+                   + " so new severity score is: " + dict_to_str({"severity_score": 10 - i % 10}),
+    }
+
+
+def main(args):
+    scene = [
+        {"role": "system", "content": GENERATE_INSIGHTS},
+        {"role": "system", "content": ANALYZE_INSIGHTS},
+        {"role": "user", "content": GENERATE_INSIGHTS_LOCATION.format(location="Valencia, Spain")},
+        {"role": "user", "content": "here are the results of my searches: " + "flood report text " * 800},
+        {"role": "user", "content": ANALYZE_INSIGHTS_REQUEST.format(solution="-", resources=resources)},
+    ]
+    manager = ConversationManager(budget=args.budget)
+    raw, compacted, history = list(scene), list(scene), []
+
+    print(f"{'round':>5} {'raw tokens':>11} {'compacted':>10}")
+    for i in range(1, args.rounds + 1):
+        state = ConversationManager.state_message(resources, history, {"name": f"threat {i}"})
+        compacted = manager.compact(compacted, state=state)
+        sent_raw = conversation_tokens(raw)
+        sent_compacted = conversation_tokens(compacted)
+        if i == 1 or i % 5 == 0:
+            print(f"{i:>5} {sent_raw:>11} {sent_compacted:>10}")
+        raw.append(turn(i))
+        compacted.append(turn(i))
+        history.append(10 - i % 10)
+    print(f"compactions: {manager.compactions}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=40)
+    parser.add_argument("--budget", type=int, default=6000)
+    main(parser.parse_args())
@@ -0,0 +1,186 @@
+"""
+Offline end-to-end latency benchmark for /session/start, /session/solve and /extract/excel.
+
+The server runs against the replay stand-in (bench/replay.py): recorded
+exchanges from --cassettes are served as recorded, everything else gets a
+synthetic schema-valid answer after --latency seconds. Results are compared
+with a stored baseline and the run fails if p95 latency or throughput regress
+by more than --tolerance.
+
+    cd backend && python -m bench.bench_endpoints                     # compare
+    cd backend && python -m bench.bench_endpoints --update-baseline   # re-record baseline
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+from bench.replay import make_replay_app
+from bench.stubs import StubServer
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def workbook_bytes() -> bytes:
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Resource", "Quantity", "Location"])
+    for name, qty in [("Ambulances", 12), ("Doctors", 30), ("Rescue Boats", 8), ("Water Units", 60)]:
+        ws.append([name, qty, "Valencia"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+async def drive(send, concurrency: int, total: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            response = await send(i)
+            if response.status_code >= 400:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    wall = time.perf_counter() - start
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+        "rps": round(total / wall, 2),
+        "errors": errors,
+    }
+
+
+async def run(base_url: str, levels, per_level: int) -> dict:
+    results = {}
+    xlsx = workbook_bytes()
+    limits = httpx.Limits(max_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        # warm-up: first-use imports and connection setup are not part of any level
+        session = (await client.post("/session/start", json={"location": "Warm-up"})).json()["session_id"]
+        await client.post("/session/solve", json={"session_id": session, "solution": "Send boats."})
+        await client.post("/extract/excel", files={"file": ("warm.xlsx", xlsx)})
+
+        for c in levels:
+            total = max(per_level, c)
+
+            async def start(i):
+                return await client.post("/session/start", json={"location": f"Town {c}-{i}, Spain"})
+
+            results[f"start@{c}"] = await drive(start, c, total)
+
+            # one session per solve so the per-session lock does not serialize the level
+            sessions = [r.json()["session_id"] for r in await asyncio.gather(
+                *(client.post("/session/start", json={"location": f"Solve {c}-{i}"}) for i in range(total)))]
+
+            async def solve(i):
+                return await client.post("/session/solve", json={"session_id": sessions[i], "solution": "Send boats."})
+
+            results[f"solve@{c}"] = await drive(solve, c, total)
+
+            async def excel(i):
+                files = {"file": ("inventory.xlsx", xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+                return await client.post("/extract/excel", files=files)
+
+            results[f"excel@{c}"] = await drive(excel, c, total)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    failures = []
+    for name, now in results.items():
+        then = baseline.get(name)
+        if then is None:
+            continue
+        if now["p95_ms"] > then["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {now['p95_ms']} ms vs baseline {then['p95_ms']} ms")
+        if now["rps"] < then["rps"] * (1 - tolerance):
+            failures.append(f"{name}: {now['rps']} req/s vs baseline {then['rps']} req/s")
+        if now["errors"] > then.get("errors", 0):
+            failures.append(f"{name}: {now['errors']} errors")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--levels", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per endpoint and level")
+    parser.add_argument("--latency", type=float, default=0.2, help="replayed model latency in seconds")
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--cassettes", default="", help="directory recorded with AI_RECORD_DIR")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+    levels = [int(x) for x in args.levels.split(",")]
+
+    replay = make_replay_app(args.cassettes, latency=args.latency, search_latency=args.search_latency)
+    with StubServer(replay) as stub:
+        os.environ.update({
+            "OPENAI_BASE_URL": stub.url + "/v1",
+            "OPENAI_API_KEY": "sk-replay",
+            "TAVILY_URL": stub.url + "/search",
+            "SEARCH_CACHE_PATH": "",
+            "SCENARIO_CACHE_BUCKET": "0",
+            "SESSION_STORE": "memory",
+        })
+        import server  # reads the settings above at import time
+        import routing
+
+        # the stub answers every model equally fast, so split routing would only add
+        # the scene's planning call here; model choice is measured by bench_model_routing
+        routing.MODEL_ROUTES.update({stage: routing.OPENAI_MODEL for stage in routing.STAGES})
+
+        with StubServer(server.app, lifespan="on") as api:
+            results = asyncio.run(run(api.url, levels, args.requests))
+
+    print(f"{'endpoint':<12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['rps']:>9}{r['errors']:>8}")
+    print(f"replay: {replay.state.hits} recorded, {replay.state.synthetic} synthetic answers")
+
+    settings = {"latency": args.latency, "search_latency": args.search_latency, "requests": args.requests}
+    if args.update_baseline:
+        with open(args.baseline, "w") as fp:
+            json.dump({"settings": settings, "results": results}, fp, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline yet; run with --update-baseline")
+        return 0
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    if baseline.get("settings") != settings:
+        print(f"warning: baseline was recorded with {baseline.get('settings')}")
+    failures = compare(results, baseline["results"], args.tolerance)
+    for f in failures:
+        print("REGRESSION", f)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Peak memory of parsing one uploaded workbook: whole-file pandas vs the streaming reader.
+
+Writes a synthetic multi-sheet .xlsx, then parses it in a fresh process per reader
+and reports that process's peak RSS above its post-import baseline. "pandas" is the
+old path (bytes in memory, every sheet as a DataFrame at once); "streaming" is
+excelio.read_workbook (openpyxl read-only, rows fed one at a time to the parser and
+to a TSV file). The streaming reader is then run again on a workbook --scale times
+longer, and the run fails if either of its runs adds more than --max-mb: a fixed
+bound, whatever the row count. (What little still grows is openpyxl's read-only
+parser keeping an empty element per row read, ~80 bytes, until the sheet is
+closed; at EXCEL_MAX_ROWS rows that is under 20 MB.)
+
+    cd backend && python -m bench.bench_excel_memory --rows 50000 --sheets 4
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+READERS = ("pandas", "streaming")
+
+
+def peak_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_workbook(path: str, rows: int, sheets: int) -> None:
+    import openpyxl
+
+    book = openpyxl.Workbook(write_only=True)
+    for s in range(sheets):
+        ws = book.create_sheet(f"Depot {s + 1}")
+        ws.append(["Item", "Quantity", "Location", "Notes"])
+        for i in range(rows):
+            ws.append([f"Item {i % 500}", i % 97, f"Warehouse {i % 13}", "checked on arrival, stored dry"])
+    book.save(path)
+
+
+def child(reader: str, path: str) -> None:
+    import pandas as pd
+    import openpyxl  # noqa: F401
+    from excelio import read_workbook, remove_tsv
+    from excelparse import parse_sheet
+
+    baseline = peak_mb()
+    start = time.perf_counter()
+    if reader == "pandas":
+        with open(path, "rb") as f:
+            data = f.read()
+        book = pd.read_excel(io.BytesIO(data), sheet_name=None, header=None, dtype=object, engine="openpyxl")
+        sheets = [(df.to_csv(sep="\t", index=False, header=False, na_rep=""), parse_sheet(df)) for df in book.values()]
+    else:
+        sheets = read_workbook(path, os.path.basename(path))
+        remove_tsv(path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"baseline": baseline, "peak": peak_mb(), "seconds": elapsed, "sheets": len(sheets)}))
+
+
+def run(reader: str, path: str) -> dict:
+    out = subprocess.run([sys.executable, "-m", "bench.bench_excel_memory", "--child", reader, path],
+                         capture_output=True, text=True, check=True)
+    r = json.loads(out.stdout.strip().splitlines()[-1])
+    r["added"] = r["peak"] - r["baseline"]
+    return r
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inventory.xlsx")
+        write_workbook(path, args.rows, args.sheets)
+        size = os.path.getsize(path) / 2 ** 20
+        print(f"workbook: {args.sheets} sheets x {args.rows} rows, {size:.1f} MB on disk")
+        print(f"{'reader':>10} {'baseline MB':>12} {'peak MB':>8} {'added MB':>9} {'seconds':>8}")
+        results = {}
+        for reader in READERS:
+            r = results[reader] = run(reader, path)
+            print(f"{reader:>10} {r['baseline']:>12.1f} {r['peak']:>8.1f} {r['added']:>9.1f} {r['seconds']:>8.2f}")
+
+        long_path = os.path.join(tmp, "inventory-long.xlsx")
+        write_workbook(long_path, args.rows * args.scale, args.sheets)
+        r = run("streaming", long_path)
+        print(f"streaming, {args.scale}x the rows: {r['added']:.1f} MB added, {r['seconds']:.2f} s")
+    added = max(r["added"], results["streaming"]["added"])
+    if added > args.max_mb:
+        raise SystemExit(f"streaming reader added {added:.1f} MB, more than --max-mb {args.max_mb}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--sheets", type=int, default=4)
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--max-mb", type=float, default=32.0)
+    parser.add_argument("--child", nargs=2, metavar=("READER", "PATH"), help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    if parsed.child:
+        child(*parsed.child)
+    else:
+        main(parsed)
@@ -0,0 +1,81 @@
+"""
+Output tokens and decode time of the resource part of a solve answer:
+full updated_resources / resources_needed trees vs signed resource_changes.
+
+The model's decode time grows with its output, so the estimate is output tokens
+times --tpot (seconds per output token). Applying the deltas on the server
+(ResourceLedger.apply + to_resources) is timed as well.
+
+    cd backend && python -m bench.bench_ledger --changes 3 --tpot 0.012
+"""
+import argparse
+import json
+import random
+import time
+
+from bench.replay import synthesize
+from config import ANALYZE_INSIGHTS_JSON_SCHEMA, resources
+from conversation import count_tokens
+from ledger import RESOURCE_NAMES, ResourceLedger
+
+
+def sample_changes(rng: random.Random, k: int) -> dict:
+    return {name: rng.choice([-5, -2, -1, 2, 4, 10]) for name in rng.sample(RESOURCE_NAMES, k)}
+
+
+def answers(rng: random.Random, k: int) -> tuple:
+    """(old answer, new answer) for the same decision, differing only in how resources are written."""
+    new = synthesize(ANALYZE_INSIGHTS_JSON_SCHEMA["json_schema"]["schema"])
+    new["resource_changes"] = sample_changes(rng, k)
+    new["alternative_solutions"]["resource_changes"] = sample_changes(rng, k)
+
+    def tree(changes):
+        ledger = ResourceLedger.from_resources(resources)
+        ledger.apply(changes, record=False)
+        return ledger.to_resources()
+
+    old = {key: value for key, value in new.items() if key != "resource_changes"}
+    old = {**old, "updated_resources": tree(new["resource_changes"])}
+    old["alternative_solutions"] = {key: value for key, value in new["alternative_solutions"].items()
+                                    if key != "resource_changes"}
+    old["alternative_solutions"]["resources_needed"] = tree(new["alternative_solutions"]["resource_changes"])
+    return old, new
+
+
+def resource_part(answer: dict) -> str:
+    alt = answer["alternative_solutions"]
+    picked = {k: answer[k] for k in ("updated_resources", "resource_changes") if k in answer}
+    picked["alt"] = {k: alt[k] for k in ("resources_needed", "resource_changes") if k in alt}
+    return json.dumps(picked, ensure_ascii=False)
+
+
+def main(args):
+    rng = random.Random(7)
+    rows = {"full trees": [0, 0], "deltas": [0, 0]}
+    for _ in range(args.samples):
+        old, new = answers(rng, args.changes)
+        for name, answer in (("full trees", old), ("deltas", new)):
+            rows[name][0] += count_tokens(resource_part(answer))
+            rows[name][1] += count_tokens(json.dumps(answer, ensure_ascii=False))
+
+    print(f"{args.changes} changed resources per answer, {args.tpot * 1000:.0f} ms per output token")
+    print(f"{'format':<11}{'resource tokens':>16}{'answer tokens':>15}{'decode s':>10}")
+    for name, (part, whole) in rows.items():
+        part, whole = part / args.samples, whole / args.samples
+        print(f"{name:<11}{part:>16.0f}{whole:>15.0f}{whole * args.tpot:>10.2f}")
+
+    ledger = ResourceLedger.from_resources(resources)
+    changes = sample_changes(rng, args.changes)
+    start = time.perf_counter()
+    for _ in range(10000):
+        ledger.copy().apply(changes)
+        ledger.to_resources()
+    print(f"server-side apply + rebuild: {(time.perf_counter() - start) / 10000 * 1e6:.1f} µs per solve")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--changes", type=int, default=3, help="resources changed per answer")
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--tpot", type=float, default=0.012, help="seconds per output token")
+    main(parser.parse_args())
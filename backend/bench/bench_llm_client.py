@@ -0,0 +1,68 @@
+"""
+Concurrency benchmark for aihandler.call_openai_api against a local stub server.
+
+Compares the shared pooled AsyncOpenAI client with the previous behaviour
+(a new synchronous client per call, run on the event loop).
+
+    cd backend && python -m bench.bench_llm_client --latency 0.05 --requests 300
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import openai
+
+from bench.stubs import StubServer, make_openai_stub
+
+LEVELS = (1, 10, 100)
+CONVERSATION = [{"role": "system", "content": "benchmark"}]
+
+
+async def legacy_call(conversation: list[dict]):
+    # what call_openai_api used to do: fresh sync client, blocking the loop
+    client = openai.Client(base_url=os.environ["OPENAI_BASE_URL"])
+    response = client.beta.chat.completions.parse(model="o4-mini-2025-04-16", messages=conversation)
+    return response.choices[0]
+
+
+async def run_level(call, concurrency: int, total: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await call(CONVERSATION)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(args):
+    import aihandler
+
+    modes = {"pooled": aihandler.call_openai_api}
+    if not args.skip_legacy:
+        modes["legacy"] = legacy_call
+
+    print(f"stub latency {args.latency * 1000:.0f} ms, {args.requests} requests per level")
+    print(f"{'mode':<8}" + "".join(f"{f'c={c}':>12}" for c in LEVELS))
+    for name, call in modes.items():
+        # warm-up so connection setup is not counted against the first level
+        await call(CONVERSATION)
+        row = [await run_level(call, c, max(args.requests, c)) for c in LEVELS]
+        print(f"{name:<8}" + "".join(f"{rps:>9.1f}/s " for rps in row))
+    await aihandler.close_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response delay in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="requests issued per concurrency level")
+    parser.add_argument("--skip-legacy", action="store_true", help="only benchmark the pooled client")
+    args = parser.parse_args()
+
+    with StubServer(make_openai_stub(args.latency)) as stub:
+        os.environ["OPENAI_BASE_URL"] = stub.url + "/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+        asyncio.run(main(args))
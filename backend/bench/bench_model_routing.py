@@ -0,0 +1,181 @@
+"""
+Latency and cost per pipeline stage: one model for everything vs per-stage routing.
+
+Runs the same offline workload twice against the replay stub: --scenes scene
+loops (planning rounds, searches, 7-day synthesis), --turns solve analyses on
+each, and the extraction of one workbook of --excel-rows rows. "single" sends
+every stage to --strong; "routed" sends scene planning and Excel extraction to
+--fast and keeps synthesis and analysis on --strong (the defaults of
+routing.py). The stub answers each model after its own --*-latency and bills
+--reasoning-tokens hidden tokens on the strong model; cost uses PRICES (USD per
+1M tokens, override with --prices file.json). Scene rounds are attributed to
+planning or synthesis by their reply. Replies are synthetic, so answer quality
+is not compared here.
+
+    cd backend && python -m bench.bench_model_routing --scenes 4 --turns 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from bench.replay import make_replay_app
+from bench.stubs import PrefixCache, StubServer
+
+# USD per 1M tokens: input, cached input, output
+PRICES = {
+    "o4-mini": (1.10, 0.275, 4.40),
+    "o3": (2.00, 0.50, 8.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+STAGES = ("scene_plan", "scene_synthesis", "analysis", "excel")
+SOLUTION = "Send the rescue boats to the flooded districts and set up shelter tents near the hospital, turn {}."
+
+
+def price(model: str, prices: dict) -> tuple:
+    # longest matching prefix, so gpt-4.1-mini does not match gpt-4.1
+    for prefix in sorted(prices, key=len, reverse=True):
+        if model.startswith(prefix):
+            return prices[prefix]
+    raise SystemExit(f"no price for {model}; pass --prices")
+
+
+def cost(calls: list, prices: dict) -> float:
+    total = 0.0
+    for c in calls:
+        inp, cached, out = price(c["model"], prices)
+        total += ((c["prompt_tokens"] - c["cached_tokens"]) * inp + c["cached_tokens"] * cached
+                  + c["completion_tokens"] * out) / 1e6
+    return total
+
+
+def workbook(rows: int) -> str:
+    lines = ["category\tresource\tquantity\tlocation"]
+    lines += [f"vehicles\trescue boat {i}\t{i % 7 + 1}\tdepot {i % 13}, Valencia" for i in range(rows)]
+    return "\n".join(lines)
+
+
+async def play(args, routes: dict) -> dict:
+    import aihandler
+    import multiagent
+    import routing
+    from config import resources
+
+    routing.MODEL_ROUTES.update(routes)
+    aihandler._search_cache = None              # same search cache misses for both arms
+    calls = []
+    original = aihandler.call_openai_api
+
+    async def recorded(conversation, **kw):
+        start = time.perf_counter()
+        with aihandler.track_usage() as usage:
+            msg = await original(conversation, **kw)
+        stage = kw.get("stage", "other")
+        if stage == "scene_synthesis" and json.loads(msg.message.content).get("use_internet"):
+            stage = "scene_plan"
+        calls.append({"stage": stage, "model": kw.get("model") or routing.model_for(kw.get("stage", "other")),
+                      "seconds": time.perf_counter() - start, **usage})
+        return msg
+
+    aihandler.call_openai_api = multiagent.call_openai_api = recorded
+    scene_seconds = []
+    try:
+        for n in range(args.scenes):
+            start = time.perf_counter()
+            _, conversation = await multiagent.multiagent_scene(f"Valencia, Spain (run {n})")
+            scene_seconds.append(time.perf_counter() - start)
+            for turn in range(args.turns):
+                final = await multiagent.multiagent_analysis(SOLUTION.format(turn), resources, conversation,
+                                                             initial=turn == 0)
+                conversation = conversation + final["new_messages"]
+        await aihandler.excel_str_to_resources(workbook(args.excel_rows))
+    finally:
+        aihandler.call_openai_api = multiagent.call_openai_api = original
+        await aihandler.close_clients()         # bound to this event loop
+    return {"calls": calls, "scene_seconds": scene_seconds}
+
+
+def report(name: str, result: dict, prices: dict) -> dict:
+    print(f"\n{name}")
+    print(f"{'stage':<17}{'model':<26}{'calls':>6}{'mean s':>8}{'p95 s':>8}{'prompt tok':>11}{'out tok':>9}{'USD':>10}")
+    totals = {}
+    for stage in STAGES:
+        calls = [c for c in result["calls"] if c["stage"] == stage]
+        if not calls:
+            continue
+        seconds = sorted(c["seconds"] for c in calls)
+        models = sorted({c["model"] for c in calls})
+        usd = cost(calls, prices)
+        totals[stage] = {"seconds": sum(seconds), "usd": usd}
+        print(f"{stage:<17}{','.join(models):<26}{len(calls):>6}{statistics.mean(seconds):>8.3f}"
+              f"{seconds[int(0.95 * (len(seconds) - 1))]:>8.3f}{sum(c['prompt_tokens'] for c in calls):>11}"
+              f"{sum(c['completion_tokens'] for c in calls):>9}{usd:>10.4f}")
+    print(f"scene wall time: {statistics.mean(result['scene_seconds']):.3f} s mean")
+    return totals
+
+
+def main(args):
+    prices = dict(PRICES)
+    if args.prices:
+        with open(args.prices, encoding="utf-8") as fp:
+            prices.update({k: tuple(v) for k, v in json.load(fp).items()})
+    for model in (args.strong, args.fast):
+        price(model, prices)                    # fail before running on an unknown model
+
+    replay = make_replay_app(latency=args.fast_latency, search_latency=args.search_latency,
+                             search_rounds=args.search_rounds, models={
+                                 args.strong: {"latency": args.strong_latency,
+                                               "reasoning_tokens": args.reasoning_tokens},
+                                 args.fast: {"latency": args.fast_latency},
+                             })
+    with StubServer(replay) as stub:
+        os.environ.update({
+            "OPENAI_BASE_URL": stub.url + "/v1",
+            "OPENAI_API_KEY": "sk-replay",
+            "TAVILY_URL": stub.url + "/search",
+            "SEARCH_CACHE_PATH": "",
+        })
+        arms = {
+            "single": {stage: args.strong for stage in STAGES},
+            "routed": {"scene_plan": args.fast, "scene_synthesis": args.strong,
+                       "analysis": args.strong, "excel": args.fast},
+        }
+        results = {}
+        for name, routes in arms.items():
+            replay.state.prefixes = PrefixCache()   # both arms start with a cold prompt cache
+            results[name] = asyncio.run(play(args, routes))
+
+    print(f"stub: {args.strong} {args.strong_latency}s + {args.reasoning_tokens} reasoning tokens, "
+          f"{args.fast} {args.fast_latency}s")
+    totals = {name: report(name, result, prices) for name, result in results.items()}
+
+    print(f"\n{'routed vs single':<17}{'time':>8}{'cost':>8}")
+    for stage in STAGES:
+        a, b = totals["single"].get(stage), totals["routed"].get(stage)
+        if a and b:
+            print(f"{stage:<17}{b['seconds'] / a['seconds']:>8.2f}{b['usd'] / a['usd']:>8.2f}")
+    a = {k: sum(t[k] for t in totals["single"].values()) for k in ("seconds", "usd")}
+    b = {k: sum(t[k] for t in totals["routed"].values()) for k in ("seconds", "usd")}
+    print(f"{'all stages':<17}{b['seconds'] / a['seconds']:>8.2f}{b['usd'] / a['usd']:>8.2f}")
+
+
+if __name__ == "__main__":
+    import routing
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenes", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--excel-rows", type=int, default=1600)
+    parser.add_argument("--search-rounds", type=int, default=2)
+    parser.add_argument("--strong", default=routing.OPENAI_MODEL)
+    parser.add_argument("--fast", default=routing.OPENAI_FAST_MODEL)
+    parser.add_argument("--strong-latency", type=float, default=0.8)
+    parser.add_argument("--fast-latency", type=float, default=0.2)
+    parser.add_argument("--reasoning-tokens", type=int, default=800)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--prices", default="", help="JSON file {model prefix: [input, cached, output]}")
+    main(parser.parse_args())
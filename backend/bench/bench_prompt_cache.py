@@ -0,0 +1,110 @@
+"""
+Share of prompt tokens a provider prefix cache could serve, per pipeline stage.
+
+Runs a few sessions (scene, first solve, two follow-up solves) for different
+locations against the replay stub, whose PrefixCache mimics OpenAI prompt
+caching, and prints prompt and cached tokens per stage. "legacy" rewrites each
+request into the old layout, with the location and the analysis inputs
+interpolated into the system prompts, for comparison.
+
+    cd backend && python -m bench.bench_prompt_cache --sessions 5
+"""
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+
+from bench.replay import make_replay_app
+from bench.stubs import StubServer
+
+LOCATIONS = ["Valencia, Spain", "Dresden, Germany", "Porto Alegre, Brazil", "Derna, Libya",
+             "Sylhet, Bangladesh", "Emilia-Romagna, Italy", "Jakarta, Indonesia", "Lismore, Australia"]
+SOLUTION = "Send the rescue boats to the flooded districts and set up shelter tents near the hospital."
+
+
+def legacy_layout(conversation):
+    """The old message layout: variable text inside the system prompts."""
+    from config import ANALYZE_INSIGHTS
+
+    out = [dict(m) for m in conversation]
+    if len(out) > 1 and out[1]["role"] == "user":
+        # location interpolated near the top of the scene prompt
+        out[0] = {"role": "system", "content": out[1]["content"] + "\n" + out[0]["content"]}
+        del out[1]
+    for i, m in enumerate(out):
+        if m["content"] is ANALYZE_INSIGHTS:
+            # solution and resources interpolated into the analysis prompt, which sat
+            # where the request message is now
+            j = next(j for j in range(i + 1, len(out)) if out[j]["content"].startswith("The initial resources"))
+            out[j] = {"role": "system", "content": out[j]["content"] + "\n" + ANALYZE_INSIGHTS}
+            del out[i]
+            break
+    return out
+
+
+async def run_mode(legacy: bool, sessions: int):
+    import aihandler
+    import multiagent
+    from config import resources
+    from conversation import ConversationManager
+    from convlog import ConversationLog
+
+    if legacy:
+        call, stream = aihandler.call_openai_api, aihandler.stream_openai_api
+        multiagent.call_openai_api = lambda conversation, **kw: call(legacy_layout(conversation), **kw)
+        multiagent.stream_openai_api = lambda conversation, **kw: stream(legacy_layout(conversation), **kw)
+
+    totals = defaultdict(lambda: [0, 0])
+    manager = ConversationManager()
+
+    def add(stage, usage):
+        totals[stage][0] += usage["prompt_tokens"]
+        totals[stage][1] += usage["cached_tokens"]
+
+    try:
+        for i in range(sessions):
+            location = LOCATIONS[i % len(LOCATIONS)]
+            with aihandler.track_usage() as usage:
+                _, conversation = await multiagent.multiagent_scene(location)
+            add("scene", usage)
+            with aihandler.track_usage() as usage:
+                result = await multiagent.multiagent_analysis(SOLUTION, resources, conversation, initial=True)
+            add("first solve", usage)
+            # like the server: the turn goes into the log, the prompt is its compacted view
+            log = ConversationLog.of(conversation).append(*result["new_messages"])
+            for _ in range(2):
+                with aihandler.track_usage() as usage:
+                    result = await multiagent.multiagent_analysis(SOLUTION, resources, manager.compact(log.messages()),
+                                                                  initial=False)
+                add("follow-up solve", usage)
+                log = log.append(*result["new_messages"])
+    finally:
+        if legacy:
+            multiagent.call_openai_api, multiagent.stream_openai_api = call, stream
+        await aihandler.close_clients()
+    return totals
+
+
+def main(args):
+    replay = make_replay_app(latency=0.0, search_latency=0.0, search_rounds=args.search_rounds)
+    with StubServer(replay) as stub:
+        os.environ.update({
+            "OPENAI_BASE_URL": stub.url + "/v1",
+            "OPENAI_API_KEY": "sk-replay",
+            "TAVILY_URL": stub.url + "/search",
+            "SEARCH_CACHE_PATH": "",
+        })
+        print(f"{'layout':<8}{'stage':<17}{'prompt':>9}{'cached':>9}{'ratio':>7}")
+        for legacy in (True, False):
+            replay.state.prefixes.seen.clear()
+            totals = asyncio.run(run_mode(legacy, args.sessions))
+            for stage, (prompt, cached) in totals.items():
+                print(f"{'legacy' if legacy else 'current':<8}{stage:<17}{prompt:>9}{cached:>9}"
+                      f"{cached / max(prompt, 1):>7.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--search-rounds", type=int, default=1)
+    main(parser.parse_args())
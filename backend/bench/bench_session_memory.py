@@ -0,0 +1,101 @@
+"""
+RAM and per-turn cost of session conversations: copied lists vs the shared ConversationLog.
+
+Creates --sessions sessions from one cached scenario and plays --turns solves on
+each through a MemorySessionStore, doing the session bookkeeping of a solve
+(compacted prompt, stored conversation, store.put) without calling a model.
+"lists" is the old way: a deep copy of the scenario per session and the
+compacted prompt plus the new turn stored each turn. "log" appends the turn to
+the session's ConversationLog. Reports traced RAM, the store's projection per
+1,000 sessions and the bookkeeping time per turn.
+
+    cd backend && python -m bench.bench_session_memory --sessions 200 --turns 10
+"""
+import argparse
+import asyncio
+import copy
+import gc
+import time
+import tracemalloc
+
+from config import ANALYZE_INSIGHTS, GENERATE_INSIGHTS, GENERATE_INSIGHTS_LOCATION, resources
+from conversation import ConversationManager
+from convlog import ConversationLog
+from sessionstore import MemorySessionStore
+from tools import dict_to_str
+
+
+def scene() -> list:
+    return [
+        {"role": "system", "content": GENERATE_INSIGHTS},
+        {"role": "user", "content": GENERATE_INSIGHTS_LOCATION.format(location="Valencia, Spain")},
+        {"role": "user", "content": "here are the results of my searches: " + "flood report text " * 600},
+        {"role": "user", "content": "here are the results of my searches: " + "river gauge reading " * 500},
+        {"role": "user", "content": "here is the most potential threats: " + "levee breach downstream " * 40},
+    ]
+
+
+def turn(session: int, i: int) -> list:
+    feedback = f"Round {i}: the proposal moves boats and ambulances to the flooded districts. " * 10
+    return [
+        {"role": "user", "content": f"here is the how I proposed to solve the problem: session {session} plan {i}"},
+        {"role": "user", "content": f"here is the how I proposed to solve the problem: session {session} plan {i}"
+                                    + " and here is the feedback: " + feedback
+                                    + " so new severity score is: " + dict_to_str({"severity_score": 10 - i % 10})},
+    ]
+
+
+async def play(mode: str, sessions: int, turns: int) -> dict:
+    store = MemorySessionStore(max_sessions=sessions + 1)
+    manager = ConversationManager()
+    cached = ConversationLog.of(scene()) if mode == "log" else scene()
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    spent = 0.0
+    for n in range(sessions):
+        conversation = copy.deepcopy(cached)
+        s = {"conversation": conversation, "resources": resources, "severity_history": []}
+        await store.put(str(n), s)
+        for i in range(turns):
+            start = time.perf_counter()
+            s = await store.get(str(n))
+            state = ConversationManager.state_message(s["resources"], s["severity_history"], None)
+            new = turn(n, i)
+            if mode == "log":
+                log = s["conversation"]
+                prompt, s["folded"] = manager.compact_log(log, state=state, folded=s.get("folded"))
+                if i == 0:
+                    prompt.insert(1, {"role": "system", "content": ANALYZE_INSIGHTS})
+                s["conversation"] = log.append(*([prompt[1]] if i == 0 else []), *new)
+            else:
+                prompt = manager.compact(s["conversation"], state=state)
+                if i == 0:
+                    prompt.insert(1, {"role": "system", "content": ANALYZE_INSIGHTS})
+                prompt.append(new[0])
+                s["conversation"] = prompt + [new[1]]
+            s["severity_history"].append(10 - i % 10)
+            await store.put(str(n), s)
+            spent += time.perf_counter() - start
+    gc.collect()
+    ram = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    memory = await store.memory()
+    return {"ram": ram, "per_1000": memory.get("ram_per_1000"), "turn_ms": spent / (sessions * turns) * 1000}
+
+
+def main(args):
+    print(f"{args.sessions} sessions x {args.turns} turns from one cached scenario")
+    print(f"{'mode':<6}{'traced RAM MB':>14}{'MB / 1000 sessions':>20}{'store estimate MB':>19}{'ms / turn':>11}")
+    for mode in ("lists", "log"):
+        r = asyncio.run(play(mode, args.sessions, args.turns))
+        estimate = f"{r['per_1000'] / 2 ** 20:.1f}" if mode == "log" else "-"
+        print(f"{mode:<6}{r['ram'] / 2 ** 20:>14.1f}{r['ram'] / args.sessions * 1000 / 2 ** 20:>20.1f}"
+              f"{estimate:>19}{r['turn_ms']:>11.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,90 @@
+"""
+Bytes on the wire per solve: full responses vs compact responses plus conversation sync.
+
+Plays --turns solves of one session against the API (replay stub behind it) in
+three ways and prints the downloaded bytes per turn and for the whole session:
+"full" is the old response with updated_conversation, uncompressed; "full+br"
+the same with brotli (gzip when brotli is not installed); "compact+br" asks for
+?compact=true and fetches only the missing messages from
+/session/{id}/conversation, as the frontend does. The JSON encode time of one
+full and one compact payload at the last turn is shown as well.
+
+    cd backend && python -m bench.bench_solve_payload --turns 12
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench.replay import make_replay_app
+from bench.stubs import StubServer
+
+SOLUTION = "Send the rescue boats to the flooded districts and set up shelter tents near the hospital, turn {}."
+MODES = ("full", "full+br", "compact+br")
+
+
+async def play(url: str, mode: str, turns: int) -> dict:
+    import httpx
+
+    accept = "identity" if mode == "full" else "br, gzip"
+    per_turn = []
+    async with httpx.AsyncClient(base_url=url, timeout=60, headers={"Accept-Encoding": accept}) as c:
+        start = (await c.post("/session/start", json={"location": "Valencia, Spain"})).json()
+        session_id, history, rev = start["session_id"], start["conversation"], 0
+        for turn in range(turns):
+            body = {"session_id": session_id, "solution": SOLUTION.format(turn)}
+            r = await c.post("/session/solve", params={"compact": mode == "compact+br"}, json=body)
+            r.raise_for_status()
+            wire = r.num_bytes_downloaded
+            result = r.json()
+            if mode == "compact+br":
+                info = result["conversation"]
+                offset = info["stable"] if info["rev"] == rev + 1 else 0
+                history, rev = history[:offset], info["rev"]
+                while offset is not None:
+                    page = await c.get(f"/session/{session_id}/conversation", params={"offset": offset})
+                    wire += page.num_bytes_downloaded
+                    history += page.json()["messages"]
+                    offset = page.json()["next"]
+                result["analysis"]["updated_conversation"] = history
+            per_turn.append(wire)
+    return {"per_turn": per_turn, "last": result}
+
+
+def encode_ms(payload: dict) -> float:
+    start = time.perf_counter()
+    for _ in range(200):
+        json.dumps(payload)
+    return (time.perf_counter() - start) / 200 * 1000
+
+
+def main(args):
+    replay = make_replay_app(latency=0.0, search_latency=0.0)
+    with StubServer(replay) as stub:
+        os.environ.update({
+            "OPENAI_BASE_URL": stub.url + "/v1",
+            "OPENAI_API_KEY": "sk-replay",
+            "TAVILY_URL": stub.url + "/search",
+            "SEARCH_CACHE_PATH": "",
+            "SPECULATION_CONCURRENCY": "0",
+        })
+        import server
+
+        with StubServer(server.app, lifespan="on") as api:
+            results = {mode: asyncio.run(play(api.url, mode, args.turns)) for mode in MODES}
+
+    print(f"{'mode':<12}{'turn 1 B':>10}{'last turn B':>13}{'session kB':>12}")
+    for mode in MODES:
+        per_turn = results[mode]["per_turn"]
+        print(f"{mode:<12}{per_turn[0]:>10}{per_turn[-1]:>13}{sum(per_turn) / 1024:>12.1f}")
+
+    last = results["full"]["last"]
+    compact = {**last, "analysis": {k: v for k, v in last["analysis"].items() if k != "updated_conversation"}}
+    print(f"JSON encode at turn {args.turns}: full {encode_ms(last):.3f} ms, compact {encode_ms(compact):.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=12)
+    main(parser.parse_args())
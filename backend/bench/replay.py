@@ -0,0 +1,147 @@
+"""
+Replay stand-in for OpenAI and Tavily.
+
+Serves exchanges recorded with AI_RECORD_DIR (see recorder.py) by request key.
+Requests that were never recorded get a synthetic answer built from the
+requested JSON schema, so the benchmarks also run with no recordings at all.
+"""
+import asyncio
+import json
+import os
+import random
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from bench.stubs import PrefixCache, approx_tokens, chat_completion, chat_completion_chunks, streamed, tavily_result
+from recorder import request_key
+
+
+def load_cassettes(directory: str) -> Dict[str, Dict[str, Any]]:
+    """
+    {request key: recorded entry} from every *.jsonl file in `directory`.
+    """
+    entries = {}
+    if not directory or not os.path.isdir(directory):
+        return entries
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".jsonl"):
+            with open(os.path.join(directory, name), encoding="utf-8") as fp:
+                for line in fp:
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+    return entries
+
+
+def synthesize(schema: Dict[str, Any], root: Dict[str, Any] = None) -> Any:
+    """
+    A small valid instance of a JSON schema, honouring minItems, minimum and enum.
+    """
+    root = root or schema
+    if "$ref" in schema:
+        node = root
+        for part in schema["$ref"].lstrip("#/").split("/"):
+            node = node[part]
+        return synthesize(node, root)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {k: synthesize(v, root) for k, v in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = schema.get("minItems", 2)
+        items = schema.get("items", {})
+        if items.get("type") == "integer" and items.get("maximum") == count:
+            return list(range(1, count + 1))
+        return [_numbered(synthesize(items, root), i + 1) for i in range(count)]
+    if kind == "integer":
+        return schema.get("minimum", 3)
+    if kind == "number":
+        return schema.get("minimum", 5)
+    if kind == "boolean":
+        return False
+    if kind == "string":
+        return "Synthetic text. " * 8
+    return {}
+
+
+def _numbered(value: Any, n: int) -> Any:
+    # give array items such as daily_threats distinct "day" numbers
+    if isinstance(value, dict) and "day" in value:
+        return {**value, "day": n}
+    return value
+
+
+def synthetic_reply(body: Dict[str, Any], search_rounds: int) -> str:
+    fmt = (body.get("response_format") or {}).get("json_schema") or {}
+    schema = fmt.get("schema") or {}
+    reply = synthesize(schema) if schema else {}
+    # scene planning: ask for searches on the first turns, like the real model
+    if fmt.get("name") in ("generate_insights", "scene_plan"):
+        searched = sum(1 for m in body.get("messages", []) if "results of my searches" in str(m.get("content")))
+        if searched < search_rounds:
+            plan = {"use_internet": True, "search_queries": [f"flood impact query {searched}-{i}" for i in range(3)]}
+            return json.dumps(plan if fmt["name"] == "scene_plan" else {**plan, "final_answer": {}})
+        reply["search_queries"] = []
+    return json.dumps(reply)
+
+
+def make_replay_app(cassette_dir: str = "", latency: float = 0.2, jitter: float = 0.0,
+                    search_latency: float = 0.1, search_rounds: int = 1,
+                    models: Dict[str, Dict[str, float]] = None) -> FastAPI:
+    """
+    OpenAI (/v1/chat/completions) and Tavily (/search) replay stub.
+    Every answer is delayed by latency ± jitter seconds (search_latency for Tavily).
+    `models` maps model name prefixes to {"latency": seconds, "reasoning_tokens": n}
+    to make some models slower or bill hidden reasoning tokens.
+    """
+    cassettes = load_cassettes(cassette_dir)
+    app = FastAPI()
+    app.state.hits = 0
+    app.state.synthetic = 0
+    app.state.prefixes = PrefixCache()
+
+    def delay(base: float) -> float:
+        return max(0.0, base + random.uniform(-jitter, jitter))
+
+    def profile(model: str) -> Dict[str, float]:
+        for prefix, values in (models or {}).items():
+            if model.startswith(prefix):
+                return values
+        return {}
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "replay")
+        entry = cassettes.get(request_key("openai", body))
+        if entry is not None:
+            app.state.hits += 1
+            content = json.loads(entry["response"])["choices"][0]["message"]["content"]
+        else:
+            app.state.synthetic += 1
+            content = synthetic_reply(body, search_rounds)
+        prompt_tokens = approx_tokens(json.dumps(body.get("messages", [])))
+        cached = app.state.prefixes.lookup(body)
+        p = profile(model)
+        wait = delay(p.get("latency", latency))
+        reasoning = int(p.get("reasoning_tokens", 0))
+        if body.get("stream"):
+            return streamed(chat_completion_chunks(content, model, prompt_tokens=prompt_tokens, cached_tokens=cached,
+                                                   reasoning_tokens=reasoning), wait)
+        await asyncio.sleep(wait)
+        return chat_completion(content, model, prompt_tokens, approx_tokens(content), cached, reasoning)
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        await asyncio.sleep(delay(search_latency))
+        entry = cassettes.get(request_key("tavily", body))
+        if entry is not None:
+            app.state.hits += 1
+            return JSONResponse(json.loads(entry["response"]), status_code=entry["status"])
+        app.state.synthetic += 1
+        return tavily_result(body["query"])
+
+    return app
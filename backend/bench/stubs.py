@@ -0,0 +1,306 @@
+"""
+Local stand-ins for the external services, used by the benchmarks in this folder.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from sessionstore import RELEASE_SCRIPT
+
+
+def chat_completion(content: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+                    cached_tokens: int = 0, reasoning_tokens: int = 0) -> dict:
+    """
+    Build an OpenAI chat.completion response body around the given message content.
+    Reasoning tokens are billed as completion tokens, as by the real API.
+    """
+    completion_tokens += reasoning_tokens
+    return {
+        "id": "chatcmpl-" + uuid.uuid4().hex,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content, "refusal": None},
+            "finish_reason": "stop",
+            "logprobs": None,
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+        },
+    }
+
+
+def approx_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def chat_completion_chunks(content: str, model: str, pieces: int = 20, prompt_tokens: int = 0,
+                           cached_tokens: int = 0, reasoning_tokens: int = 0):
+    """
+    Split `content` into chat.completion.chunk bodies, as sent when stream=True,
+    ending with the usage chunk sent for stream_options.include_usage.
+    """
+    base = {"id": "chatcmpl-" + uuid.uuid4().hex, "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model}
+    step = max(1, -(-len(content) // pieces))
+    for i in range(0, len(content), step):
+        yield {**base, "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    completion_tokens = approx_tokens(content) + reasoning_tokens
+    yield {**base, "choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                             "total_tokens": prompt_tokens + completion_tokens,
+                                             "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                                             "completion_tokens_details": {"reasoning_tokens": reasoning_tokens}}}
+
+
+class PrefixCache:
+    """
+    Rough model of the provider's prompt caching: the longest message prefix
+    (with the same model and response_format) seen in an earlier request counts
+    as cached, if it is at least 1024 tokens, in steps of 128 tokens.
+    """
+
+    def __init__(self):
+        self.seen = set()
+
+    def lookup(self, body: dict) -> int:
+        head = json.dumps([body.get("model"), body.get("response_format")], sort_keys=True)
+        digest = hashlib.sha256(head.encode())
+        tokens = cached = 0
+        for message in body.get("messages", []):
+            text = json.dumps(message, sort_keys=True)
+            digest.update(text.encode())
+            tokens += approx_tokens(text)
+            key = digest.hexdigest()
+            if key in self.seen:
+                cached = tokens
+            self.seen.add(key)
+        return cached // 128 * 128 if cached >= 1024 else 0
+
+
+def streamed(chunks, latency: float) -> StreamingResponse:
+    """
+    Serve chunk bodies as an OpenAI-style SSE stream, spreading `latency` across them.
+    """
+    chunks = list(chunks)
+
+    async def body():
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream")
+
+
+def make_openai_stub(latency: float = 0.05, content='{"resources": []}') -> FastAPI:
+    """
+    A fake OpenAI API that answers every chat completion with `content` after `latency` seconds.
+    `content` may also be a function of the request body returning the reply text.
+    """
+    app = FastAPI()
+    cache = PrefixCache()
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        reply = content(body) if callable(content) else content
+        prompt_tokens = approx_tokens(json.dumps(body.get("messages", [])))
+        cached = cache.lookup(body)
+        if body.get("stream"):
+            return streamed(chat_completion_chunks(reply, model, prompt_tokens=prompt_tokens, cached_tokens=cached), latency)
+        await asyncio.sleep(latency)
+        return chat_completion(reply, model, prompt_tokens, approx_tokens(reply), cached)
+
+    return app
+
+
+def tavily_result(query: str) -> dict:
+    """
+    Build a Tavily /search response body with a few deterministic results for `query`.
+    """
+    slug = "-".join(query.lower().split())[:60]
+    return {
+        "query": query,
+        "answer": f"Summary answer for {query}.",
+        "images": [],
+        "results": [
+            {
+                "title": f"{query} – source {i}",
+                "url": f"https://example.org/{slug}/{i}",
+                "content": f"Report {i} about {query}. Water levels, road closures and shelters are described here.",
+                "score": round(0.9 - i * 0.1, 2),
+                "raw_content": None,
+            }
+            for i in range(5)
+        ],
+        "response_time": 0.0,
+    }
+
+
+def make_tavily_stub(latency: float = 0.3) -> FastAPI:
+    """
+    A fake Tavily search API answering after `latency` seconds; queries containing "fail" get a 500.
+    """
+    app = FastAPI()
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        if "fail" in body["query"]:
+            return JSONResponse({"detail": "stub failure"}, status_code=500)
+        return tavily_result(body["query"])
+
+    return app
+
+
+class RespStandIn:
+    """
+    In-process stand-in for a Redis server, covering the commands RedisSessionStore uses
+    (PING, GET, SET with NX/PX/EX, DEL, ZADD, ZREM, ZCOUNT, ZREMRANGEBYSCORE, and EVAL
+    of the lock release script).
+
+        async with RespStandIn() as redis:
+            store = RedisSessionStore(redis.url)
+    """
+
+    def __init__(self):
+        self.strings = {}   # key -> (value, expires_at | None)
+        self.zsets = {}     # key -> {member: score}
+        self.server = None
+        self.url = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._client, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        self.url = f"redis://{host}:{port}/0"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _get(self, key):
+        value, expires_at = self.strings.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            del self.strings[key]
+            return None
+        return value
+
+    @staticmethod
+    def _score(raw: str) -> float:
+        return {"-inf": float("-inf"), "+inf": float("inf")}.get(raw, None) or float(raw)
+
+    def _command(self, name: str, args: list):
+        if name == "PING":
+            return "+PONG"
+        if name == "GET":
+            return self._get(args[0])
+        if name == "SET":
+            key, value, opts = args[0], args[1], [a.upper() for a in args[2:]]
+            if "NX" in opts and self._get(key) is not None:
+                return None
+            expires_at = None
+            if "PX" in opts:
+                expires_at = time.time() + int(args[2 + opts.index("PX") + 1]) / 1000
+            if "EX" in opts:
+                expires_at = time.time() + int(args[2 + opts.index("EX") + 1])
+            self.strings[key] = (value, expires_at)
+            return "+OK"
+        if name == "EVAL" and args[0] == RELEASE_SCRIPT:
+            # compare-and-delete: KEYS[1] goes only while it still holds ARGV[1]
+            key, token = args[2], args[3]
+            return self._command("DEL", [key]) if self._get(key) == token else 0
+        if name == "DEL":
+            return sum(self.strings.pop(k, None) is not None for k in args)
+        if name == "ZADD":
+            zset = self.zsets.setdefault(args[0], {})
+            added = 0
+            for score, member in zip(args[1::2], args[2::2]):
+                added += member not in zset
+                zset[member] = float(score)
+            return added
+        if name == "ZREM":
+            zset = self.zsets.get(args[0], {})
+            return sum(zset.pop(m, None) is not None for m in args[1:])
+        if name in ("ZCOUNT", "ZREMRANGEBYSCORE"):
+            zset = self.zsets.get(args[0], {})
+            lo, hi = self._score(args[1]), self._score(args[2])
+            members = [m for m, s in zset.items() if lo <= s <= hi]
+            if name == "ZREMRANGEBYSCORE":
+                for m in members:
+                    del zset[m]
+            return len(members)
+        return RuntimeError(f"ERR unknown command '{name}'")
+
+    @staticmethod
+    def _encode(reply) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, RuntimeError):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if reply.startswith("+"):
+            return reply.encode() + b"\r\n"
+        data = reply.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:])):
+                    size = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(size + 2))[:-2].decode())
+                writer.write(self._encode(self._command(args[0].upper(), args[1:])))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+class StubServer:
+    """
+    Run an ASGI app with uvicorn on a background thread bound to a free local port.
+
+        with StubServer(make_openai_stub()) as stub:
+            os.environ["OPENAI_BASE_URL"] = stub.url + "/v1"
+    """
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0, lifespan: str = "off"):
+        self.config = uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan=lifespan)
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = None
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
@@ -0,0 +1,84 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+SCENE_MAX_ROUNDS = int(os.getenv("SCENE_MAX_ROUNDS", "6"))
+SCENE_MAX_SEARCHES = int(os.getenv("SCENE_MAX_SEARCHES", "24"))
+SCENE_DEADLINE = float(os.getenv("SCENE_DEADLINE", "240"))
+SCENE_MAX_TOKENS = int(os.getenv("SCENE_MAX_TOKENS", "250000"))
+# seconds at the end of the deadline kept for the forced final synthesis (at most a quarter of it)
+SCENE_FINAL_RESERVE = float(os.getenv("SCENE_FINAL_RESERVE", "60"))
+
+FINAL_ROUND_MESSAGE = (
+    "The research budget is used up. Do not request any more searches: "
+    "set use_internet to false and return the complete final_answer now, "
+    "with exactly 7 daily_threats, based on what you already know."
+)
+
+
+@dataclass
+class ScenarioBudget:
+    """
+    Limits for one multiagent_scene run and what has been used of them so far.
+
+    Once any limit is reached the loop asks for one final synthesis turn with
+    no further searches and returns the best answer it has. The deadline bounds
+    every call as well: research rounds must end `final_reserve` seconds before
+    it, so the final synthesis still fits.
+    """
+    max_rounds: int = SCENE_MAX_ROUNDS
+    max_searches: int = SCENE_MAX_SEARCHES
+    deadline: float = SCENE_DEADLINE            # seconds of wall-clock time
+    max_tokens: int = SCENE_MAX_TOKENS
+    final_reserve: float = SCENE_FINAL_RESERVE
+
+    rounds: int = 0
+    searches: int = 0
+    tokens: int = 0
+    cached_tokens: int = 0
+    forced_final: bool = False
+    exhausted_by: Optional[str] = None
+    started: float = field(default_factory=time.monotonic)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_time(self) -> float:
+        return max(0.0, self.deadline - self.elapsed())
+
+    def research_time(self) -> float:
+        """Seconds left for research rounds, keeping the reserve for the final synthesis."""
+        return max(0.0, self.remaining_time() - min(self.final_reserve, self.deadline / 4))
+
+    def searches_left(self) -> int:
+        return max(0, self.max_searches - self.searches)
+
+    def exhausted(self) -> Optional[str]:
+        """
+        Name of the first limit that has been reached, or None.
+        """
+        if self.rounds >= self.max_rounds:
+            return "rounds"
+        if self.searches >= self.max_searches:
+            return "searches"
+        if self.research_time() <= 0:
+            return "deadline"
+        if self.tokens >= self.max_tokens:
+            return "tokens"
+        return None
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "rounds": self.rounds,
+            "max_rounds": self.max_rounds,
+            "searches": self.searches,
+            "max_searches": self.max_searches,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "deadline_seconds": self.deadline,
+            "tokens": self.tokens,
+            "max_tokens": self.max_tokens,
+            "cached_tokens": self.cached_tokens,
+            "forced_final": self.forced_final,
+            "exhausted_by": self.exhausted_by,
+        }
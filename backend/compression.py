@@ -0,0 +1,112 @@
+import asyncio
+import gzip
+import os
+from typing import Optional
+
+from mylogger import logger
+
+# bodies smaller than this are sent as they are
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+# bodies at least this large are compressed in a thread instead of on the event loop
+COMPRESS_THREAD_BYTES = 256 * 1024
+
+try:
+    import brotli                   # optional; without it only gzip is offered
+except ImportError:
+    brotli = None
+    logger.info("brotli not installed, responses are compressed with gzip only")
+
+# media types that are already compressed or must reach the client unbuffered
+SKIP_TYPES = ("text/event-stream", "application/zip", "application/gzip", "image/", "audio/", "video/")
+
+
+def pick_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    "br" or "gzip" from an Accept-Encoding header (brotli preferred when both are
+    acceptable and installed), or None when neither may be used.
+    """
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses complete response bodies with brotli or gzip,
+    whichever the client accepts. Streaming responses (SSE) and bodies below
+    `minimum_size` pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+        encoding = pick_encoding(accept)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                media_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = b"content-encoding" in headers or media_type.startswith(SKIP_TYPES)
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # streamed or small: send everything from here on unchanged
+                passthrough = True
+                await send(start)
+                return await send(message)
+
+            if len(body) >= COMPRESS_THREAD_BYTES:
+                packed = await asyncio.to_thread(compress, body, encoding)
+            else:
+                packed = compress(body, encoding)
+            headers = [(k, v) for k, v in start.get("headers", []) if k.lower() not in (b"content-length", b"vary")]
+            vary = [v for k, v in start.get("headers", []) if k.lower() == b"vary"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(packed)).encode()),
+                (b"vary", b", ".join(vary + [b"Accept-Encoding"])),
+            ]
+            await send({**start, "headers": headers})
+            await send({**message, "body": packed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,103 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from conversation import count_tokens
+from tools import dict_to_str
+
+SEARCH_ROUND_TOKEN_BUDGET = int(os.getenv("SEARCH_ROUND_TOKEN_BUDGET", "2500"))
+# chunks sharing at least this fraction of their word shingles count as duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.7
+
+_SHINGLE = 5
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip().lower())
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    return host + parts.path.rstrip("/")
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < _SHINGLE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _similar(a: set, b: set) -> bool:
+    # containment rather than Jaccard, so a chunk quoted inside a longer one is caught too
+    return len(a & b) >= NEAR_DUPLICATE_THRESHOLD * min(len(a), len(b))
+
+
+def _parse(text: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        data = None
+    if not isinstance(data, dict):
+        # not a Tavily JSON body: keep it as a single unranked snippet
+        return {"answer": None, "results": [{"url": "", "title": "", "content": str(text), "score": 0.0}]}
+    return data
+
+
+def condense_results(search_results: Dict[str, str], budget: int = SEARCH_ROUND_TOKEN_BUDGET) -> Tuple[str, Dict[str, int]]:
+    """
+    Turn one round of raw Tavily responses into compact text for the conversation.
+
+    Keeps each provider `answer`, drops repeated URLs and near-duplicate chunks,
+    and adds the best-scoring snippets until `budget` tokens are used.
+    Returns the text and {"raw_tokens", "condensed_tokens", "saved_tokens", ...}.
+    """
+    answers: List[str] = []
+    best: Dict[str, Dict[str, Any]] = {}
+    for query, text in search_results.items():
+        data = _parse(text)
+        if data.get("answer"):
+            answers.append(f"{query}: {data['answer']}")
+        for r in data.get("results") or []:
+            key = normalize_url(r.get("url") or "") or f"{query}#{len(best)}"
+            if key not in best or (r.get("score") or 0) > (best[key].get("score") or 0):
+                best[key] = r
+
+    ranked = sorted(best.values(), key=lambda r: r.get("score") or 0, reverse=True)
+
+    lines = ["answers:"] + [f"- {a}" for a in answers] if answers else []
+    used = count_tokens("\n".join(lines))
+    kept_shingles: List[set] = []
+    dropped = 0
+    sources: List[str] = []
+    for r in ranked:
+        chunks = [c.strip() for c in re.split(r"\s*\[\.\.\.\]\s*", r.get("content") or "") if c.strip()]
+        fresh, fresh_shingles = [], []
+        for chunk in chunks:
+            sh = _shingles(chunk)
+            if any(_similar(sh, k) for k in kept_shingles + fresh_shingles):
+                dropped += 1
+                continue
+            fresh_shingles.append(sh)
+            fresh.append(chunk)
+        if not fresh:
+            continue
+        line = f"- {r.get('title') or ''} ({r.get('url') or ''}): " + " … ".join(fresh)
+        cost = count_tokens(line)
+        if used + cost > budget:
+            continue                            # a later, shorter result may still fit
+        kept_shingles += fresh_shingles         # only what was kept can make later chunks duplicates
+        sources.append(line)
+        used += cost
+    if sources:
+        lines += ["sources:"] + sources
+
+    condensed = "\n".join(lines)
+    raw_tokens = count_tokens(dict_to_str(search_results))
+    condensed_tokens = count_tokens(condensed)
+    return condensed, {
+        "raw_tokens": raw_tokens,
+        "condensed_tokens": condensed_tokens,
+        "saved_tokens": max(0, raw_tokens - condensed_tokens),
+        "duplicate_urls": sum(len(_parse(t).get("results") or []) for t in search_results.values()) - len(best),
+        "duplicate_chunks": dropped,
+    }
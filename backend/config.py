@@ -34,7 +34,8 @@ EXCEL_ANALYSIS_JSON_SCHEMA = {
 GENERATE_INSIGHTS = """
 You are a subject-matter researcher analysing the cascading CONSEQUENCES
 of a specified flooding event, including links to economic, societal,
-environmental, infrastructure and policy-related knock-on effects **in {location}**.
+environmental, infrastructure and policy-related knock-on effects **in the
+location named in the first user message**.
 
 **Step 1 – Plan**  
 Think step-by-step about what you already know and what fresh facts
@@ -51,15 +52,19 @@ If more searches are clearly required, create follow-up questions. But don't cre
 
 **Output – return ONE JSON object with this shape:**  
 ```json
-{{
+{
   "use_internet": <true|false>,
   "search_queries": ["query 1", "query 2", …],
   "final_answer": JSONB
-}}
+}
 If "use_internet" is true, the "search_queries" field should contain a list of queries but final_answer should return an empty JSON object.
 If "use_internet" is false, the "search_queries" field should be empty but final_answer should contain a JSON object with the asked structure.
 """
 
+# variable part of the scene request; sent as its own message after the static
+# GENERATE_INSIGHTS prefix so that prefix is byte-identical for every location
+GENERATE_INSIGHTS_LOCATION = "The flooding event to analyse is in {location}."
+
 generate_insights_json_schema = {
     "type": "json_schema",
     "json_schema" : {
@@ -155,6 +160,28 @@ generate_insights_json_schema = {
     }
 }
 
+# planning-only variant of generate_insights_json_schema, used when the scene's
+# planning rounds run on a different (faster) model than the synthesis
+SCENE_PLAN_JSON_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "scene_plan",
+        "schema": {
+            "type": "object",
+            "properties": {
+                key: generate_insights_json_schema["json_schema"]["schema"]["properties"][key]
+                for key in ("use_internet", "search_queries")
+            },
+            "required": ["use_internet", "search_queries"],
+        },
+    },
+}
+
+SCENE_PLAN_MESSAGE = (
+    "Only decide whether more web searches are needed and, if so, write the search queries. "
+    "The final answer is written in a separate step."
+)
+
 tools = [{
     "type": "function",
     "function": {
@@ -173,21 +200,17 @@ tools = [{
 ANALYZE_INSIGHTS = """
 You are an expert disaster-response analyst. You have been given:
 
-  • A proposed way of handling the disaster:  
-    {solution}
-
-  • Contextual information about the disaster:
-    {conversation} 
+  • Contextual information about the disaster: the messages before this one.
 
-  • The initial resources available in the area:  
-    {resources}
+  • The initial resources available in the area and a proposed way of
+    handling the disaster: the last user message.
 
 ––––– Your task –––––  
 1. Assess whether this solution adequately addresses the situation.  
 2. Describe likely outcomes and possible unintended consequences.  
-3. Update the list of resources:  
-   – What additional resources would be needed?  
-   – Which existing resources might be depleted or redirected?
+3. Update the list of resources by listing only the counts that change:  
+   – What additional resources would be needed? (positive change)  
+   – Which existing resources might be depleted or redirected? (negative change)
 
    Be realistic when evaluating the solution.
 
@@ -197,80 +220,87 @@ Also provide a follow-up threat that could be created by the proposed solution -
 Return **one** JSON object (no extra text) matching this schema:
 
 ```json
-{{
+{
   "short_response": "<Does the solution solve the situation? Yes/No + why in one sentence.>",
+  "updated_severty_score": {
+    "severity_score": 0–10,
+    "severity_description": "<Description of the severity score. 0 means no threat and 10 means very high threat.>"
+    },
   "feedback": "<Detailed feedback on risks, consequences, and how it could be improved.>",
-  "updated_resources": {{
-    "Medical Resources": {{
-      "Ambulances": <number>,
-      "Doctors": <number>,
-      "Nurses": <number>,
-      "Medical Kits": <number>,
-      "Generators": <number>
-    }},
-    "Logistics & Support": {{
-      "Rescue Boats": <number>,
-      "Fuel Reserves": <number>,
-      "Comm Radios": <number>,
-      "Water Units": <number>,
-      "Shelter Tents": <number>
-    }}
-  }},
-  "response_analysis": {{
+  "resource_changes": {
+    "<resource name, only those that change>": <signed number, e.g. -2>
+  },
+  "response_analysis": {
     "medical_relevance": 0–10,
     "logistical_feasibility": 0–10,
     "ethical_considerations": 0–10,
     "context_relevance": 0–10,
     "overall_effectiveness": 0–10
-  }},
-  "updated_severty_score": {{
-    "severity_score": 0–10,
-    "severity_description": "<Description of the severity score. 0 means no threat and 10 means very high threat.>"
-    }},
-
-    "alternative_solutions": {{
+  },
+    "alternative_solutions": {
         "solution": "<Description of the alternative solution>",
         "alternative_result": "<Description of the result of the alternative solution>",
-        "resources_needed": {{
-            "Medical Resources": {{
-                "Ambulances": <number>,
-                "Doctors": <number>,
-                "Nurses": <number>,
-                "Medical Kits": <number>,
-                "Generators": <number>
-            }},
-            "Logistics & Support": {{
-                "Rescue Boats": <number>,
-                "Fuel Reserves": <number>,
-                "Comm Radios": <number>,
-                "Water Units": <number>,
-                "Shelter Tents": <number>
-            }}
-        }},
+        "resource_changes": {
+            "<resource name>": <signed number>
+        },
         "feedback": "<Feedback on the alternative solution>",
-        "response_analysis": {{
+        "response_analysis": {
             "medical_relevance": 0–10,
             "logistical_feasibility": 0–10,
             "ethical_considerations": 0–10,
             "context_relevance": 0–10,
             "overall_effectiveness": 0–10
-        }},
-        "updated_severty_score": {{
+        },
+        "updated_severty_score": {
             "severity_score": 0–10,
             "severity_description": "<Description of the severity score. 0 means no threat and 10 means very high threat.>"
-        }}
-    }},
-    "follow_up_threat": {{
+        }
+    },
+    "follow_up_threat": {
         "name": "<Name of the follow-up threat>",
         "threat_description": "<Description of the follow-up threat created by proposed solution there must always be a follow-up threat. including as much detail as possible. Such as location of the problem, type of the problem, and the impact of the problem. But keep it 2-3 sentences.>",
         "threat_score": <number>
-    }}
-}}
+    }
+}
   
 """
 
+# variable part of the analysis request, appended after the static ANALYZE_INSIGHTS prompt
+ANALYZE_INSIGHTS_REQUEST = """The initial resources available in the area:
+{resources}
+
+The proposed way of handling the disaster:
+{solution}"""
+
 
 
+resources = {
+    "Medical Resources": {
+        "Ambulances": 10,
+        "Doctors": 25,
+        "Nurses": 40,
+        "Medical Kits": 100,
+        "Generators": 15
+    },
+    "Logistics & Support": {
+        "Rescue Boats": 10,
+        "Fuel Reserves": 100,
+        "Comm Radios": 25,
+        "Water Units": 50,
+        "Shelter Tents": 20
+    }
+}
+
+# signed changes per resource; the server applies them to the session's ledger
+# (ledger.py) instead of having the model rewrite every count on every turn
+RESOURCE_CHANGES_SCHEMA = {
+    "type": "object",
+    "description": "Only the resources whose count changes, as signed numbers: negative when used up or redirected, positive when more become available or are needed.",
+    # one property per item of `resources`, so the schema and the ledger (ledger.RESOURCE_KEYS) agree
+    "properties": {name: {"type": "integer"} for items in resources.values() for name in items},
+    "additionalProperties": False
+}
+
 ANALYZE_INSIGHTS_JSON_SCHEMA = {
     "type": "json_schema",
     "json_schema": {
@@ -282,39 +312,28 @@ ANALYZE_INSIGHTS_JSON_SCHEMA = {
                     "type": "string",
                     "description": "Short response about the solution. Does it solve the situation or not?"
                 },
-                "feedback": {
-                    "type": "string",
-                    "description": "Feedback about the solution. What are the possible consequences of this solution? What could be done better?"
-                },
-                "updated_resources": {
+                "updated_severty_score": {
                     "type": "object",
-                    "description": "Updated list of resources. What additional resources would be needed? Which existing resources might be depleted or redirected?",
+                    "description": "Updated severity score of the situation.",
                     "properties": {
-                        "Medical Resources": {
-                            "type": "object",
-                            "properties": {
-                                "Ambulances":    {"type": "integer", "description": "Number of ambulances available."},
-                                "Doctors":       {"type": "integer", "description": "Number of doctors available."},
-                                "Nurses":        {"type": "integer", "description": "Number of nurses available."},
-                                "Medical Kits":  {"type": "integer", "description": "Number of medical kits available."},
-                                "Generators":    {"type": "integer", "description": "Number of generators available."}
-                            },
-                            "required": ["Ambulances", "Doctors", "Nurses", "Medical Kits", "Generators"]
+                        "severity_score": {
+                            "type": "integer",
+                            "minimum": 0,
+                            "maximum": 10,
+                            "description": "Severity score of the situation or the state of the situation after applying mentioned solution. 0 means no threat and 10 means very high threat."
                         },
-                        "Logistics & Support": {
-                            "type": "object",
-                            "properties": {
-                                "Rescue Boats":    {"type": "integer", "description": "Number of rescue boats available."},
-                                "Fuel Reserves":   {"type": "integer", "description": "Number of fuel reserves available."},
-                                "Comm Radios":     {"type": "integer", "description": "Number of communication radios available."},
-                                "Water Units":     {"type": "integer", "description": "Number of water units available."},
-                                "Shelter Tents":   {"type": "integer", "description": "Number of shelter tents available."}
-                            },
-                            "required": ["Rescue Boats", "Fuel Reserves", "Comm Radios", "Water Units", "Shelter Tents"]
+                        "severity_description": {
+                            "type": "string",
+                            "description": "Description of the severity score."
                         }
                     },
-                    "required": ["Medical Resources", "Logistics & Support"]
+                    "required": ["severity_score", "severity_description"]
+                },
+                "feedback": {
+                    "type": "string",
+                    "description": "Feedback about the solution. What are the possible consequences of this solution? What could be done better?"
                 },
+                "resource_changes": RESOURCE_CHANGES_SCHEMA,
                 "response_analysis": {
                     "type": "object",
                     "description": "Numeric scores (0–10) evaluating different dimensions of the proposed solution.",
@@ -334,23 +353,6 @@ ANALYZE_INSIGHTS_JSON_SCHEMA = {
                     ],
 
 
-                },
-                "updated_severty_score": {
-                    "type": "object",
-                    "description": "Updated severity score of the situation.",
-                    "properties": {
-                        "severity_score": {
-                            "type": "integer",
-                            "minimum": 0,
-                            "maximum": 10,
-                            "description": "Severity score of the situation or the state of the situation after applying mentioned solution. 0 means no threat and 10 means very high threat."
-                        },
-                        "severity_description": {
-                            "type": "string",
-                            "description": "Description of the severity score."
-                        }
-                    },
-                    "required": ["severity_score", "severity_description"]
                 },
                 "alternative_solutions": {
                     "type": "object",
@@ -364,18 +366,7 @@ ANALYZE_INSIGHTS_JSON_SCHEMA = {
                             "type": "string",
                             "description": "Description of the result of the alternative solution."
                         },
-                        "resources_needed": {
-                            "type": "object",
-                            "properties": {
-                                "Medical Resources": {
-                                    "$ref": "#/properties/updated_resources/properties/Medical Resources"
-                                },
-                                "Logistics & Support": {
-                                    "$ref": "#/properties/updated_resources/properties/Logistics & Support"
-                                }
-                            },
-                            "required": ["Medical Resources", "Logistics & Support"]
-                        },
+                        "resource_changes": RESOURCE_CHANGES_SCHEMA,
                         "feedback": {
                             "type": "string",
                             "description": "Feedback on the alternative solution."
@@ -414,7 +405,7 @@ ANALYZE_INSIGHTS_JSON_SCHEMA = {
                             "required": ["severity_score", "severity_description"]
                         }
                     },
-                    "required": ["solution", "alternative_result", "resources_needed", "feedback", "response_analysis", "updated_severty_score"]
+                    "required": ["solution", "alternative_result", "resource_changes", "feedback", "response_analysis", "updated_severty_score"]
                 },
                 "follow_up_threat": {
                     "type": "object",
@@ -435,12 +426,14 @@ ANALYZE_INSIGHTS_JSON_SCHEMA = {
                     "required": ["name", "threat_description", "threat_score"]
                 }
             },
+            # the streaming solve endpoint relies on this order: the model emits
+            # short_response and updated_severty_score before the long fields
             "required": [
                 "short_response",
+                "updated_severty_score",
                 "feedback",
-                "updated_resources",
+                "resource_changes",
                 "response_analysis",
-                "updated_severty_score",
                 "alternative_solutions",
                 "follow_up_threat"
             ]
@@ -448,50 +441,37 @@ ANALYZE_INSIGHTS_JSON_SCHEMA = {
     }
     }
 
-resources = {
-    "Medical Resources": {
-        "Ambulances": 10,
-        "Doctors": 25,
-        "Nurses": 40,
-        "Medical Kits": 100,
-        "Generators": 15
-    },
-    "Logistics & Support": {
-        "Rescue Boats": 10,
-        "Fuel Reserves": 100,
-        "Comm Radios": 25,
-        "Water Units": 50,
-        "Shelter Tents": 20
-    }
-}
 
 EXCEL_ANALYSIS = '''
 You are provided with a text from the exel file about the available resources and you need to analyze it and return it in the formatted json format.
-Here is the text to analyze: {text}
+The text is in the next message.
 ```json
-{{resources: [
-    {{
-        "Medical Resources": {{
+{resources: [
+    {
+        "Medical Resources": {
             "Ambulances": <number>,
             "Doctors": <number>,
             "Nurses": <number>,
             "Medical Kits": <number>,
             "Generators": <number>
 
-        }},
-        "Logistics & Support": {{      
+        },
+        "Logistics & Support": {      
             "Rescue Boats": <number>,
             "Fuel Reserves": <number>,
             "Comm Radios": <number>,
             "Water Units": <number>,
             "Shelter Tents": <number>
-        }}
-    }}  
-]}}
+        }
+    }  
+]}
 ```
 You need to analyze the text and return it in the formatted json format.
 '''
 
+# the sheet text itself, sent after the static EXCEL_ANALYSIS prompt
+EXCEL_ANALYSIS_TEXT = "Here is the text to analyze:\n{text}"
+
 
 EXCEL_ANALYSIS_JSON_SCHEMA = {
     "type": "json_schema",
@@ -0,0 +1,176 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools import dict_to_str
+
+# tiktoken gives exact counts; without it we fall back to ~4 characters per token.
+# The encoding is loaded on the first count, not at import (see _encoding).
+_ENCODING = False
+
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "12000"))
+CONVERSATION_KEEP_TURNS = int(os.getenv("CONVERSATION_KEEP_TURNS", "4"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "1500"))
+
+# per-message framing the chat format adds on top of the content
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_NAME = "conversation_summary"
+STATE_NAME = "session_state"
+
+
+def _encoding():
+    global _ENCODING
+    if _ENCODING is False:
+        try:
+            import tiktoken
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:  # pragma: no cover - optional dependency
+            _ENCODING = None
+    return _ENCODING
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return count_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD
+
+
+def conversation_tokens(conversation: List[Dict[str, Any]]) -> int:
+    return sum(message_tokens(m) for m in conversation)
+
+
+def _clip(text: str, tokens: int) -> str:
+    """
+    Cut text to roughly `tokens` tokens, preferring a sentence boundary.
+    """
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("\n"))
+    return (cut[:end + 1] if end > limit // 2 else cut).rstrip() + " …"
+
+
+class ConversationManager:
+    """
+    Keeps a session conversation under a token budget.
+
+    System prompts, the most recent turns and a session-state message (current
+    resources, severity history, latest follow-up threat) are kept verbatim.
+    When the budget is exceeded, older turns are folded into a single rolling
+    summary message, so the prompt stops growing with the number of rounds.
+    """
+
+    def __init__(self, budget: int = CONVERSATION_TOKEN_BUDGET, keep_turns: int = CONVERSATION_KEEP_TURNS,
+                 summary_tokens: int = CONVERSATION_SUMMARY_TOKENS):
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.compactions = 0
+
+    @staticmethod
+    def state_message(resources: Any, severity_history: List[int], follow_up_threat: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "role": "user",
+            "name": STATE_NAME,
+            "content": 'current resources: ' + dict_to_str(resources)
+                       + ' severity score history: ' + dict_to_str(severity_history)
+                       + ' latest follow-up threat: ' + dict_to_str(follow_up_threat or {}),
+        }
+
+    def summarize(self, previous: str, turns: List[Dict[str, Any]]) -> str:
+        """
+        Fold `turns` into the rolling summary. Each turn keeps its opening, and the
+        summary keeps its most recent part when it outgrows summary_tokens.
+        """
+        per_turn = max(64, self.summary_tokens // max(1, len(turns) + 1))
+        parts = [previous] if previous else []
+        for m in turns:
+            text = re.sub(r"\s+", " ", str(m.get("content", ""))).strip()
+            parts.append(f"[{m.get('role', 'user')}] " + _clip(text, per_turn))
+        summary = "\n".join(parts)
+        limit = self.summary_tokens * 4
+        if len(summary) > limit:
+            summary = "… " + summary[-limit:].split("\n", 1)[-1]
+        return summary
+
+    def compact(self, conversation: List[Dict[str, Any]], state: Optional[Dict[str, Any]] = None,
+                tokens: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Return the conversation to send next: pinned messages verbatim, the
+        session-state message refreshed, and older turns summarized if over budget.
+        `tokens` is the token count of `conversation` when already known
+        (ConversationLog.tokens), which saves counting every message again.
+        """
+        system, turns, summary = [], [], ""
+        for m in conversation:
+            name = m.get("name")
+            if name == STATE_NAME:
+                tokens = None
+                continue
+            if name == SUMMARY_NAME:
+                tokens = None
+                summary = m["content"].split("\n", 1)[-1]
+            elif m["role"] == "system":
+                system.append(m)
+            else:
+                turns.append(m)
+
+        def assemble(summary: str, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            out = list(system)
+            if summary:
+                out.append({"role": "user", "name": SUMMARY_NAME,
+                            "content": "summary of the earlier conversation:\n" + summary})
+            out += turns
+            if state is not None:
+                out.append(state)
+            return out
+
+        compacted = assemble(summary, turns)
+        if tokens is not None:
+            total = tokens + (message_tokens(state) if state is not None else 0)
+        else:
+            total = conversation_tokens(compacted)
+        if total <= self.budget or len(turns) <= self.keep_turns:
+            return compacted
+
+        keep = turns[-self.keep_turns:] if self.keep_turns else []
+        older = turns[:len(turns) - len(keep)]
+        self.compactions += 1
+        return assemble(self.summarize(summary, older), keep)
+
+    def compact_log(self, log, state: Optional[Dict[str, Any]] = None,
+                    folded: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        compact() for a ConversationLog, which keeps every message. `folded`
+        ({"upto": n, "summary": text}) is the rolling summary of the log's first n
+        messages from the previous call, so only newer turns are folded into it.
+        Returns (prompt, folded) with folded updated for the next call.
+        """
+        messages = log.messages()
+        if folded is None:
+            prompt = self.compact(messages, state=state, tokens=log.tokens())
+        else:
+            upto = folded["upto"]
+            pinned = [m for m in messages[:upto] if m["role"] == "system"]
+            summary = {"role": "user", "name": SUMMARY_NAME,
+                       "content": "summary of the earlier conversation:\n" + folded["summary"]}
+            prompt = self.compact(pinned + [summary] + messages[upto:], state=state)
+
+        at = next((i for i, m in enumerate(prompt) if m.get("name") == SUMMARY_NAME), None)
+        if at is None:
+            return prompt, folded
+        # the turns after the summary are the last `kept` non-system messages of the log
+        kept = sum(1 for m in prompt[at + 1:] if m is not state)
+        upto = len(messages)
+        while kept:
+            upto -= 1
+            if messages[upto]["role"] != "system":
+                kept -= 1
+        return prompt, {"upto": upto, "summary": prompt[at]["content"].split("\n", 1)[-1]}
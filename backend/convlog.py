@@ -0,0 +1,174 @@
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+from conversation import message_tokens
+
+
+class Entry:
+    """
+    One message of a ConversationLog with its token count, JSON size and JSON
+    encoding, each computed on first use and then kept. Only the size is needed
+    for accounting, so the encoding itself is kept only once something asked for it.
+    """
+
+    __slots__ = ("message", "_tokens", "_size", "_json")
+
+    def __init__(self, message: Dict[str, Any]):
+        self.message = message
+        self._tokens: Optional[int] = None
+        self._size: Optional[int] = None
+        self._json: Optional[str] = None
+
+    @property
+    def tokens(self) -> int:
+        if self._tokens is None:
+            self._tokens = message_tokens(self.message)
+        return self._tokens
+
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.message, default=str)
+            self._size = len(self._json)
+        return self._json
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = len(json.dumps(self.message, default=str))
+        return self._size
+
+    def ram(self) -> int:
+        """Approximate bytes this message holds in this process."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.message)
+        for key, value in self.message.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+        if self._json is not None:
+            size += sys.getsizeof(self._json)
+        return size
+
+
+class ConversationLog:
+    """
+    Append-only conversation of a session with structural sharing.
+
+    A log is a segment of messages on top of a parent log. `append` returns a new
+    log and never changes an existing one, so every log is its own snapshot, and
+    all sessions started from one cached scenario share its messages. Token counts
+    and JSON sizes are computed once per message, totals once per segment.
+    The message dicts are shared as well and must not be modified.
+    """
+
+    __slots__ = ("parent", "segment", "length", "_tokens", "_nbytes", "_ram")
+
+    def __init__(self, parent: Optional["ConversationLog"] = None, segment: Iterable[Entry] = ()):
+        self.parent = parent
+        self.segment = tuple(segment)
+        self.length = (parent.length if parent is not None else 0) + len(self.segment)
+        self._tokens: Optional[int] = None
+        self._nbytes: Optional[int] = None
+        self._ram: Optional[int] = None
+
+    @classmethod
+    def of(cls, messages: Iterable[Dict[str, Any]]) -> "ConversationLog":
+        """A log holding `messages` (a list of chat messages) as one segment."""
+        return cls(None, [Entry(m) for m in messages])
+
+    from_state = of
+
+    def append(self, *messages: Dict[str, Any]) -> "ConversationLog":
+        if not messages:
+            return self
+        return ConversationLog(self, [Entry(m) for m in messages])
+
+    # immutable, so copies can share it (ScenarioCache deep-copies its results)
+    def __copy__(self) -> "ConversationLog":
+        return self
+
+    def __deepcopy__(self, memo) -> "ConversationLog":
+        return self
+
+    def chain(self) -> List["ConversationLog"]:
+        """The logs this one is built from, oldest first, ending with itself."""
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def entries(self) -> List[Entry]:
+        return [entry for node in self.chain() for entry in node.segment]
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """The messages as a new list (the dicts themselves are shared)."""
+        return [entry.message for node in self.chain() for entry in node.segment]
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _total(self, attr: str, per_segment) -> int:
+        # walk down to the newest log with the total cached, then fill in upwards
+        # (iterative, since long sessions make deep chains)
+        pending = []
+        node = self
+        while node is not None and getattr(node, attr) is None:
+            pending.append(node)
+            node = node.parent
+        total = getattr(node, attr) if node is not None else 0
+        for node in reversed(pending):
+            total += per_segment(node.segment)
+            setattr(node, attr, total)
+        return total
+
+    def tokens(self) -> int:
+        """Token count of all messages, as conversation.conversation_tokens would report."""
+        return self._total("_tokens", lambda segment: sum(e.tokens for e in segment))
+
+    def nbytes(self) -> int:
+        """Length of to_json()."""
+        # each message plus its ", " separator; the brackets take the place of the last separator
+        total = self._total("_nbytes", lambda segment: sum(e.size + 2 for e in segment))
+        return total if self.length else 2
+
+    def to_json(self) -> str:
+        return "[" + ", ".join(entry.json for entry in self.entries()) + "]"
+
+    def to_state(self) -> List[Dict[str, Any]]:
+        """JSON-serializable form for the session store."""
+        return self.messages()
+
+    def segment_ram(self) -> int:
+        """Approximate bytes held by this log's own segment (not its parents)."""
+        if self._ram is None:
+            self._ram = sys.getsizeof(self) + sys.getsizeof(self.segment) + sum(e.ram() for e in self.segment)
+        return self._ram
+
+    def memory(self) -> Dict[str, int]:
+        chain = self.chain()
+        return {
+            "messages": self.length,
+            "segments": len(chain),
+            "tokens": self.tokens(),
+            "json_bytes": self.nbytes(),
+            "ram_bytes": sum(node.segment_ram() for node in chain),
+        }
+
+
+def shared_memory(logs: Iterable[ConversationLog]) -> Dict[str, int]:
+    """
+    Approximate RAM of many logs: "ram_bytes" counts segments shared between logs
+    once, "unshared_ram_bytes" is what separate copies would take.
+    """
+    seen = set()
+    unique = total = 0
+    for log in logs:
+        for node in log.chain():
+            ram = node.segment_ram()
+            total += ram
+            if id(node) not in seen:
+                seen.add(id(node))
+                unique += ram
+    return {"ram_bytes": unique, "unshared_ram_bytes": total}
@@ -0,0 +1,204 @@
+import asyncio
+import glob
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from excelparse import SheetParser
+from metrics import EXCEL_PARSE_LATENCY
+from mylogger import logger
+
+EXCEL_MAX_BYTES = int(os.getenv("EXCEL_MAX_BYTES", str(25 * 1024 * 1024)))
+EXCEL_MAX_SHEETS = int(os.getenv("EXCEL_MAX_SHEETS", "20"))
+# non-empty rows kept per sheet; bounds the TSV written (and possibly sent to the LLM) per sheet
+EXCEL_MAX_ROWS = int(os.getenv("EXCEL_MAX_ROWS", "200000"))
+EXCEL_WORKERS = int(os.getenv("EXCEL_WORKERS", "2"))
+# parse jobs allowed in flight at once; the rest wait here instead of in the pool queue
+EXCEL_MAX_PENDING = int(os.getenv("EXCEL_MAX_PENDING", str(EXCEL_WORKERS * 2)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending = asyncio.Semaphore(EXCEL_MAX_PENDING)
+
+
+class WorkbookRejected(ValueError):
+    """The upload breaks a size or sheet limit; `status` is the HTTP code to answer with."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+    def __reduce__(self):
+        # raised inside pool workers, so it has to survive pickling with its status
+        return type(self), (str(self), self.status)
+
+
+def count_sheets(path: str, filename: str) -> Optional[int]:
+    """
+    Number of sheets in an .xlsx, read from the workbook manifest without loading any cells.
+    Returns None for formats where that is not possible cheaply (.xls).
+    """
+    if not filename.endswith(".xlsx"):
+        return None
+    try:
+        with zipfile.ZipFile(path) as zf:
+            manifest = zf.read("xl/workbook.xml")
+    except (zipfile.BadZipFile, KeyError):
+        raise WorkbookRejected(f"{filename} is not a valid .xlsx file", 422)
+    return len(re.findall(rb"<(?:\w+:)?sheet\b", manifest))
+
+
+def check_limits(path: str, filename: str) -> None:
+    if os.path.getsize(path) > EXCEL_MAX_BYTES:
+        raise WorkbookRejected(f"{filename} is larger than {EXCEL_MAX_BYTES} bytes", 413)
+    sheets = count_sheets(path, filename)
+    if sheets is not None and sheets > EXCEL_MAX_SHEETS:
+        raise WorkbookRejected(f"{filename} has {sheets} sheets, at most {EXCEL_MAX_SHEETS} are allowed", 422)
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    return str(value).replace("\t", " ").replace("\r", " ").replace("\n", " ")
+
+
+def iter_sheets(path: str, filename: str) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    """
+    Yield (sheet name, row iterator) one sheet at a time. .xlsx files are read with
+    openpyxl in read-only mode, so rows stream from the file instead of being loaded up front.
+    """
+    if filename.endswith(".xlsx"):
+        import openpyxl
+        book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            for ws in book.worksheets:
+                yield ws.title, ws.iter_rows(values_only=True)
+        finally:
+            book.close()
+    else:
+        import xlrd
+        book = xlrd.open_workbook(path, on_demand=True)
+        try:
+            if book.nsheets > EXCEL_MAX_SHEETS:
+                raise WorkbookRejected(f"{filename} has {book.nsheets} sheets, at most {EXCEL_MAX_SHEETS} are allowed", 422)
+            for i in range(book.nsheets):
+                sheet = book.sheet_by_index(i)
+                yield sheet.name, (tuple(sheet.row_values(r)) for r in range(sheet.nrows))
+                book.unload_sheet(i)
+        finally:
+            book.release_resources()
+
+
+def read_sheet(name: str, rows: Iterator[tuple], out: TextIO, filename: str = "") -> Dict[str, Any]:
+    """
+    Stream one sheet's rows into `out` as TSV and through the deterministic parser,
+    without holding the sheet in memory. Empty rows and trailing empty cells are
+    dropped on the way. "header" is the TSV line of the table's header row, which
+    may sit below a title; "rows" is the number of TSV lines written.
+    """
+    parser = SheetParser()
+    for row in rows:
+        cells = [None if v == "" else v for v in row]
+        while cells and cells[-1] is None:
+            cells.pop()
+        if not cells:
+            continue
+        if parser.rows >= EXCEL_MAX_ROWS:
+            raise WorkbookRejected(f"{filename} sheet {name!r} has more than {EXCEL_MAX_ROWS} rows", 422)
+        parser.feed(cells)
+        out.write("\t".join(_cell(v) for v in cells))
+        out.write("\n")
+
+    resources, confidence = parser.result()
+    return {
+        "name": str(name),
+        "rows": parser.rows,
+        "header": parser.header,
+        "resources": resources,
+        "confidence": round(confidence, 3),
+    }
+
+
+def read_workbook(path: str, filename: str) -> List[Dict[str, Any]]:
+    """
+    Per sheet: the deterministic parser's result, with the sheet's TSV text written
+    to the file at "tsv_path" next to the upload. Runs in a worker process; memory
+    does not grow with the number of rows. The TSV files are left for the caller
+    (see remove_tsv), also when the parse fails part way.
+    """
+    sheets: List[Dict[str, Any]] = []
+    for i, (name, rows) in enumerate(iter_sheets(path, filename)):
+        tsv_path = f"{path}.{i}.tsv"
+        with open(tsv_path, "w", encoding="utf-8") as out:
+            sheets.append({"tsv_path": tsv_path, **read_sheet(name, rows, out, filename)})
+    return sheets
+
+
+def read_tsv(sheet: Dict[str, Any]) -> str:
+    with open(sheet["tsv_path"], encoding="utf-8") as fp:
+        return fp.read()
+
+
+def remove_tsv(path: str) -> None:
+    """Remove the TSV files read_workbook wrote for the upload at `path`, also after a failed parse."""
+    for tsv_path in glob.glob(glob.escape(path) + ".*.tsv"):
+        os.unlink(tsv_path)
+
+
+def _warm_worker() -> None:
+    # pay the openpyxl import once per worker, not on the first upload
+    import openpyxl  # noqa: F401
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Return the parse pool, starting all of its worker processes on first use.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXCEL_WORKERS, initializer=_warm_worker)
+        for _ in range(EXCEL_WORKERS):
+            _pool.submit(int)
+    return _pool
+
+
+def _replace_pool(broken: ProcessPoolExecutor) -> None:
+    # concurrent parses may all see the same broken pool; only the first replaces it
+    global _pool
+    if _pool is broken:
+        _pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def parse_workbook(path: str, filename: str) -> List[Dict[str, Any]]:
+    """
+    Check the limits, then parse the workbook at `path` in the process pool without
+    blocking the event loop. Only the path crosses the process boundary, not the bytes.
+    A worker that dies (e.g. out of memory on a hostile workbook) breaks the whole
+    pool; it is then replaced and the parse tried once more. On success the caller
+    removes the sheets' TSV files with remove_tsv(path); on failure they are removed here.
+    """
+    check_limits(path, filename)
+    loop = asyncio.get_running_loop()
+    async with _pending:
+        with EXCEL_PARSE_LATENCY.time():
+            pool = get_pool()
+            try:
+                try:
+                    return await loop.run_in_executor(pool, read_workbook, path, filename)
+                except BrokenProcessPool:
+                    logger.warning("Excel parse pool broke while reading %s, restarting it", filename)
+                    _replace_pool(pool)
+                    return await loop.run_in_executor(get_pool(), read_workbook, path, filename)
+            except BaseException:
+                remove_tsv(path)                # a worker that died cannot clean up after itself
+                raise
@@ -0,0 +1,254 @@
+import difflib
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import resources as RESOURCE_TEMPLATE
+
+# share of numeric rows / columns that must map to a known resource before the LLM is skipped
+EXCEL_PARSER_MIN_CONFIDENCE = float(os.getenv("EXCEL_PARSER_MIN_CONFIDENCE", "0.8"))
+# rows scanned when looking for the header row
+HEADER_SCAN_ROWS = 10
+# rows the layout (wide / long, label and quantity columns) is chosen from; the
+# totals still cover every row, but only this many are held in memory
+LAYOUT_SAMPLE_ROWS = 1000
+FUZZY_CUTOFF = 0.82
+
+# item -> category, e.g. "Ambulances" -> "Medical Resources"
+CATEGORY_OF = {item: category for category, items in RESOURCE_TEMPLATE.items() for item in items}
+
+# spellings seen in inventory sheets that fuzzy matching alone would miss; only
+# specific ones, since a generic word ("water", "tent") also names unrelated rows
+SYNONYMS = {
+    "physician": "Doctors",
+    "first aid kit": "Medical Kits",
+    "medkit": "Medical Kits",
+    "med kit": "Medical Kits",
+    "power generator": "Generators",
+    "lifeboat": "Rescue Boats",
+    "inflatable boat": "Rescue Boats",
+    "fuel tank": "Fuel Reserves",
+    "communication radio": "Comm Radios",
+    "water tank": "Water Units",
+    "drinking water": "Water Units",
+}
+
+LABEL_HEADERS = {"resource", "item", "name", "resource name", "type", "category", "description", "asset"}
+QUANTITY_HEADERS = {"quantity", "qty", "count", "amount", "total", "number", "units", "available", "stock", "no"}
+# words a label may carry besides the resource name ("Ambulances (qty)", "Water Units in stock");
+# in _norm form
+QUALIFIERS = {"quantity", "qty", "count", "amount", "total", "number", "no", "nr", "unit", "available",
+              "in", "stock", "on", "hand", "pc", "pcs", "piece", "l", "litre", "liter", "kg", "ton", "tonne"}
+
+
+def _norm(text: Any) -> str:
+    words = re.findall(r"[a-z0-9]+", str(text).lower().replace("&", " and "))
+    return " ".join(w[:-1] if w.endswith("s") and not w.endswith("ss") and len(w) > 3 else w for w in words)
+
+
+_INDEX = {_norm(item): item for item in CATEGORY_OF}
+_INDEX.update({_norm(k): v for k, v in SYNONYMS.items()})
+
+
+def match_resource(label: Any) -> Optional[str]:
+    """
+    Known resource key for a header or row label ("rescue boats", "Ambulances (qty)"), or None.
+    The whole label must be a resource name or synonym, apart from unit and quantity
+    words, or a close spelling of one; a name inside a longer label ("Tent pegs",
+    "Water damage claims") is no match.
+    """
+    key = _norm(label)
+    if not key or key.isdigit():
+        return None
+    if key in _INDEX:
+        return _INDEX[key]
+    words = key.split()
+    for name, item in _INDEX.items():
+        name_words = name.split()
+        if [w for w in words if w in name_words or w not in QUALIFIERS] == name_words:
+            return item
+    close = difflib.get_close_matches(key, _INDEX.keys(), n=1, cutoff=FUZZY_CUTOFF)
+    return _INDEX[close[0]] if close else None
+
+
+def empty_resources() -> Dict[str, Dict[str, int]]:
+    return {category: {item: 0 for item in items} for category, items in RESOURCE_TEMPLATE.items()}
+
+
+def _to_resources(totals: Dict[str, float]) -> Dict[str, Dict[str, int]]:
+    out = empty_resources()
+    for item, qty in totals.items():
+        out[CATEGORY_OF[item]][item] += int(round(qty))
+    return out
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return float(value)
+
+
+@lru_cache(maxsize=4096)
+def _match_cell(value: str) -> Optional[str]:
+    # label columns repeat the same few spellings; match each one once
+    return match_resource(value)
+
+
+def _header_row(rows: List[list]) -> Tuple[int, int]:
+    """
+    (row index, resource names in it) of the most header-like row among the first rows.
+    """
+    best, best_score, best_resources = 0, -1, 0
+    for r, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        cells = [c for c in row if isinstance(c, str) and c.strip()]
+        resources = sum(match_resource(c) is not None for c in cells)
+        keywords = sum(_norm(c) in LABEL_HEADERS or _norm(c) in QUANTITY_HEADERS for c in cells)
+        score = resources + 2 * keywords
+        if score > best_score:
+            best, best_score, best_resources = r, score, resources
+    return best, best_resources
+
+
+def _cell_at(row: list, i: int) -> Any:
+    return row[i] if i < len(row) else None
+
+
+def _argmax(counts: List[int]) -> int:
+    return max(range(len(counts)), key=lambda i: (counts[i], -i)) if counts else 0
+
+
+class SheetParser:
+    """
+    Map one sheet onto the resource categories of config.py, fed one non-empty row
+    at a time so the sheet is never held in memory. The header row and the layout
+    come from the first LAYOUT_SAMPLE_ROWS rows:
+
+    - wide: resources as columns (one row per site / unit); every mapped column is summed;
+    - long: one resource per row; the label and quantity columns are found, then summed per resource.
+
+    `header` is the index of the header row among the rows fed.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.header = 0
+        self._window: Optional[List[list]] = []
+        self._fold = None
+        self._wide = False
+        self._names: List[Any] = []
+        self._label = self._qty = 0
+        self._sums: Dict[Any, float] = {}
+        self._seen: set = set()
+        self._candidates = 0
+        self._matched = 0
+
+    def feed(self, row: list) -> None:
+        self.rows += 1
+        if self._window is None:
+            self._fold(row)
+            return
+        self._window.append(row)
+        if len(self._window) >= LAYOUT_SAMPLE_ROWS:
+            self._choose_layout()
+
+    def _choose_layout(self) -> None:
+        window, self._window = self._window, None
+        self.header, resources_in_header = _header_row(window)
+        if resources_in_header >= 2:
+            self._wide = True
+            self._names = window[self.header]
+            self._fold = self._fold_wide
+            body = window[self.header + 1:]
+        else:
+            names = [_norm(c) if c is not None else "" for c in window[self.header]]
+            keyed = any(n in LABEL_HEADERS | QUANTITY_HEADERS for n in names)
+            body = window[self.header + 1:] if keyed else window
+            width = max((len(row) for row in body), default=0)
+            labels = [sum(isinstance(_cell_at(row, i), str) and _match_cell(_cell_at(row, i)) is not None
+                          for row in body) for i in range(width)]
+            self._label = _argmax(labels)
+            numeric = [0 if i == self._label else sum(_number(_cell_at(row, i)) is not None for row in body)
+                       for i in range(width)]
+            qty_cols = [i for i, n in enumerate(names) if n in QUANTITY_HEADERS and i != self._label]
+            self._qty = qty_cols[0] if qty_cols else _argmax(numeric)
+            self._fold = self._fold_long
+        for row in body:
+            self._fold(row)
+
+    def _fold_wide(self, row: list) -> None:
+        for i, value in enumerate(row):
+            n = _number(value)
+            if n is not None:
+                self._seen.add(i)
+                self._sums[i] = self._sums.get(i, 0.0) + n
+
+    def _fold_long(self, row: list) -> None:
+        label = _cell_at(row, self._label)
+        qty = _number(_cell_at(row, self._qty)) if self._qty != self._label else None
+        if label is None or qty is None:
+            return
+        self._candidates += 1
+        item = _match_cell(label) if isinstance(label, str) else None
+        if item is not None:
+            self._matched += 1
+            self._sums[item] = self._sums.get(item, 0.0) + qty
+
+    def result(self) -> Tuple[Optional[Dict[str, Dict[str, int]]], float]:
+        """
+        (resources, confidence); resources is None when the sheet cannot be mapped
+        with at least EXCEL_PARSER_MIN_CONFIDENCE.
+        """
+        if self._window is not None:
+            if not self._window:
+                return None, 0.0
+            self._choose_layout()
+        if self._wide:
+            mapped = {i: match_resource(_cell_at(self._names, i)) for i in sorted(self._seen)}
+            totals: Dict[str, float] = {}
+            for i, item in mapped.items():
+                if item:
+                    totals[item] = totals.get(item, 0) + self._sums[i]
+            confidence = sum(bool(item) for item in mapped.values()) / len(mapped) if mapped else 0.0
+        else:
+            totals = self._sums
+            confidence = self._matched / self._candidates if self._candidates else 0.0
+        if not totals or confidence < EXCEL_PARSER_MIN_CONFIDENCE:
+            return None, confidence
+        return _to_resources(totals), confidence
+
+
+def parse_sheet(df) -> Tuple[Optional[Dict[str, Dict[str, int]]], float]:
+    """
+    SheetParser over a sheet already read with header=None.
+    """
+    import pandas as pd
+
+    parser = SheetParser()
+    for row in df.dropna(how="all").itertuples(index=False):
+        parser.feed([None if pd.isna(v) else v for v in row])
+    return parser.result()
+
+
+def merge_resources(parts: List[Dict[str, Dict[str, int]]]) -> Dict[str, Dict[str, int]]:
+    """
+    Sum several resource dicts of the config.py shape, category by category.
+    """
+    out = empty_resources()
+    for part in parts:
+        for category, items in part.items():
+            if not isinstance(items, dict):
+                continue
+            bucket = out.setdefault(category, {})
+            for item, qty in items.items():
+                if isinstance(qty, (int, float)):
+                    bucket[item] = bucket.get(item, 0) + int(qty)
+    return out
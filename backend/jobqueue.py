@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from mylogger import logger
+
+
+JOB_QUEUE = os.getenv("JOB_QUEUE", "memory")                  # memory | sqlite
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+# in-process workers; set to 0 when a separate jobworker.py process runs the jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# finished jobs, and the idempotency keys pointing at them, are kept this long
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+JOB_MAX = int(os.getenv("JOB_MAX", "1000"))
+# a running job whose worker died is handed to another worker after this many seconds
+JOB_LEASE = float(os.getenv("JOB_LEASE", "900"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.25"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different request."""
+
+
+def request_hash(kind: str, payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps([kind, payload], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def new_job(kind: str, payload: Dict[str, Any], key: Optional[str]) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "payload": payload,
+        "status": QUEUED,
+        "result": None,
+        "error": None,
+        "key": key,
+        "hash": request_hash(kind, payload),
+        "created": now,
+        "updated": now,
+    }
+
+
+class JobQueue(ABC):
+    """
+    Background jobs with idempotency keys: submitting with a key that is already
+    known returns the existing job instead of queueing a new one.
+    """
+
+    @abstractmethod
+    async def submit(self, kind: str, payload: Dict[str, Any], key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Returns (job, created)."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job as running and return it, or None if there is none."""
+
+    @abstractmethod
+    async def finish(self, job_id: str, result: Any = None, error: Optional[str] = None) -> None: ...
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, int]: ...
+
+    async def close(self) -> None:
+        pass
+
+    async def next_job(self) -> Dict[str, Any]:
+        while True:
+            job = await self.claim()
+            if job is not None:
+                return job
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Long-poll: return the job once it has finished, or as it is after `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return job
+            left = JOB_POLL_INTERVAL if deadline is None else deadline - time.monotonic()
+            if left <= 0:
+                return job
+            await asyncio.sleep(min(JOB_POLL_INTERVAL, left))
+
+    @staticmethod
+    def _check_key(job: Dict[str, Any], kind: str, payload: Dict[str, Any]) -> None:
+        if job["hash"] != request_hash(kind, payload):
+            raise IdempotencyConflict(f"idempotency key {job['key']!r} was used for a different request")
+
+
+# ── in-process ──────────────────────────────────────────────────
+class MemoryJobQueue(JobQueue):
+    """
+    Jobs in a dict of the current process; only in-process workers can run them.
+    """
+
+    def __init__(self, ttl: float = JOB_TTL, max_jobs: int = JOB_MAX):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._keys: Dict[str, str] = {}
+        self._queued: deque = deque()
+        self._available = asyncio.Event()
+        self._finished: Dict[str, asyncio.Event] = {}
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        finished = [j for j in self._jobs.values() if j["status"] in FINISHED]
+        excess = len(self._jobs) - self.max_jobs
+        for job in finished:
+            if job["updated"] > cutoff and excess <= 0:
+                break
+            self._jobs.pop(job["id"])
+            self._finished.pop(job["id"], None)
+            if job["key"] is not None:
+                self._keys.pop(job["key"], None)
+            excess -= 1
+
+    async def submit(self, kind, payload, key=None):
+        self._prune()
+        if key is not None and key in self._keys:
+            job = self._jobs[self._keys[key]]
+            self._check_key(job, kind, payload)
+            return job, False
+        job = new_job(kind, payload, key)
+        self._jobs[job["id"]] = job
+        self._finished[job["id"]] = asyncio.Event()
+        if key is not None:
+            self._keys[key] = job["id"]
+        self._queued.append(job["id"])
+        self._available.set()
+        return job, True
+
+    async def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    async def claim(self):
+        while self._queued:
+            job = self._jobs.get(self._queued.popleft())
+            if job is not None and job["status"] == QUEUED:
+                job.update(status=RUNNING, updated=time.time())
+                return job
+        self._available.clear()
+        return None
+
+    async def next_job(self):
+        while True:
+            job = await self.claim()
+            if job is not None:
+                return job
+            await self._available.wait()
+
+    async def finish(self, job_id, result=None, error=None):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job.update(status=FAILED if error is not None else DONE, result=result, error=error, updated=time.time())
+        self._finished[job_id].set()
+
+    async def wait(self, job_id, timeout=None):
+        job = self._jobs.get(job_id)
+        if job is not None and job["status"] not in FINISHED:
+            try:
+                await asyncio.wait_for(self._finished[job_id].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._jobs.get(job_id)
+
+    async def stats(self):
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        for job in self._jobs.values():
+            counts[job["status"]] += 1
+        return counts
+
+
+# ── SQLite file shared with jobworker.py ────────────────────────
+class SqliteJobQueue(JobQueue):
+    """
+    Jobs as rows in a WAL-mode SQLite file, so API processes and separate worker
+    processes on the same host share one queue. Running jobs hold a lease; if a
+    worker dies, the job is claimed again once the lease has expired.
+    """
+
+    COLUMNS = "id, kind, payload, status, result, error, idem_key, hash, created, updated"
+
+    def __init__(self, path: str, ttl: float = JOB_TTL, lease: float = JOB_LEASE):
+        self.ttl = ttl
+        self.lease = lease
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._mutex = asyncio.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, result TEXT, error TEXT, idem_key TEXT UNIQUE, hash TEXT NOT NULL, "
+            "created REAL NOT NULL, updated REAL NOT NULL, lease_until REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    async def _run(self, sql: str, params: tuple = ()):
+        """
+        Execute one statement off the event loop; returns (rows, rowcount).
+        """
+        def run():
+            cur = self._db.execute(sql, params)
+            return cur.fetchall(), cur.rowcount
+
+        async with self._mutex:
+            return await asyncio.to_thread(run)
+
+    @staticmethod
+    def _job(row) -> Dict[str, Any]:
+        job_id, kind, payload, status, result, error, key, digest, created, updated = row
+        return {
+            "id": job_id, "kind": kind, "payload": json.loads(payload), "status": status,
+            "result": json.loads(result) if result is not None else None, "error": error,
+            "key": key, "hash": digest, "created": created, "updated": updated,
+        }
+
+    async def _by_key(self, key: str) -> Optional[Dict[str, Any]]:
+        rows, _ = await self._run(f"SELECT {self.COLUMNS} FROM jobs WHERE idem_key = ?", (key,))
+        return self._job(rows[0]) if rows else None
+
+    async def submit(self, kind, payload, key=None):
+        await self._run("DELETE FROM jobs WHERE status IN (?, ?) AND updated <= ?", (DONE, FAILED, time.time() - self.ttl))
+        if key is not None:
+            job = await self._by_key(key)
+            if job is not None:
+                self._check_key(job, kind, payload)
+                return job, False
+        job = new_job(kind, payload, key)
+        try:
+            await self._run(
+                "INSERT INTO jobs (id, kind, payload, status, idem_key, hash, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], kind, json.dumps(payload, default=str), QUEUED, key, job["hash"], job["created"], job["updated"]),
+            )
+        except sqlite3.IntegrityError:
+            # another process submitted the same key in the meantime
+            job = await self._by_key(key)
+            self._check_key(job, kind, payload)
+            return job, False
+        return job, True
+
+    async def get(self, job_id):
+        rows, _ = await self._run(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return self._job(rows[0]) if rows else None
+
+    async def claim(self):
+        while True:
+            now = time.time()
+            rows, _ = await self._run(
+                "SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_until <= ?) ORDER BY created LIMIT 1",
+                (QUEUED, RUNNING, now),
+            )
+            if not rows:
+                return None
+            job_id = rows[0][0]
+            # the WHERE clause repeats the check, so only one process wins the row
+            _, changed = await self._run(
+                "UPDATE jobs SET status = ?, updated = ?, lease_until = ? "
+                "WHERE id = ? AND (status = ? OR (status = ? AND lease_until <= ?))",
+                (RUNNING, now, now + self.lease, job_id, QUEUED, RUNNING, now),
+            )
+            if changed == 1:
+                return await self.get(job_id)
+
+    async def finish(self, job_id, result=None, error=None):
+        await self._run(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ?, lease_until = NULL WHERE id = ?",
+            (FAILED if error is not None else DONE, json.dumps(result, default=str), error, time.time(), job_id),
+        )
+
+    async def stats(self):
+        rows, _ = await self._run("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        counts.update(dict(rows))
+        return counts
+
+    async def close(self):
+        self._db.close()
+
+
+async def run_worker(queue: JobQueue, handlers: Dict[str, JobHandler]) -> None:
+    """
+    Take jobs off `queue` until cancelled, running each with the handler for its kind.
+    """
+    while True:
+        job = await queue.next_job()
+        logger.info("Job %s (%s) started", job["id"], job["kind"])
+        try:
+            handler = handlers.get(job["kind"])
+            if handler is None:
+                raise ValueError(f"no handler for job kind {job['kind']!r}")
+            result = await handler(job["payload"])
+        except Exception as e:
+            logger.error("Job %s failed: %s", job["id"], e)
+            await queue.finish(job["id"], error=str(e) or type(e).__name__)
+        else:
+            await queue.finish(job["id"], result=result)
+            logger.info("Job %s done", job["id"])
+
+
+def make_job_queue(kind: str = JOB_QUEUE, path: str = JOB_QUEUE_PATH, workers: int = JOB_WORKERS) -> JobQueue:
+    """
+    Build the queue selected by JOB_QUEUE / JOB_QUEUE_PATH. `workers` is the number
+    of in-process workers; the memory queue cannot be served from anywhere else.
+    """
+    if kind == "memory":
+        if workers <= 0:
+            raise ValueError("JOB_QUEUE=memory needs JOB_WORKERS > 0; use JOB_QUEUE=sqlite with jobworker.py")
+        return MemoryJobQueue()
+    if kind == "sqlite":
+        return SqliteJobQueue(path)
+    raise ValueError(f"Unknown JOB_QUEUE {kind!r}")
@@ -0,0 +1,38 @@
+"""
+Run queued /session/start jobs in a separate process.
+
+The API and the workers must share the job queue and the session store:
+
+    JOB_QUEUE=sqlite JOB_WORKERS=0 SESSION_STORE=sqlite SESSION_STORE_URL=sessions.sqlite3 uvicorn server:app
+    JOB_QUEUE=sqlite SESSION_STORE=sqlite SESSION_STORE_URL=sessions.sqlite3 python jobworker.py --concurrency 4
+"""
+import argparse
+import asyncio
+
+from jobqueue import JOB_QUEUE, run_worker
+from mylogger import logger
+
+
+async def main(concurrency: int) -> None:
+    # the handlers, caches and stores are the API's own, configured from the same env
+    import server
+
+    logger.info("Job worker running %d jobs at a time", concurrency)
+    try:
+        await asyncio.gather(*(run_worker(server.JOBS, server.JOB_HANDLERS) for _ in range(concurrency)))
+    finally:
+        await server.close_clients()
+        await server.SESSIONS.close()
+        await server.JOBS.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+    if JOB_QUEUE != "sqlite":
+        parser.error("a separate worker needs JOB_QUEUE=sqlite, the memory queue lives inside the API process")
+    try:
+        asyncio.run(main(args.concurrency))
+    except KeyboardInterrupt:
+        pass
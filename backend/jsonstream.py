@@ -0,0 +1,108 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+_SCALAR_END = ",}]" + _WHITESPACE
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "start", "key", "index", "expect_key")
+
+    def __init__(self, kind: str, path: tuple, start: int):
+        self.kind = kind
+        self.path = path
+        self.start = start
+        self.key = None
+        self.index = 0
+        self.expect_key = kind == "{"
+
+
+class JsonStreamParser:
+    """
+    Incremental JSON scanner for model output that arrives in chunks.
+
+    feed() returns (path, value) for every value completed by the new text whose
+    path is at most `max_depth` long, e.g. (("short_response",), "No, ...") or
+    (("final_answer", "daily_threats", 0), {...}). Deeper values are skipped
+    without being decoded, so the cost stays linear in the output size.
+    """
+
+    def __init__(self, max_depth: int = 1):
+        self.max_depth = max_depth
+        self.buf = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._scalar_start: Optional[int] = None
+        self._value_path: tuple = ()
+
+    def _path(self) -> tuple:
+        if not self._stack:
+            return ()
+        top = self._stack[-1]
+        return top.path + ((top.key,) if top.kind == "{" else (top.index,))
+
+    def _wanted(self, path: tuple) -> bool:
+        return len(path) <= self.max_depth
+
+    def feed(self, text: str) -> List[Tuple[tuple, Any]]:
+        self.buf += text
+        events: List[Tuple[tuple, Any]] = []
+        buf = self.buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._stack[-1].key = json.loads(buf[self._string_start:i + 1])
+                    elif self._wanted(self._value_path):
+                        events.append((self._value_path, json.loads(buf[self._string_start:i + 1])))
+                i += 1
+                continue
+
+            if self._scalar_start is not None:
+                if c not in _SCALAR_END:
+                    i += 1
+                    continue
+                if self._wanted(self._value_path):
+                    events.append((self._value_path, json.loads(buf[self._scalar_start:i])))
+                self._scalar_start = None
+                # fall through: the delimiter itself still needs handling
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                top = self._stack[-1] if self._stack else None
+                self._string_is_key = top is not None and top.kind == "{" and top.expect_key
+                if not self._string_is_key:
+                    self._value_path = self._path()
+            elif c == "{" or c == "[":
+                self._stack.append(_Frame(c, self._path(), i))
+            elif c == "}" or c == "]":
+                frame = self._stack.pop()
+                if self._wanted(frame.path):
+                    events.append((frame.path, json.loads(buf[frame.start:i + 1])))
+            elif c == ":":
+                self._stack[-1].expect_key = False
+            elif c == ",":
+                top = self._stack[-1]
+                if top.kind == "{":
+                    top.expect_key = True
+                else:
+                    top.index += 1
+            elif c not in _WHITESPACE:
+                self._scalar_start = i
+                self._value_path = self._path()
+            i += 1
+        self._pos = i
+        return events
@@ -0,0 +1,81 @@
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import resources as RESOURCE_TEMPLATE
+from mylogger import logger
+
+# (category, item) per ledger slot, in the order of config.resources
+RESOURCE_KEYS: List[Tuple[str, str]] = [(c, item) for c, items in RESOURCE_TEMPLATE.items() for item in items]
+RESOURCE_NAMES: List[str] = [item for _, item in RESOURCE_KEYS]
+SLOT_OF: Dict[str, int] = {item: i for i, item in enumerate(RESOURCE_NAMES)}
+
+
+class ResourceLedger:
+    """
+    Resource counts of one session as a flat integer array indexed like RESOURCE_KEYS.
+
+    The model reports signed changes ({"Ambulances": -2, "Rescue Boats": 3});
+    `apply` validates them, keeps every count non-negative and records the turn
+    in `history`. `to_resources` rebuilds the nested {category: {item: n}} shape.
+    """
+
+    def __init__(self, counts: Optional[List[int]] = None, history: Optional[List[Dict[str, Any]]] = None):
+        self.counts = array("q", counts if counts is not None else [0] * len(RESOURCE_KEYS))
+        self.history: List[Dict[str, Any]] = history if history is not None else []
+
+    @classmethod
+    def from_resources(cls, resources: Optional[Dict[str, Any]]) -> "ResourceLedger":
+        ledger = cls()
+        for category, items in (resources or {}).items():
+            if not isinstance(items, dict):
+                continue
+            for item, qty in items.items():
+                slot = SLOT_OF.get(item)
+                if slot is None or not isinstance(qty, (int, float)):
+                    logger.info("Ledger ignores %s / %s = %r", category, item, qty)
+                    continue
+                ledger.counts[slot] = max(0, int(qty))
+        return ledger
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "ResourceLedger":
+        return cls(state["counts"], state["history"])
+
+    def to_state(self) -> Dict[str, Any]:
+        """JSON-serializable form for the session store."""
+        return {"counts": self.counts.tolist(), "history": self.history}
+
+    def copy(self) -> "ResourceLedger":
+        return ResourceLedger(self.counts.tolist(), list(self.history))
+
+    def to_resources(self) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        for (category, item), qty in zip(RESOURCE_KEYS, self.counts):
+            out.setdefault(category, {})[item] = qty
+        return out
+
+    def apply(self, changes: Any, record: bool = True) -> Dict[str, Any]:
+        """
+        Apply the model's signed changes ({"Ambulances": -2, ...}). Unknown resources
+        and non-integer changes are rejected; a change that would take a count below
+        zero is clipped. Returns {"applied": {name: change}, "clipped": {...}, "rejected": {...}}.
+        """
+        applied, clipped, rejected = {}, {}, {}
+        for name, delta in (changes.items() if isinstance(changes, dict) else []):
+            slot = SLOT_OF.get(name)
+            if slot is None or isinstance(delta, bool) or not isinstance(delta, (int, float)) or delta != int(delta):
+                rejected[str(name)] = delta
+                continue
+            before = self.counts[slot]
+            after = max(0, before + int(delta))
+            self.counts[slot] = after
+            if after - before != delta:
+                clipped[name] = int(delta)
+            if after != before:
+                applied[name] = after - before
+        if rejected:
+            logger.warning("Ledger rejected resource changes: %s", rejected)
+        result = {"applied": applied, "clipped": clipped, "rejected": rejected}
+        if record:
+            self.history.append({"turn": len(self.history) + 1, **result, "counts": self.counts.tolist()})
+        return result
@@ -0,0 +1,150 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# seconds; covers cache hits up to multi-minute scenario loops
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            row[bisect.bisect_left(self.buckets, value)] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, row in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {row[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ── stage latencies ─────────────────────────────────────────────
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "llm_request_duration_seconds", "Duration of OpenAI calls.", ["model", "stream", "stage"]))
+SEARCH_LATENCY = REGISTRY.register(Histogram(
+    "search_request_duration_seconds", "Duration of web search calls, including cache lookups.", ["cache"]))
+SCENE_ROUND_LATENCY = REGISTRY.register(Histogram(
+    "scene_round_duration_seconds", "Duration of one multiagent_scene round.", ["kind"]))
+EXCEL_PARSE_LATENCY = REGISTRY.register(Histogram(
+    "excel_parse_duration_seconds", "Time spent turning one uploaded workbook into text."))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Total endpoint latency.", ["method", "path", "status"]))
+
+# ── volumes ─────────────────────────────────────────────────────
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens used by OpenAI calls.", ["model", "kind", "stage"]))
+LLM_CACHE_RATIO = REGISTRY.register(Histogram(
+    "llm_prompt_cache_ratio", "Share of each call's prompt tokens served from the provider's prefix cache.",
+    ["model"], buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)))
+SPECULATIONS = REGISTRY.register(Counter(
+    "speculative_analyses_total", "Speculative analyses of the suggested alternative, by outcome.", ["outcome"]))
+SPECULATION_WASTED_TOKENS = REGISTRY.register(Counter(
+    "speculative_wasted_tokens_total", "Tokens spent on speculative analyses that were not used."))
+SEARCH_QUERIES = REGISTRY.register(Counter(
+    "search_queries_total", "Web search queries issued.", ["outcome"]))
+SCENE_ROUNDS = REGISTRY.register(Histogram(
+    "scene_rounds_per_scenario", "Loop iterations needed per generated scenario.", buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15)))
+
+# ── point-in-time values, refreshed on every scrape ─────────────
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "active_sessions", "Sessions currently held by the session store."))
+SESSION_STORE_BYTES = REGISTRY.register(Gauge(
+    "session_store_bytes", "Serialized size of all stored sessions, if the backend reports it."))
+CACHE_LOOKUPS = REGISTRY.register(Gauge(
+    "cache_lookups", "Lookups per cache and result since start.", ["cache", "result"]))
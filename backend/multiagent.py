@@ -1,44 +1,162 @@
-from aihandler import call_openai_api, call_tavilli_api
-from config import GENERATE_INSIGHTS, generate_insights_json_schema, ANALYZE_INSIGHTS, ANALYZE_INSIGHTS_JSON_SCHEMA
+from aihandler import call_openai_api, search_many, stream_openai_api, track_usage, SEARCH_TIMEOUT
+from budget import ScenarioBudget, FINAL_ROUND_MESSAGE
+from config import (GENERATE_INSIGHTS, GENERATE_INSIGHTS_LOCATION, generate_insights_json_schema,
+                    SCENE_PLAN_JSON_SCHEMA, SCENE_PLAN_MESSAGE,
+                    ANALYZE_INSIGHTS, ANALYZE_INSIGHTS_REQUEST, ANALYZE_INSIGHTS_JSON_SCHEMA)
 import asyncio
 import json
+from condense import condense_results
+from jsonstream import JsonStreamParser
+from ledger import ResourceLedger
+from mylogger import logger
+from metrics import SCENE_ROUND_LATENCY, SCENE_ROUNDS
+from routing import split_scene
+import time
 from tools import dict_to_str
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Awaitable, Callable, Optional
 
+# on_event(name, data) – progress callback used by the streaming endpoints
+EventCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
 
-async def multiagent_scene(location: str) -> Dict[str, Any]:
+
+async def _ask_scene(conversation: List[Dict[str, Any]], on_event: Optional[EventCallback],
+                     sent_days: set) -> Dict[str, Any]:
+    """
+    One scene round. Without a callback this is a plain call; with one, the reply is
+    streamed and each daily threat is reported as soon as it has been generated.
+    Days whose index is in `sent_days` were reported by an earlier round and are
+    skipped; the ones reported now are added to it.
+    """
+    if on_event is None:
+        msg = await call_openai_api(conversation, json_schema=generate_insights_json_schema, stage="scene_synthesis")
+        return json.loads(msg.message.content)
+
+    parser = JsonStreamParser(max_depth=3)
+    async for delta in stream_openai_api(conversation, json_schema=generate_insights_json_schema,
+                                         stage="scene_synthesis"):
+        for path, value in parser.feed(delta):
+            if path == ("use_internet",) and not value:
+                await on_event("synthesis_started", {})
+            elif len(path) == 3 and path[:2] == ("final_answer", "daily_threats") and path[2] not in sent_days:
+                sent_days.add(path[2])
+                await on_event("threat", value)
+    return json.loads(parser.buf)
+
+
+async def _plan_scene(conversation: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    A planning-only round on the scene_plan model: use_internet and search_queries,
+    no final_answer. The instruction goes last, so the cached prefix is unchanged.
+    """
+    prompt = conversation + [{"role": "user", "content": SCENE_PLAN_MESSAGE}]
+    msg = await call_openai_api(prompt, json_schema=SCENE_PLAN_JSON_SCHEMA, stage="scene_plan")
+    return json.loads(msg.message.content)
+
+
+async def multiagent_scene(location: str, on_event: Optional[EventCallback] = None, budget: Optional[ScenarioBudget] = None) -> Dict[str, Any]:
     """
     Drive the plan-search-synthesise loop until a complete final_answer is produced.
     Returns the parsed JSON dict that matches generate_insights_json_schema.
+    If `on_event` is given, progress is reported through it as the loop runs.
+    The loop stops at the limits of `budget` (defaults from env); pass your own
+    ScenarioBudget to read the usage afterwards.
     """
-    GENERATE_SCENE_PROMPT = GENERATE_INSIGHTS.format(location=location)
-    conversation = [{"role": "system", "content": GENERATE_SCENE_PROMPT}]
+    budget = budget or ScenarioBudget()
+    with track_usage() as usage:
+        result = await _scene_loop(location, on_event, budget, usage)
+    SCENE_ROUNDS.observe(budget.rounds)
+    return result
+
+
+async def _scene_loop(location: str, on_event: Optional[EventCallback], budget: ScenarioBudget, usage: Dict[str, int]):
+    # static instructions first and the location after them, so every scene
+    # request starts with the same prefix the provider can cache
+    conversation = [
+        {"role": "system", "content": GENERATE_INSIGHTS},
+        {"role": "user", "content": GENERATE_INSIGHTS_LOCATION.format(location=location)},
+    ]
+
+    async def emit(name: str, data: Dict[str, Any]) -> None:
+        if on_event is not None:
+            await on_event(name, data)
 
-    loop = asyncio.get_event_loop()
+    async def search_done(query: str, ok: bool) -> None:
+        await emit("search_done", {"query": query, "ok": ok})
 
+    best = {}
+    sent_days: set = set()                      # a short answer is re-synthesised; report each day once
     while True:
+        # ---------- out of budget? one last turn, no searches ----------
+        reason = None if budget.forced_final else budget.exhausted()
+        if reason is not None:
+            logger.info("Scene budget exhausted (%s) for %s, forcing final synthesis", reason, location)
+            budget.forced_final = True
+            budget.exhausted_by = reason
+            await emit("budget_exhausted", budget.usage())
+            conversation += [{"role": "user", "content": FINAL_ROUND_MESSAGE}]
+
+        budget.rounds += 1
+        round_no = budget.rounds
+        round_start = time.perf_counter()
+        await emit("round_started", {"round": round_no})
         # ---------- ask GPT ----------
-        msg = await call_openai_api(conversation, json_schema=generate_insights_json_schema)
-        response_json = json.loads(msg.message.content)
+        async def ask() -> Dict[str, Any]:
+            # with split routing a fast model plans the searches and the synthesis
+            # model is only called once no more searches are wanted
+            if split_scene() and not budget.forced_final and budget.searches_left() > 0:
+                plan = await _plan_scene(conversation)
+                if plan.get("use_internet") and plan.get("search_queries"):
+                    return plan
+            return await _ask_scene(conversation, on_event, sent_days)
+
+        # the deadline bounds the call itself, not just the start of the next round
+        try:
+            response_json = await asyncio.wait_for(
+                ask(), budget.remaining_time() if budget.forced_final else budget.research_time())
+        except asyncio.TimeoutError:
+            SCENE_ROUND_LATENCY.observe(time.perf_counter() - round_start, kind="timeout")
+            budget.tokens = usage["total_tokens"]
+            if not budget.forced_final:
+                logger.info("Scene round %d for %s ran into the deadline", round_no, location)
+                continue                        # exhausted() now reports the deadline
+            if not best:
+                raise TimeoutError(f"scene for {location} produced no answer within {budget.deadline:.0f}s")
+            return best, conversation
+        budget.tokens = usage["total_tokens"]
+        budget.cached_tokens = usage["cached_tokens"]
 
-        if response_json.get("use_internet", False):
-            # Run every query and collect results
-            search_results = {}
-            for q in response_json.get("search_queries", []):
-                search_results[q] = await call_tavilli_api(q)
+        if response_json.get("use_internet", False) and not budget.forced_final:
+            queries = response_json.get("search_queries", [])[:budget.searches_left()]
+            await emit("planning_done", {"round": round_no, "search_queries": queries})
+            for q in queries:
+                await emit("search_started", {"query": q})
 
-            print("search_results", search_results)
+            # Run every query concurrently and collect the ones that succeed
+            timeout = min(SEARCH_TIMEOUT, max(1.0, budget.research_time()))
+            search_results = await search_many(queries, timeout=timeout, on_done=search_done)
+            budget.searches += len(queries)
+
+            # dedupe and trim the raw responses before they enter the conversation,
+            # since every later round re-sends them
+            condensed, stats = condense_results(search_results)
+            logger.info("Search round %d condensed %d -> %d tokens (saved %d)",
+                        round_no, stats["raw_tokens"], stats["condensed_tokens"], stats["saved_tokens"])
+            await emit("search_condensed", {"round": round_no, **stats})
             conversation += [{
                 "role": "user",
-                "content": 'here are the results of my searches: ' + dict_to_str(search_results)
+                "content": 'here are the results of my searches: ' + condensed
             }]
+            SCENE_ROUND_LATENCY.observe(time.perf_counter() - round_start, kind="search")
             # continue → GPT will now re-enter the loop with fresh info
             continue
 
         # ---------- synthesis complete? ----------
+        SCENE_ROUND_LATENCY.observe(time.perf_counter() - round_start, kind="synthesis")
         final_ans = response_json.get("final_answer", {})
         threats   = final_ans.get("daily_threats", [])
         most_potential_threats = final_ans.get("most_potential_threat", [])
+        if len(threats) >= len(best.get("daily_threats", [])):
+            best = final_ans
         conversation += [{
             "role": "user",
             "content": 'here is the most potential threats: ' + dict_to_str(most_potential_threats)
@@ -57,47 +175,91 @@ async def multiagent_scene(location: str) -> Dict[str, Any]:
             # final = response_json.get("final_answer", {})
 
             return final_ans, conversation
+        if budget.forced_final:
+            # no more rounds allowed: hand back the most complete answer seen
+            return best, conversation
         
 
-async def multiagent_analysis(response: str, resources: list, conversation: List[Dict[str, Any]] = None, initial = bool) -> Dict[str, Any]:
+async def _ask_analysis(conversation: List[Dict[str, Any]], on_event: Optional[EventCallback]) -> Dict[str, Any]:
+    """
+    One analysis call. With a callback the reply is streamed and every top-level
+    field is reported as soon as it is complete – short_response and
+    updated_severty_score come first in the schema, so the verdict arrives early.
+    """
+    if on_event is None:
+        msg = await call_openai_api(conversation, json_schema=ANALYZE_INSIGHTS_JSON_SCHEMA, stage="analysis")
+        return json.loads(msg.message.content)
+
+    parser = JsonStreamParser(max_depth=1)
+    async for delta in stream_openai_api(conversation, json_schema=ANALYZE_INSIGHTS_JSON_SCHEMA, stage="analysis"):
+        for path, value in parser.feed(delta):
+            if path:
+                await on_event("field", {"name": path[0], "value": value})
+    return json.loads(parser.buf)
+
+
+def turn_request(response: str, resources: list, initial: bool) -> List[Dict[str, Any]]:
+    """The messages that ask for the analysis of `response` (with the instructions on the first turn)."""
+    if initial:
+        return [
+            {"role": "system", "content": ANALYZE_INSIGHTS},
+            {"role": "user", "content": ANALYZE_INSIGHTS_REQUEST.format(resources=resources, solution=response)},
+        ]
+    return [{"role": "user", "content": 'here is the how I proposed to solve the problem: ' + response}]
+
+
+def turn_summary(response: str, feedback, response_analysis, updated_severty_score) -> Dict[str, Any]:
+    """The message that records `response` and its analysis in the conversation."""
+    return {
+        "role": "user",
+        "content": 'here is the how I proposed to solve the problem: ' + response + ' and here is the feedback: ' + dict_to_str(feedback) + ' and here is the analysis: ' + dict_to_str(response_analysis) + ' so new severity score is: ' + dict_to_str(updated_severty_score) }
+
+
+async def multiagent_analysis(response: str, resources: list, conversation: List[Dict[str, Any]] = None, initial = bool, on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
     """
     Run the multiagent analysis loop until a complete final_answer is produced.
     Returns the parsed JSON dict that matches generate_insights_json_schema.
+    If `on_event` is given, the answer fields are reported through it as they stream in.
     """
+    # the caller's list is left alone; the messages this turn adds are returned as new_messages
+    prompt = list(conversation)
+    new_messages = turn_request(response, resources, initial)
     if initial:
-        ANALYZE_INSIGHTS_PROMPT = ANALYZE_INSIGHTS.format(solution=response, resources=resources, conversation=conversation)
-        conversation += [{"role": "system", "content": ANALYZE_INSIGHTS_PROMPT}]
-    else:
-        conversation += [{
-            "role": "user",
-            "content": 'here is the how I proposed to solve the problem: ' + response
-        }]
-    msg = await call_openai_api(conversation, json_schema=ANALYZE_INSIGHTS_JSON_SCHEMA)
-    
-    response_json = json.loads(msg.message.content)
+        # the static instructions go right after the leading system prompt, so all
+        # sessions share one cacheable prefix; resources and solution go last
+        at = next((i for i, m in enumerate(prompt) if m["role"] != "system"), len(prompt))
+        prompt.insert(at, new_messages[0])
+    prompt.append(new_messages[-1])
+    response_json = await _ask_analysis(prompt, on_event)
 
     short_response = response_json.get("short_response", {})
     feedback = response_json.get("feedback", {})
     response_analysis = response_json.get("response_analysis", {})
-    updated_resources = response_json.get("updated_resources", {})
+    # the model only lists signed changes; rebuild the full resource trees from them
+    resource_changes = response_json.get("resource_changes", {})
+    ledger = ResourceLedger.from_resources(resources)
+    ledger.apply(resource_changes, record=False)
+    updated_resources = ledger.to_resources()
     alternative_solutions = response_json.get("alternative_solutions", {})
+    if isinstance(alternative_solutions, dict):
+        needed = ResourceLedger.from_resources(resources)
+        needed.apply(alternative_solutions.get("resource_changes", {}), record=False)
+        alternative_solutions["resources_needed"] = needed.to_resources()
     updated_severty_score = response_json.get("updated_severty_score", {})  
     follow_up_threat = response_json.get("follow_up_threat", {})
 
-    updated_conversation = conversation + [{
-        "role": "user",
-        "content": 'here is the how I proposed to solve the problem: ' + response + ' and here is the feedback: ' + dict_to_str(feedback) + ' and here is the analysis: ' + dict_to_str(response_analysis) + ' so new severity score is: ' + dict_to_str(updated_severty_score) }]
-
+    new_messages.append(turn_summary(response, feedback, response_analysis, updated_severty_score))
 
     return {
         "short_response": short_response,
         "feedback": feedback,
         "response_analysis": response_analysis,
+        "resource_changes": resource_changes,
         "updated_resources": updated_resources,
         "alternative_solutions": alternative_solutions,
         "updated_severty_score": updated_severty_score,
         "follow_up_threat": follow_up_threat,
-        "updated_conversation": updated_conversation
+        "new_messages": new_messages
     }
 
 
@@ -134,7 +296,7 @@ if __name__ == "__main__":
         updated_severty_score = final.get("updated_severty_score", {})
         severity_score = updated_severty_score.get("severity_score", 0)
         resources = final.get("updated_resources", {})
-        conversation = final.get("updated_conversation", [])
+        conversation = conversation + final.get("new_messages", [])
         print("final", final)
         print("severity_score", severity_score)
         if int(severity_score) < 5:
@@ -142,7 +304,6 @@ if __name__ == "__main__":
             print(final)
             follow_up_threat = final.get("follow_up_threat", {})
             follow_up_threat_name = follow_up_threat.get("name", "")
-            conversation = final.get("updated_conversation", [])
             resources = final.get("updated_resources", {})
 
             if follow_up_threat_name:
@@ -0,0 +1,115 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict
+
+# share of every limiter's slots that batch work may hold at once
+BATCH_SHARE = float(os.getenv("BATCH_SHARE", "0.5"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# lane of the work running in the current context; tasks inherit it from their creator
+_lane: ContextVar[str] = ContextVar("priority_lane", default=INTERACTIVE)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+@contextmanager
+def lane(name: str):
+    """
+    Run the block (and every task started inside it) in the given lane.
+
+        with lane(BATCH):
+            await multiagent_scene(location)
+    """
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class PriorityLimiter:
+    """
+    A semaphore with two lanes. Waiting interactive callers are always served
+    before waiting batch callers, and batch callers never hold more than
+    `batch_share` of the slots, so a large batch cannot starve interactive users.
+    """
+
+    def __init__(self, limit: int, batch_share: float = BATCH_SHARE):
+        self.limit = max(1, limit)
+        self.batch_limit = max(1, int(self.limit * batch_share))
+        self.active = 0
+        self.active_batch = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {INTERACTIVE: deque(), BATCH: deque()}
+
+    def _has_room(self, lane: str) -> bool:
+        if self.active >= self.limit:
+            return False
+        if lane == BATCH:
+            return self.active_batch < self.batch_limit and not self._waiters[INTERACTIVE]
+        return True
+
+    def _take(self, lane: str) -> None:
+        self.active += 1
+        if lane == BATCH:
+            self.active_batch += 1
+
+    def _release(self, lane: str) -> None:
+        self.active -= 1
+        if lane == BATCH:
+            self.active_batch -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        for lane in (INTERACTIVE, BATCH):
+            waiters = self._waiters[lane]
+            while waiters and self._has_room(lane):
+                fut = waiters.popleft()
+                if not fut.done():
+                    self._take(lane)
+                    fut.set_result(None)
+
+    async def _acquire(self, lane: str) -> None:
+        if not self._waiters[lane] and self._has_room(lane):
+            self._take(lane)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # the slot was handed over just as we were cancelled
+                self._release(lane)
+            else:
+                # _wake may already have popped (and skipped) the cancelled future
+                if fut in self._waiters[lane]:
+                    self._waiters[lane].remove(fut)
+                self._wake()
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one slot for the block, queued in the current context's lane."""
+        lane = current_lane()
+        await self._acquire(lane)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "batch_limit": self.batch_limit,
+            "active": self.active,
+            "active_batch": self.active_batch,
+            "waiting_interactive": len(self._waiters[INTERACTIVE]),
+            "waiting_batch": len(self._waiters[BATCH]),
+        }
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict
+
+from mylogger import logger
+
+if TYPE_CHECKING:
+    # httpx is only imported once recording is switched on (see event_hooks)
+    import httpx
+
+# when set, every OpenAI / Tavily exchange is appended to <dir>/<service>.jsonl
+AI_RECORD_DIR = os.getenv("AI_RECORD_DIR", "")
+
+# fields that decide the answer; anything else (stream flags, ids) is ignored in keys
+_KEY_FIELDS = {
+    "openai": ("model", "messages", "response_format"),
+    "tavily": ("query", "search_depth", "max_results", "days", "topic"),
+}
+
+
+def request_key(service: str, body: Dict[str, Any]) -> str:
+    """
+    Stable key of a request body, shared by the recorder and the replay stub.
+    """
+    relevant = {k: body.get(k) for k in _KEY_FIELDS[service]}
+    raw = json.dumps(relevant, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Recorder:
+    """
+    httpx response hook that writes request/response pairs as JSON lines.
+
+    Streamed chat completions are stored as the assembled message so the
+    replay stub can serve them either streamed or in one piece.
+    """
+
+    def __init__(self, directory: str, service: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{service}.jsonl")
+        self.service = service
+        self._lock = threading.Lock()
+        self._tee = _tee_stream_class()
+
+    async def on_request(self, request: "httpx.Request") -> None:
+        request.extensions["recorder_start"] = time.perf_counter()
+
+    async def on_response(self, response: "httpx.Response") -> None:
+        request = response.request
+        try:
+            body = json.loads(request.content or b"{}")
+        except ValueError:
+            return
+        if body.get("stream"):
+            # tee the chunks as the caller consumes them; reading here would buffer the stream
+            response.stream = self._tee(response.stream, lambda raw: self._write_stream(response, body, raw))
+            return
+        await response.aread()
+        self._write(request, body, response.status_code, response.text)
+
+    def _write_stream(self, response: "httpx.Response", body: Dict[str, Any], raw: bytes) -> None:
+        import httpx
+
+        # the raw bytes are still content-encoded; let httpx decode them
+        text = httpx.Response(response.status_code, headers=response.headers, content=raw).text
+        self._write(response.request, body, response.status_code, json.dumps(_assemble_stream(text)))
+
+    def _write(self, request: "httpx.Request", body: Dict[str, Any], status: int, text: str) -> None:
+        elapsed = time.perf_counter() - request.extensions.get("recorder_start", time.perf_counter())
+        entry = {
+            "key": request_key(self.service, body),
+            "request": body,
+            "status": status,
+            "response": text,
+            "latency": round(elapsed, 4),
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        logger.info("Recorded %s exchange %s", self.service, entry["key"][:12])
+
+    def hooks(self) -> Dict[str, list]:
+        return {"request": [self.on_request], "response": [self.on_response]}
+
+
+# defined on first use, so importing this module does not pull in httpx
+@lru_cache(maxsize=None)
+def _tee_stream_class() -> type:
+    import httpx
+
+    class _TeeStream(httpx.AsyncByteStream):
+        """
+        Pass a response stream through unchanged and hand the bytes to `done` once
+        it has been read to the end; a stream closed early is not recorded.
+        """
+
+        def __init__(self, stream: httpx.AsyncByteStream, done: Callable[[bytes], None]):
+            self._stream = stream
+            self._done = done
+            self._chunks: list = []
+            self._complete = False
+
+        async def __aiter__(self):
+            async for chunk in self._stream:
+                self._chunks.append(chunk)
+                yield chunk
+            self._complete = True
+
+        async def aclose(self) -> None:
+            await self._stream.aclose()
+            if self._complete:
+                self._complete = False          # aclose may run more than once
+                self._done(b"".join(self._chunks))
+
+    return _TeeStream
+
+
+def _assemble_stream(sse_text: str) -> Dict[str, Any]:
+    """
+    Rebuild a chat.completion body from the SSE chunks of a streamed reply.
+    """
+    content, usage, model = [], None, None
+    for line in sse_text.splitlines():
+        if not line.startswith("data: ") or line == "data: [DONE]":
+            continue
+        chunk = json.loads(line[6:])
+        model = chunk.get("model", model)
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices", []):
+            content.append(choice.get("delta", {}).get("content") or "")
+    return {
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(content)}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
+
+
+def event_hooks(service: str) -> Dict[str, list]:
+    """
+    httpx event hooks for the shared clients; empty unless AI_RECORD_DIR is set.
+    """
+    if not AI_RECORD_DIR:
+        return {}
+    return Recorder(AI_RECORD_DIR, service).hooks()
@@ -0,0 +1,33 @@
+import os
+from typing import Dict
+
+# Model per pipeline stage, set per deployment. OPENAI_MODEL is the strong
+# (reasoning) model, OPENAI_FAST_MODEL the cheap one for the mechanical stages;
+# MODEL_<STAGE> (e.g. MODEL_SCENE_PLAN) pins a single stage to any model.
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "o4-mini-2025-04-16")
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4.1-mini-2025-04-14")
+
+# stage -> default model
+STAGES = {
+    "scene_plan": OPENAI_FAST_MODEL,        # deciding whether to search, writing the queries
+    "scene_synthesis": OPENAI_MODEL,        # the 7-day outlook
+    "analysis": OPENAI_MODEL,               # solve analysis and severity scoring
+    "excel": OPENAI_FAST_MODEL,             # resource extraction from workbooks
+}
+
+MODEL_ROUTES: Dict[str, str] = {stage: os.getenv("MODEL_" + stage.upper()) or default
+                                for stage, default in STAGES.items()}
+
+
+def model_for(stage: str) -> str:
+    """The model configured for `stage`; OPENAI_MODEL for stages without a route."""
+    return MODEL_ROUTES.get(stage) or OPENAI_MODEL
+
+
+def split_scene() -> bool:
+    """
+    True when scene planning and synthesis use different models. The scene loop
+    then plans with its own small call and only the synthesis goes to the
+    synthesis model; otherwise one call per round does both, as before.
+    """
+    return model_for("scene_plan") != model_for("scene_synthesis")
@@ -0,0 +1,173 @@
+import asyncio
+import copy
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from mylogger import logger
+
+
+# finished scenarios are reused within the same time bucket (seconds, 0 disables)
+SCENARIO_CACHE_BUCKET = float(os.getenv("SCENARIO_CACHE_BUCKET", "600"))
+SCENARIO_CACHE_SIZE = int(os.getenv("SCENARIO_CACHE_SIZE", "256"))
+
+
+def normalize_location(location: str) -> str:
+    """
+    Canonical form of a location string: "  Valencia ,Spain " -> "valencia, spain".
+    """
+    location = re.sub(r"\s*,\s*", ", ", location.casefold())
+    return re.sub(r"\s+", " ", location).strip(" ,.")
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The work runs in its own task, so a caller that disconnects does not
+    cancel the computation the other callers are waiting on.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """The task computing `key`: the one in flight, or fn() started now."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        else:
+            logger.info("Joining in-flight computation for %s", key)
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        return await asyncio.shield(self.start(key, fn))
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class EventFanout:
+    """
+    Progress events of one computation, passed on to every subscriber. A late
+    subscriber first receives the events it missed, then the live ones.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.subscribers = []
+
+    async def emit(self, name: str, data: Any) -> None:
+        self.events.append((name, data))
+        for fn in list(self.subscribers):
+            try:
+                await fn(name, data)
+            except Exception as e:
+                # one broken listener must not fail the computation the others share
+                logger.warning("Dropping event listener after %r", e)
+                self.unsubscribe(fn)
+
+    async def subscribe(self, fn: Callable[[str, Any], Awaitable[None]]) -> None:
+        i = 0
+        while i < len(self.events):
+            await fn(*self.events[i])
+            i += 1
+        # no await between catching up and registering, so no event falls in between
+        self.subscribers.append(fn)
+
+    def unsubscribe(self, fn) -> None:
+        if fn in self.subscribers:
+            self.subscribers.remove(fn)
+
+
+class ScenarioCache:
+    """
+    Share multiagent_scene results between sessions for the same location.
+
+    Identical in-flight requests wait on one computation, and finished
+    (final_ans, conversation, ...) results are reused until the time bucket rolls over.
+    Callers always receive their own deep copy, since sessions mutate the conversation.
+    A computation started by a caller with `on_event` reports its progress, and
+    callers that join it with `on_event` receive the same events.
+    """
+
+    def __init__(self, bucket_seconds: float = SCENARIO_CACHE_BUCKET, max_entries: int = SCENARIO_CACHE_SIZE):
+        self.bucket_seconds = bucket_seconds
+        self.max_entries = max_entries
+        self._done: "OrderedDict[Tuple[str, int], tuple]" = OrderedDict()
+        self._flight = SingleFlight()
+        self._fanouts: Dict[Tuple[str, int], EventFanout] = {}
+        self.hits = 0
+        self.joins = 0
+        self.misses = 0
+
+    def _key(self, location: str) -> Tuple[str, int]:
+        bucket = int(time.time() // self.bucket_seconds) if self.bucket_seconds > 0 else 0
+        return normalize_location(location), bucket
+
+    async def get(self, location: str, compute: Callable[..., Awaitable[tuple]],
+                  on_event: Optional[Callable[[str, Any], Awaitable[None]]] = None) -> tuple:
+        """
+        The scenario for `location`: cached, joined in flight, or `compute(location)`.
+        With `on_event`, a new computation runs as compute(location, on_event=...) and
+        its events (from the start) go to every caller that passed one; a cached
+        result or one computed without events is returned without any.
+        """
+        key = self._key(location)
+        result = self._done.get(key)
+        if result is not None:
+            self.hits += 1
+            self._done.move_to_end(key)
+            return copy.deepcopy(result)
+
+        if key in self._flight:
+            self.joins += 1
+        else:
+            self.misses += 1
+            if on_event is not None:
+                self._fanouts[key] = EventFanout()
+        task = self._flight.start(key, lambda: self._compute(key, location, compute))
+        fanout = self._fanouts.get(key) if on_event is not None else None
+        try:
+            if fanout is not None:
+                await fanout.subscribe(on_event)
+            result = await asyncio.shield(task)
+        finally:
+            if fanout is not None:
+                fanout.unsubscribe(on_event)
+        return copy.deepcopy(result)
+
+    def _store(self, key, result) -> None:
+        if self.bucket_seconds <= 0:
+            return
+        self._done[key] = result
+        # drop entries from earlier buckets, then trim to size
+        for old in [k for k in self._done if k[1] != key[1]]:
+            del self._done[old]
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    async def _compute(self, key, location, compute):
+        fanout = self._fanouts.get(key)
+        try:
+            result = await (compute(location, on_event=fanout.emit) if fanout else compute(location))
+        finally:
+            self._fanouts.pop(key, None)
+        self._store(key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "joins": self.joins,
+            "misses": self.misses,
+            "cached": len(self._done),
+            "in_flight": len(self._flight),
+        }
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from mylogger import logger
+
+
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", os.path.join(tempfile.gettempdir(), "komorebi_search_cache.sqlite3"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+
+# how many writes between sweeps of expired rows on disk
+_PURGE_EVERY = 256
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a search string: case-folded, single-spaced, without surrounding punctuation.
+    """
+    query = re.sub(r"\s+", " ", query.casefold()).strip()
+    return query.strip(" \"'.,;:!?")
+
+
+def make_key(query: str, params: Dict[str, Any]) -> str:
+    """
+    Cache key for a search: the normalized query plus the payload parameters that change the answer.
+    """
+    raw = json.dumps([normalize_query(query), params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """
+    Two-tier TTL cache for search responses.
+
+    The first tier is an in-process LRU; the second is a SQLite file in WAL mode,
+    so entries survive restarts and are shared by every worker on the host.
+    Pass path=None to keep the cache in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    # ── memory tier ─────────────────────────────────────────────
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # ── disk tier (blocking, run off the event loop) ────────────
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return row
+
+    def _disk_set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+
+    # ── public API ──────────────────────────────────────────────
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self._db is not None:
+            try:
+                row = await asyncio.to_thread(self._disk_get, key, now)
+            except sqlite3.Error as e:
+                logger.warning("Search cache read failed: %s", e)
+                row = None
+            if row is not None:
+                value, expires_at = row
+                self._memory_set(key, value, expires_at)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl
+        self._memory_set(key, value, expires_at)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_set, key, value, expires_at)
+            except sqlite3.Error as e:
+                # the memory tier still holds the entry; a locked file is not fatal
+                logger.warning("Search cache write failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
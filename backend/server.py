@@ -1,24 +1,41 @@
 # backend.py
-import uuid, asyncio, json
+import uuid, asyncio, json, time, os, tempfile
+from contextlib import asynccontextmanager
 from typing import Dict, Any, Optional, List
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import File, UploadFile, status
-import pandas as pd
-import io   
+from fastapi import File, UploadFile, status, Request, Header, Query
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 
 # ── your existing helpers ───────────────────────────────────────
 from aihandler import call_openai_api, call_tavilli_api, excel_str_to_resources        # noqa
+from aihandler import close_clients, get_search_cache, get_openai_client, limiter_stats
+from mylogger import logger
 from config    import (GENERATE_INSIGHTS,
                        generate_insights_json_schema,
                        ANALYZE_INSIGHTS,
-                       ANALYZE_INSIGHTS_JSON_SCHEMA)
+                       ANALYZE_INSIGHTS_JSON_SCHEMA,
+                       resources as DEFAULT_RESOURCES)
 from tools     import dict_to_str                                # noqa
 
+from scenariocache import ScenarioCache
+from conversation import ConversationManager, count_tokens
+from convlog import ConversationLog
+from sessionstore import make_session_store, SessionBusy, session_size
+from budget import ScenarioBudget
+from excelparse import merge_resources
+from excelio import parse_workbook, get_pool, read_tsv, remove_tsv, shutdown_pool, WorkbookRejected, EXCEL_MAX_BYTES
+from priority import lane, BATCH
+from speculation import Speculator
+from ledger import ResourceLedger
+from compression import CompressionMiddleware
+from jobqueue import make_job_queue, run_worker, IdempotencyConflict, JOB_WORKERS, FINISHED
+import metrics
+
 # ── the two agent functions (unchanged except minor tweaks) ─────
-from multiagent import multiagent_scene, multiagent_analysis        # assume you moved them to agents.py
+from multiagent import multiagent_scene, multiagent_analysis, turn_request, turn_summary        # assume you moved them to agents.py
 
 
 # ── pydantic request / response models ──────────────────────────
@@ -30,6 +47,11 @@ class StartResponse(BaseModel):
     session_id: str
     threats: Dict[str, Any]
     conversation: List[Dict[str, Any]]
+    budget: Optional[Dict[str, Any]] = None     # rounds / searches / time / tokens used
+
+class BatchRequest(BaseModel):
+    locations: List[str]
+    resources: Optional[Dict[str, Any]] = None
 
 class SolveRequest(BaseModel):
     session_id: str
@@ -40,12 +62,46 @@ class SolveResponse(BaseModel):
     updated_resources: Dict[str, Any]
     follow_up_threat: Optional[Dict[str, Any]] = None
     analysis: Dict[str, Any]
+    precomputed: bool = False                   # answered from the speculative analysis
+    conversation: Optional[Dict[str, Any]] = None   # rev / total / stable of the stored conversation
 
 class ExcelExtractResponse(BaseModel):
     Dict[str, Any]
 
 # ── FastAPI app setup ───────────────────────────────────────────
-app = FastAPI(title="Flood-Response Multi-Agent API")
+# set when the background warm-up is done; /readyz answers 503 until then
+READY = asyncio.Event()
+STARTED = time.perf_counter()
+
+
+async def warm_up() -> None:
+    """
+    Load the heavy dependencies (openai client, token encoder) in a thread after
+    startup, so the worker can answer health checks while they import.
+    """
+    await asyncio.to_thread(get_openai_client)
+    await asyncio.to_thread(count_tokens, "warm-up")
+    READY.set()
+    logger.info("Warm-up done %.2fs after import", time.perf_counter() - STARTED)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_pool()      # start the Excel parse workers (they import pandas themselves)
+    warming = asyncio.create_task(warm_up())
+    workers = [asyncio.create_task(run_worker(JOBS, JOB_HANDLERS)) for _ in range(JOB_WORKERS)]
+    yield
+    warming.cancel()
+    for worker in workers:
+        worker.cancel()
+    SPECULATOR.close()
+    # release the pooled keep-alive connections of the shared clients
+    await close_clients()
+    await SESSIONS.close()
+    await JOBS.close()
+    shutdown_pool()
+
+app = FastAPI(title="Flood-Response Multi-Agent API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -53,65 +109,643 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Location"],
 )
 
-# in-memory cache:  session_id -> session dict
-SESSION: Dict[str, Any] = {}
+# brotli / gzip for JSON bodies; SSE streams are left alone
+app.add_middleware(CompressionMiddleware)
+
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    # for streaming endpoints this is the time until the response starts
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.HTTP_LATENCY.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        path=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    )
+    return response
 
+# session_id -> session dict; backend chosen by SESSION_STORE (memory | sqlite | redis)
+SESSIONS = make_session_store()
+
+# scenarios shared between sessions started for the same location
+SCENARIOS = ScenarioCache()
+
+# keeps solve prompts under CONVERSATION_TOKEN_BUDGET
+CONVERSATIONS = ConversationManager()
+
+# largest page GET /session/{id}/conversation returns
+CONVERSATION_PAGE_MAX = int(os.getenv("CONVERSATION_PAGE_MAX", "100"))
+
+# seconds between SSE keep-alive comments while the model is working
+SSE_HEARTBEAT = 10.0
+
+# pre-analyses of the alternative each solve suggests, in case it is submitted next
+SPECULATOR = Speculator()
+
+# queued /session/start jobs; JOB_QUEUE=sqlite shares them with jobworker.py processes
+JOBS = make_job_queue()
+# longest a GET /jobs/{id}?wait= long-poll is held open
+JOB_WAIT_MAX = float(os.getenv("JOB_WAIT_MAX", "30"))
+# longest a synchronous /session/start with an Idempotency-Key waits for its job
+# before answering 202 with the job id instead
+JOB_SYNC_WAIT_MAX = float(os.getenv("JOB_SYNC_WAIT_MAX", "300"))
+
+# scenarios computed at once for all /session/batch requests together
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_LOCATIONS = int(os.getenv("BATCH_MAX_LOCATIONS", "100"))
+_batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
 
-# ── ENDPOINT 1 : start a new session ────────────────────────────
-@app.post("/session/start", response_model=StartResponse)
-async def start_session(req: StartRequest):
-    threats, conversation = await multiagent_scene(req.location)
-    resources = req.location
+
+async def new_session(req: StartRequest, conversation: ConversationLog) -> str:
+    # counts live in the ledger; "resources" is its nested view for prompts and clients
+    ledger = ResourceLedger.from_resources(req.resources or DEFAULT_RESOURCES)
 
     session_id = str(uuid.uuid4())
-    SESSION[session_id] = {
+    await SESSIONS.put(session_id, {
         "conversation": conversation,
-        "resources": resources,
+        "resources": ledger.to_resources(),
+        "ledger": ledger.to_state(),
+        "severity_history": [],
+        "follow_up_threat": None,
+        "conversation_rev": 0,        # bumped on every change of the stored conversation
+        "conversation_stable": len(conversation),    # leading messages unchanged by the last change
         "initial": True       # first analysis needs system prompt
-    }
+    })
+    return session_id
+
+
+async def compute_scenario(location: str, on_event=None) -> tuple:
+    """
+    Run multiagent_scene under a fresh budget; returns (threats, conversation log, budget usage).
+    """
+    budget = ScenarioBudget()
+    threats, conversation = await multiagent_scene(location, on_event=on_event, budget=budget)
+    return threats, ConversationLog.of(conversation), budget.usage()
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(run, heartbeat: float = SSE_HEARTBEAT) -> StreamingResponse:
+    """
+    Stream the events produced by `run(emit)` as text/event-stream.
+    `run` executes as a task; it is cancelled if the client disconnects.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def emit(event: str, data: Any) -> None:
+        await queue.put((event, data))
+
+    async def worker():
+        try:
+            await run(emit)
+        except Exception as e:
+            await queue.put(("error", {"detail": str(e)}))
+        finally:
+            await queue.put(None)
+
+    async def body():
+        task = asyncio.create_task(worker())
+        try:
+            yield sse("started", {})
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield sse(*item)
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def create_session(req: StartRequest) -> StartResponse:
+    # concurrent / recent requests for the same place share one scenario; the
+    # conversation log is immutable, so all those sessions share its messages too
+    threats, conversation, usage = await SCENARIOS.get(req.location, compute_scenario)
+    session_id = await new_session(req, conversation)
 
     return StartResponse(
         session_id=session_id,
         threats=threats,
-        conversation=conversation,
+        conversation=conversation.messages(),
+        budget=usage,
     )
 
 
+async def scenario_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return (await create_session(StartRequest(**payload))).model_dump()
+
+
+JOB_HANDLERS = {"scenario": scenario_job}
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "created": job["created"],
+        "updated": job["updated"],
+        "result": job["result"],
+        "error": job["error"],
+        "status_url": f"/jobs/{job['id']}",
+    }
+
+
+# ── ENDPOINT 1 : start a new session ────────────────────────────
+@app.post("/session/start", response_model=StartResponse)
+async def start_session(
+    req: StartRequest,
+    respond_async: bool = Query(False, alias="async"),
+    prefer: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """
+    Without options the scenario is computed while the request waits.
+    With ?async=true (or "Prefer: respond-async") it is queued as a job and the
+    answer is 202 with a job id to poll at GET /jobs/{job_id}. With an
+    Idempotency-Key header, a retried request attaches to the job that key
+    already started instead of starting a new one; if that job takes longer than
+    JOB_SYNC_WAIT_MAX, the answer is the same 202 as with ?async=true.
+    """
+    respond_async = respond_async or "respond-async" in (prefer or "")
+    if not respond_async and idempotency_key is None:
+        return await create_session(req)
+
+    try:
+        job, created = await JOBS.submit("scenario", req.model_dump(), key=idempotency_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(422, str(e))
+    if not created:
+        logger.info("Idempotency key %s attached to job %s", idempotency_key, job["id"])
+
+    if not respond_async:
+        # a job that outlasts the wait is answered like ?async=true, with its id to poll
+        job = await JOBS.wait(job["id"], JOB_SYNC_WAIT_MAX)
+        if job is None:
+            raise HTTPException(500, "scenario job was lost")
+    if respond_async or job["status"] not in FINISHED:
+        return JSONResponse(
+            job_view(job),
+            status_code=200 if job["status"] in FINISHED else 202,
+            headers={"Location": f"/jobs/{job['id']}"},
+        )
+
+    if job["status"] != "done":
+        raise HTTPException(500, job.get("error") or "scenario job failed")
+    return job["result"]
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = 0):
+    """
+    Status of a queued /session/start job; with ?wait=N (seconds, at most
+    JOB_WAIT_MAX) the request is held until the job finishes or N seconds pass.
+    The result field holds the StartResponse payload once status is done.
+    """
+    wait = min(max(wait, 0.0), JOB_WAIT_MAX)
+    job = await JOBS.wait(job_id, wait) if wait else await JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job_view(job)
+
+
+@app.get("/jobs")
+async def job_stats():
+    return await JOBS.stats()
+
+
+@app.post("/session/start/stream")
+async def start_session_stream(req: StartRequest):
+    """
+    Same as /session/start, but reports progress as Server-Sent Events:
+    started, round_started, planning_done, search_started, search_done,
+    search_condensed, budget_exhausted, synthesis_started, threat (one per day) and finally result, whose data
+    is the StartResponse payload.
+    """
+    async def run(emit):
+        seen = set()
+
+        async def on_event(name: str, data: Any) -> None:
+            seen.add(name)
+            await emit(name, data)
+
+        # shares the computation of any /session/start(/stream) in flight for the
+        # same place; a joined stream first gets the events it missed
+        threats, conversation, usage = await SCENARIOS.get(req.location, compute_scenario, on_event=on_event)
+        if "threat" not in seen:
+            # cached, or computed for a request that did not stream: send the days now
+            for threat in threats.get("daily_threats", []):
+                await emit("threat", threat)
+
+        session_id = await new_session(req, conversation)
+        await emit("result", StartResponse(
+            session_id=session_id,
+            threats=threats,
+            conversation=conversation.messages(),
+            budget=usage,
+        ).model_dump())
+
+    return sse_response(run)
+
+
+@app.post("/session/batch")
+async def start_batch(req: BatchRequest):
+    """
+    Start one session per location (e.g. for a regional drill). Scenarios run
+    BATCH_CONCURRENCY at a time in the batch lane, so their OpenAI and search
+    calls queue behind interactive requests, and identical searches in flight are
+    shared. Reported as Server-Sent Events: one session event (location plus the
+    StartResponse payload) or failed event per location as it completes, then done.
+    """
+    locations = list(dict.fromkeys(loc.strip() for loc in req.locations if loc.strip()))
+    if not locations:
+        raise HTTPException(422, "locations must not be empty")
+    if len(locations) > BATCH_MAX_LOCATIONS:
+        raise HTTPException(422, f"at most {BATCH_MAX_LOCATIONS} locations per batch")
+
+    async def run(emit):
+        counts = {"sessions": 0, "failed": 0}
+
+        async def one(location: str) -> None:
+            async with _batch_slots:
+                try:
+                    threats, conversation, usage = await SCENARIOS.get(location, compute_scenario)
+                except Exception as e:
+                    logger.error("Batch scenario for %s failed: %s", location, e)
+                    counts["failed"] += 1
+                    await emit("failed", {"location": location, "detail": str(e)})
+                    return
+            session_id = await new_session(StartRequest(location=location, resources=req.resources), conversation)
+            counts["sessions"] += 1
+            await emit("session", {"location": location, **StartResponse(
+                session_id=session_id,
+                threats=threats,
+                conversation=conversation.messages(),
+                budget=usage,
+            ).model_dump()})
+
+        with lane(BATCH):
+            await asyncio.gather(*(one(location) for location in locations))
+        await emit("done", counts)
+
+    return sse_response(run)
+
+
 # ── ENDPOINT 2 : propose / refine a solution ────────────────────
+def wants_compact(compact: bool, prefer: Optional[str]) -> bool:
+    return compact or "return=minimal" in (prefer or "")
+
+
 @app.post("/session/solve", response_model=SolveResponse)
-async def solve(req: SolveRequest):
-    s = SESSION.get(req.session_id)
+async def solve(req: SolveRequest, compact: bool = False, prefer: Optional[str] = Header(None)):
+    """
+    With ?compact=true (or "Prefer: return=minimal") the analysis leaves out
+    updated_conversation; clients fetch the messages they are missing from
+    GET /session/{session_id}/conversation, starting at conversation.stable.
+    """
+    return await run_solve(req, compact=wants_compact(compact, prefer))
+
+
+@app.post("/session/solve/stream")
+async def solve_stream(req: SolveRequest, compact: bool = False, prefer: Optional[str] = Header(None)):
+    """
+    Same as /session/solve, but streams the analysis as Server-Sent Events:
+    one field event per top-level answer field as soon as it is complete
+    (short_response and updated_severty_score first), then result with the
+    SolveResponse payload.
+    """
+    if await SESSIONS.get(req.session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    compact = wants_compact(compact, prefer)
+
+    async def run(emit):
+        result = await run_solve(req, on_event=emit, compact=compact)
+        await emit("result", result.model_dump())
+
+    return sse_response(run)
+
+
+async def run_solve(req: SolveRequest, on_event=None, compact: bool = False) -> SolveResponse:
+    try:
+        # one solve per session at a time, across all workers
+        async with SESSIONS.lock(req.session_id):
+            result = await _solve_locked(req, on_event)
+    except SessionBusy:
+        raise HTTPException(status_code=409, detail="Session is busy with another solve")
+    if compact:
+        # the conversation grows every turn; send only this turn's fields
+        result.analysis = {k: v for k, v in result.analysis.items() if k != "updated_conversation"}
+    return result
+
+
+async def _solve_locked(req: SolveRequest, on_event=None) -> SolveResponse:
+    s = await SESSIONS.get(req.session_id)
     if s is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    analysis = await multiagent_analysis(
-        response=req.solution,
-        conversation=s["conversation"],
-        resources=s["resources"],
-        initial=s["initial"]
-    )
+    # the alternative suggested last turn may already have been analysed
+    analysis = await SPECULATOR.take(req.session_id, len(s["severity_history"]), req.solution)
+    precomputed = analysis is not None
+    if precomputed:
+        logger.info("Session %s: answered from the speculative analysis", req.session_id)
+        # reuse the analysis, but the turn records the solution as the user wrote it
+        analysis["new_messages"] = turn_request(req.solution, s["resources"], s["initial"]) + [turn_summary(
+            req.solution, analysis.get("feedback"), analysis.get("response_analysis"), analysis.get("updated_severty_score"))]
+        if on_event is not None:
+            for name in ANALYZE_INSIGHTS_JSON_SCHEMA["json_schema"]["schema"]["properties"]:
+                await on_event("field", {"name": name, "value": analysis.get(name)})
+    else:
+        analysis = await multiagent_analysis(
+            response=req.solution,
+            conversation=compact_session(s),
+            resources=s["resources"],
+            initial=s["initial"],
+            on_event=on_event,
+        )
+    # apply the model's resource deltas to the session ledger (validated, recorded per turn)
+    ledger = ResourceLedger.from_state(s["ledger"]) if "ledger" in s else ResourceLedger.from_resources(s["resources"])
+    analysis["resource_changes"] = ledger.apply(analysis.get("resource_changes", {}))
+    analysis["updated_resources"] = ledger.to_resources()
+
     # mark subsequent calls as non-initial
     s["initial"] = False
-    s["conversation"] = analysis["updated_conversation"]
+    # the log only grows: the turn's messages go on top of the previous snapshot
+    log = session_log(s)
+    s["conversation"] = log.append(*analysis.pop("new_messages"))
+    s["conversation_stable"] = len(log)
+    s["conversation_rev"] = s.get("conversation_rev", 0) + 1
+    analysis["updated_conversation"] = s["conversation"].messages()
     s["resources"] = analysis["updated_resources"]
+    s["ledger"] = ledger.to_state()
 
     severity = int(analysis["updated_severty_score"].get("severity_score", 0))
+    s["severity_history"].append(severity)
+    s["follow_up_threat"] = analysis.get("follow_up_threat")
+    await SESSIONS.put(req.session_id, s)
+    speculate(req.session_id, s, analysis)
 
     return SolveResponse(
         severity_score=severity,
         updated_resources=analysis["updated_resources"],
         follow_up_threat=analysis.get("follow_up_threat"),
-        analysis=analysis
+        analysis=analysis,
+        precomputed=precomputed,
+        conversation=conversation_info(s),
     )
 
 
+def conversation_info(s: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        "rev": s.get("conversation_rev", 0),
+        "total": len(s["conversation"]),
+        "stable": s.get("conversation_stable", 0),
+    }
+
+
+def session_log(s: Dict[str, Any]) -> ConversationLog:
+    # the sqlite / redis stores hand the conversation back as a plain list
+    if not isinstance(s["conversation"], ConversationLog):
+        s["conversation"] = ConversationLog.from_state(s["conversation"])
+    return s["conversation"]
+
+
+def compact_session(s: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # pinned prompts + session state verbatim, older turns summarized; the
+    # rolling summary is kept with the session so only new turns get folded in
+    prompt, s["folded"] = CONVERSATIONS.compact_log(
+        session_log(s),
+        state=ConversationManager.state_message(s["resources"], s["severity_history"], s["follow_up_threat"]),
+        folded=s.get("folded"),
+    )
+    return prompt
+
+
+def speculate(session_id: str, s: Dict[str, Any], analysis: Dict[str, Any]) -> None:
+    """Start analysing the alternative solution just suggested, against the updated session."""
+    alternative = analysis.get("alternative_solutions") or {}
+    if isinstance(alternative, list):
+        alternative = alternative[0] if alternative else {}
+    solution = alternative.get("solution") if isinstance(alternative, dict) else None
+    if not isinstance(solution, str):
+        SPECULATOR.cancel(session_id)
+        return
+    conversation, resources = compact_session(s), s["resources"]
+    SPECULATOR.start(session_id, len(s["severity_history"]), solution, lambda: multiagent_analysis(
+        response=solution, conversation=conversation, resources=resources, initial=False))
+
+
+@app.get("/session/{session_id}/ledger")
+async def session_ledger(session_id: str):
+    """Current resource counts and the per-turn history of applied / rejected changes."""
+    s = await SESSIONS.get(session_id)
+    if s is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    ledger = ResourceLedger.from_state(s["ledger"]) if "ledger" in s else ResourceLedger.from_resources(s["resources"])
+    return {"resources": ledger.to_resources(), "history": ledger.history}
+
+
+@app.get("/session/{session_id}/conversation")
+async def session_conversation(
+    session_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(CONVERSATION_PAGE_MAX, ge=1),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    One page of the stored conversation: messages[offset:offset + limit] plus
+    rev / total / stable (see SolveResponse.conversation) and next, the offset
+    of the following page or null. The ETag changes with every solve, so a
+    client repeating a request with If-None-Match gets 304 until then.
+    """
+    s = await SESSIONS.get(session_id)
+    if s is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    limit = min(limit, CONVERSATION_PAGE_MAX)
+    info = conversation_info(s)
+    etag = f'W/"{info["rev"]}-{offset}-{limit}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match is not None and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    entries = session_log(s).entries()[offset:offset + limit]
+    end = offset + len(entries)
+    head = json.dumps({**info, "offset": offset, "next": end if end < info["total"] else None})
+    # messages are written from their cached encodings
+    body = head[:-1] + ', "messages": [' + ", ".join(e.json for e in entries) + "]}"
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get("/session/{session_id}/memory")
+async def session_memory(session_id: str):
+    """Size of one session: its conversation log (messages, tokens, JSON and RAM bytes) and the whole serialized session."""
+    s = await SESSIONS.get(session_id)
+    if s is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"conversation": session_log(s).memory(), "session_bytes": session_size(s)}
+
+
+# ── probes ──────────────────────────────────────────────────────
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the warm-up has finished, so the first real request is not slowed down by imports."""
+    if not READY.is_set():
+        return Response('{"status": "warming_up"}', status_code=503, media_type="application/json")
+    return {"status": "ready"}
+
+
+@app.get("/sessions/stats")
+async def session_stats():
+    return await SESSIONS.stats()
+
+
+@app.get("/sessions/memory")
+async def sessions_memory():
+    """Memory of all live sessions and the projection per 1,000 sessions."""
+    return await SESSIONS.memory()
+
+
+# ── observability ───────────────────────────────────────────────
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    stats = await SESSIONS.stats()
+    metrics.ACTIVE_SESSIONS.set(stats["sessions"])
+    if stats["bytes"] is not None:
+        metrics.SESSION_STORE_BYTES.set(stats["bytes"])
+    search = get_search_cache().stats()
+    for result in ("memory_hits", "disk_hits", "misses"):
+        metrics.CACHE_LOOKUPS.set(search[result], cache="search", result=result)
+    scenario = SCENARIOS.stats()
+    for result in ("hits", "joins", "misses"):
+        metrics.CACHE_LOOKUPS.set(scenario[result], cache="scenario", result=result)
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# ── search cache counters ───────────────────────────────────────
+@app.get("/cache/search")
+async def search_cache_stats():
+    return get_search_cache().stats()
+
+
+@app.get("/cache/scenario")
+async def scenario_cache_stats():
+    return SCENARIOS.stats()
+
+
+@app.get("/speculation")
+async def speculation_stats():
+    """Hit rate and wasted tokens of the speculative alternative analyses."""
+    return SPECULATOR.stats()
+
+
+@app.get("/limits")
+async def limits():
+    """OpenAI and search slots in use and waiting, per priority lane."""
+    return limiter_stats()
+
+
 class ResourcesResponse(BaseModel):
     resources: List[Dict[str, Any]]     # ← matches your example output
+    sources: List[Dict[str, Any]] = []  # per file: "parser", "llm" or "mixed", per sheet detail
+
+async def spool_upload(up: UploadFile, limit: int) -> str:
+    """
+    Copy an upload to a temp file 1 MB at a time, refusing it as soon as it grows
+    past `limit` bytes. Returns the file's path; the caller removes it.
+    """
+    if up.size is not None and up.size > limit:
+        raise HTTPException(413, f"{up.filename} is larger than {limit} bytes")
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=os.path.splitext(up.filename or "")[1])
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await up.read(1024 * 1024):
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(413, f"{up.filename} is larger than {limit} bytes")
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+async def extract_one(up: UploadFile) -> tuple:
+    """
+    Resources of one upload plus a note of how each sheet was read: sheets the
+    local parser maps confidently skip the LLM, the rest go to excel_str_to_resources.
+    """
+    path = await spool_upload(up, EXCEL_MAX_BYTES)
+
+    try:
+        sheets = await parse_workbook(path, up.filename)
+    except WorkbookRejected as e:
+        raise HTTPException(e.status, str(e))
+    except Exception as e:
+        raise HTTPException(422, f"Cannot parse {up.filename}: {e}")
+    finally:
+        os.unlink(path)
+
+    parsed = [s for s in sheets if s["resources"] is not None]
+    unparsed = [s for s in sheets if s["resources"] is None and s["rows"]]
+    try:
+        # only the sheets the parser could not map are read back from disk
+        texts = [read_tsv(s) for s in unparsed]
+    finally:
+        remove_tsv(path)
+    resources: List[Dict[str, Any]] = []
+    if parsed:
+        resources.append(merge_resources([s["resources"] for s in parsed]))
+
+    llm_stats: Dict[str, Any] = {}
+    if unparsed:
+        # one text per sheet, so every chunk repeats its own sheet's header row
+        extracted = await excel_str_to_resources(texts, stats=llm_stats,
+                                                 headers=[s["header"] for s in unparsed])
+
+        # Make sure helper returns a dict; wrap otherwise
+        if isinstance(extracted, dict):
+            resources.append(extracted)
+        elif isinstance(extracted, list):
+            resources.extend(extracted)
+        else:
+            raise HTTPException(500, "excel_str_to_resources returned unexpected type")
+
+    source = {
+        "filename": up.filename,
+        "path": "llm" if not parsed else "parser" if not unparsed else "mixed",
+        "sheets": {
+            s["name"]: {
+                "path": "parser" if s["resources"] is not None else "llm" if s["rows"] else "empty",
+                "confidence": s["confidence"],
+            }
+            for s in sheets
+        },
+        "llm_chunks": llm_stats.get("chunks", []),
+    }
+    return resources, source
 
-def df_to_tsv(df: pd.DataFrame) -> str:
-    return df.to_csv(sep="\t", index=False, header=False, na_rep="")
 
 @app.post(
     "/extract/excel",
@@ -120,42 +754,15 @@ def df_to_tsv(df: pd.DataFrame) -> str:
 )
 async def extract_excel(file: List[UploadFile] = File(...)):
     """Turn one or more Excel files into a list of resource dicts."""
-    resources_out: List[Dict[str, Any]] = []
-
     for up in file:
         if not up.filename.endswith((".xlsx", ".xls")):
             raise HTTPException(415, f"{up.filename} is not an Excel file")
 
-        buffer = io.BytesIO(await up.read())
-
-        # read every sheet
-        try:
-            book = pd.read_excel(
-                buffer,
-                sheet_name=None,
-                dtype=str,
-                engine="openpyxl" if up.filename.endswith(".xlsx") else "xlrd",
-            )
-        except Exception as e:
-            raise HTTPException(422, f"Cannot parse {up.filename}: {e}")
-
-        # flat text of all sheets
-        full_text = "\n".join(df_to_tsv(df) for df in book.values())
-
-        # call your helper – async or sync
-        extracted = await excel_str_to_resources(full_text) \
-            if asyncio.iscoroutinefunction(excel_str_to_resources) \
-            else excel_str_to_resources(full_text)
-
-        # Make sure helper returns a dict; wrap otherwise
-        if isinstance(extracted, dict):
-            resources_out.append(extracted)
-        elif isinstance(extracted, list):
-            resources_out.extend(extracted)
-        else:
-            raise HTTPException(500, "excel_str_to_resources returned unexpected type")
+    # files are parsed (in the process pool) and extracted concurrently
+    per_file = await asyncio.gather(*(extract_one(up) for up in file))
+    resources_out: List[Dict[str, Any]] = [r for rs, _ in per_file for r in rs]
 
-    return ResourcesResponse(resources=resources_out)
+    return ResourcesResponse(resources=resources_out, sources=[src for _, src in per_file])
 
 
 # ── run locally ─────────────────────────────────────────────────
@@ -0,0 +1,423 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from convlog import ConversationLog, shared_memory
+from mylogger import logger
+
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")          # memory | sqlite | redis
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "")        # sqlite path or redis://host:port/db
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+# how long a solve may hold a session, and how long another solve waits for it
+SESSION_LOCK_LEASE = float(os.getenv("SESSION_LOCK_LEASE", "300"))
+SESSION_LOCK_WAIT = float(os.getenv("SESSION_LOCK_WAIT", "120"))
+
+
+class SessionBusy(Exception):
+    """Raised when a session stays locked by another request for too long."""
+
+
+def encode_session(session: Dict[str, Any]) -> str:
+    """
+    JSON for a session dict. ConversationLog values are spliced in from their
+    cached per-message encodings instead of being encoded again.
+    """
+    logs = {k: v for k, v in session.items() if isinstance(v, ConversationLog)}
+    plain = json.dumps({k: v for k, v in session.items() if k not in logs}, default=str)
+    if not logs:
+        return plain
+    parts = ", ".join(f"{json.dumps(k)}: {v.to_json()}" for k, v in logs.items())
+    return plain[:-1] + (", " if len(plain) > 2 else "") + parts + "}"
+
+
+def session_size(session: Dict[str, Any]) -> int:
+    """len(encode_session(session)), without building the string."""
+    logs = {k: v for k, v in session.items() if isinstance(v, ConversationLog)}
+    plain = len(json.dumps({k: v for k, v in session.items() if k not in logs}, default=str))
+    if not logs:
+        return plain
+    size = plain + sum(len(json.dumps(k)) + 2 + v.nbytes() + 2 for k, v in logs.items())
+    return size - 2 if plain == 2 else size
+
+
+class SessionStore(ABC):
+    """
+    Storage for session dicts (conversation, resources, ...).
+
+    Read-modify-write cycles must run inside `async with store.lock(session_id)`,
+    which is exclusive across every process sharing the backend, so two
+    concurrent solves on one session run one after the other.
+    """
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def put(self, session_id: str, session: Dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None: ...
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """{"sessions": live sessions, "bytes": serialized size or None}"""
+
+    async def memory(self) -> Dict[str, Any]:
+        """
+        stats() plus the projected size of 1,000 sessions; the in-process store
+        adds RAM estimates (see MemorySessionStore.memory).
+        """
+        stats = await self.stats()
+        per_1000 = None
+        if stats["sessions"] and stats["bytes"] is not None:
+            per_1000 = round(stats["bytes"] / stats["sessions"] * 1000)
+        return {**stats, "bytes_per_1000": per_1000}
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def lock(self, session_id: str, wait: float = SESSION_LOCK_WAIT, lease: float = SESSION_LOCK_LEASE):
+        """
+        Async context manager holding the session exclusively; raises SessionBusy
+        after waiting `wait` seconds. A holder that dies frees it after `lease` seconds.
+        """
+
+
+class LeaseSessionStore(SessionStore):
+    """
+    A SessionStore whose lock is a lease (token + expiry) kept in the backend itself,
+    polled until it can be taken.
+    """
+
+    @abstractmethod
+    async def _acquire(self, session_id: str, token: str, lease: float) -> bool:
+        """Take the lease for `token` if nobody holds it or it expired."""
+
+    @abstractmethod
+    async def _release(self, session_id: str, token: str) -> None:
+        """Drop the lease, but only while `token` still holds it."""
+
+    @asynccontextmanager
+    async def lock(self, session_id: str, wait: float = SESSION_LOCK_WAIT, lease: float = SESSION_LOCK_LEASE):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        while not await self._acquire(session_id, token, lease):
+            if time.monotonic() > deadline:
+                raise SessionBusy(session_id)
+            await asyncio.sleep(0.05)
+        try:
+            yield
+        finally:
+            await self._release(session_id, token)
+
+
+# ── in-process LRU + TTL ────────────────────────────────────────
+class MemorySessionStore(SessionStore):
+    """
+    Sessions in a dict of the current process, evicted by TTL and least-recent use.
+    Only suitable for a single worker.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._data: "OrderedDict[str, tuple[float, Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._locks: Dict[str, list] = {}
+
+    def _drop(self, session_id: str) -> None:
+        _, _, size = self._data.pop(session_id)
+        self._bytes -= size
+
+    async def get(self, session_id):
+        entry = self._data.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            self._drop(session_id)
+            return None
+        self._data.move_to_end(session_id)
+        return entry[1]
+
+    async def put(self, session_id, session):
+        size = session_size(session)
+        if session_id in self._data:
+            self._drop(session_id)
+        self._data[session_id] = (time.time() + self.ttl, session, size)
+        self._bytes += size
+        while len(self._data) > self.max_sessions:
+            evicted = next(iter(self._data))
+            logger.info("Evicting session %s", evicted)
+            self._drop(evicted)
+
+    async def delete(self, session_id):
+        if session_id in self._data:
+            self._drop(session_id)
+
+    async def stats(self):
+        now = time.time()
+        for session_id in [k for k, v in self._data.items() if v[0] <= now]:
+            self._drop(session_id)
+        return {"sessions": len(self._data), "bytes": self._bytes}
+
+    async def memory(self):
+        """
+        Adds "ram_bytes": conversation logs with segments shared between sessions
+        (e.g. the cached scenario) counted once, plus the serialized size of the
+        other session fields; "unshared_ram_bytes" as if every session had its own
+        copy; and "ram_per_1000", the projection for 1,000 sessions like these.
+        """
+        out = await super().memory()
+        logs, other = [], 0
+        for _, session, size in self._data.values():
+            session_logs = [v for v in session.values() if isinstance(v, ConversationLog)]
+            logs += session_logs
+            other += size - sum(log.nbytes() for log in session_logs)
+        ram = shared_memory(logs)
+        out["ram_bytes"] = ram["ram_bytes"] + other
+        out["unshared_ram_bytes"] = ram["unshared_ram_bytes"] + other
+        out["ram_per_1000"] = round(out["ram_bytes"] / len(self._data) * 1000) if self._data else None
+        return out
+
+    @asynccontextmanager
+    async def lock(self, session_id: str, wait: float = SESSION_LOCK_WAIT, lease: float = SESSION_LOCK_LEASE):
+        # [lock, users] – dropped again once nobody holds or waits for it
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(entry[0].acquire(), wait)
+            except asyncio.TimeoutError:
+                raise SessionBusy(session_id)
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(session_id, None)
+
+
+# ── SQLite (shared by the workers of one host) ──────────────────
+class SqliteSessionStore(LeaseSessionStore):
+    """
+    Sessions as JSON rows in a WAL-mode SQLite file; locks are lease rows in the same file.
+    """
+
+    def __init__(self, path: str, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._mutex = asyncio.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS session_locks (id TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    async def _run(self, sql: str, params: tuple = ()):
+        """
+        Execute one statement off the event loop; returns (rows, rowcount).
+        """
+        def run():
+            cur = self._db.execute(sql, params)
+            return cur.fetchall(), cur.rowcount
+
+        async with self._mutex:
+            return await asyncio.to_thread(run)
+
+    async def get(self, session_id):
+        rows, _ = await self._run("SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (session_id, time.time()))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def put(self, session_id, session):
+        await self._run(
+            "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, encode_session(session), time.time() + self.ttl),
+        )
+
+    async def delete(self, session_id):
+        await self._run("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    async def stats(self):
+        await self._run("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+        rows, _ = await self._run("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions")
+        count, size = rows[0]
+        return {"sessions": count, "bytes": size}
+
+    async def _acquire(self, session_id, token, lease):
+        now = time.time()
+        _, changed = await self._run(
+            "INSERT INTO session_locks (id, token, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET token = excluded.token, expires_at = excluded.expires_at "
+            "WHERE session_locks.expires_at <= ?",
+            (session_id, token, now + lease, now),
+        )
+        return changed == 1
+
+    async def _release(self, session_id, token):
+        await self._run("DELETE FROM session_locks WHERE id = ? AND token = ?", (session_id, token))
+
+    async def close(self):
+        self._db.close()
+
+
+# ── Redis protocol ──────────────────────────────────────────────
+class RespClient:
+    """
+    Minimal RESP2 client over one asyncio connection; enough for the session store.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.strip("/") or 0)
+        self._reader = None
+        self._writer = None
+        self._mutex = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", self.db)
+
+    async def _read(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = await self._reader.readexactly(n + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [await self._read() for _ in range(n)]
+        raise RuntimeError(f"unexpected RESP reply {line!r}")
+
+    async def _roundtrip(self, *args):
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            a = str(a).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(a), a))
+        self._writer.write(b"".join(out))
+        await self._writer.drain()
+        return await self._read()
+
+    async def execute(self, *args, retry: bool = True):
+        """
+        Send one command and return its reply. If the connection breaks, the command
+        is sent again once over a new connection, unless `retry` is False: a command
+        that must not run twice may already have been applied when the reply was lost.
+        """
+        async with self._mutex:
+            if self._writer is None:
+                await self._connect()
+            try:
+                return await self._roundtrip(*args)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self._writer.close()
+                self._writer = None
+                if not retry:
+                    raise
+                await self._connect()
+                return await self._roundtrip(*args)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+
+
+# deletes the lease only while it still holds our token
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisSessionStore(LeaseSessionStore):
+    """
+    Sessions as JSON strings with PX expiry in any Redis-protocol server.
+    A sorted set of expiry times keeps the live-session count cheap.
+    """
+
+    def __init__(self, url: str, ttl: float = SESSION_TTL, prefix: str = "komorebi:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = RespClient(url)
+
+    async def get(self, session_id):
+        data = await self._redis.execute("GET", self.prefix + "session:" + session_id)
+        return json.loads(data) if data is not None else None
+
+    async def put(self, session_id, session):
+        expires_at = time.time() + self.ttl
+        await self._redis.execute("SET", self.prefix + "session:" + session_id,
+                                  encode_session(session), "PX", int(self.ttl * 1000))
+        await self._redis.execute("ZADD", self.prefix + "sessions", expires_at, session_id)
+
+    async def delete(self, session_id):
+        await self._redis.execute("DEL", self.prefix + "session:" + session_id)
+        await self._redis.execute("ZREM", self.prefix + "sessions", session_id)
+
+    async def stats(self):
+        await self._redis.execute("ZREMRANGEBYSCORE", self.prefix + "sessions", "-inf", time.time())
+        count = await self._redis.execute("ZCOUNT", self.prefix + "sessions", time.time(), "+inf")
+        return {"sessions": count, "bytes": None}
+
+    async def _acquire(self, session_id, token, lease):
+        key = self.prefix + "lock:" + session_id
+        try:
+            reply = await self._redis.execute("SET", key, token, "NX", "PX", int(lease * 1000), retry=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # the SET may have gone through before the reply was lost; then the lease is ours
+            if await self._redis.execute("GET", key) == token:
+                return True
+            reply = await self._redis.execute("SET", key, token, "NX", "PX", int(lease * 1000), retry=False)
+        return reply == "OK"
+
+    async def _release(self, session_id, token):
+        # compare-and-delete in one step, so a lease taken over after ours expired stays
+        await self._redis.execute("EVAL", RELEASE_SCRIPT, 1, self.prefix + "lock:" + session_id, token)
+
+    async def close(self):
+        await self._redis.close()
+
+
+def make_session_store(kind: str = SESSION_STORE, url: str = SESSION_STORE_URL) -> SessionStore:
+    """
+    Build the store selected by SESSION_STORE / SESSION_STORE_URL.
+    """
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "sqlite":
+        return SqliteSessionStore(url or "sessions.sqlite3")
+    if kind == "redis":
+        return RedisSessionStore(url or "redis://127.0.0.1:6379/0")
+    raise ValueError(f"Unknown SESSION_STORE {kind!r}")
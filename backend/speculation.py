@@ -0,0 +1,154 @@
+import asyncio
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aihandler import track_usage
+from metrics import SPECULATIONS, SPECULATION_WASTED_TOKENS
+from mylogger import logger
+from priority import lane, BATCH
+
+# speculative analyses running at once (0 turns speculation off)
+SPECULATION_CONCURRENCY = int(os.getenv("SPECULATION_CONCURRENCY", "4"))
+# speculations allowed to wait for a slot; beyond this new ones are skipped
+SPECULATION_MAX_PENDING = int(os.getenv("SPECULATION_MAX_PENDING", str(SPECULATION_CONCURRENCY * 4)))
+# finished results nobody asked for are dropped after this many seconds
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "900"))
+
+
+def normalize_solution(text: str) -> str:
+    """
+    Form used to compare solutions: case, punctuation and spacing are ignored.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", text.casefold()).split())
+
+
+@dataclass
+class Speculation:
+    solution: str
+    version: int
+    task: asyncio.Task = None
+    usage: Dict[str, int] = field(default_factory=dict)
+    created: float = field(default_factory=time.monotonic)
+
+
+class Speculator:
+    """
+    Evaluate the alternative solution a session was just offered while the user
+    is still reading the feedback, one speculation per session.
+
+    `take` hands the result over when the next submitted solution matches it
+    (after normalize_solution) and the session has not changed in between;
+    anything else cancels the speculation. The work runs in the batch lane, so it
+    never delays interactive OpenAI calls.
+    """
+
+    def __init__(self, concurrency: int = SPECULATION_CONCURRENCY, max_pending: int = SPECULATION_MAX_PENDING):
+        self.enabled = concurrency > 0
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._running: Dict[str, Speculation] = {}
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.failed = 0
+        self.wasted_tokens = 0
+
+    def start(self, session_id: str, version: int, solution: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+        """
+        Start computing `compute()` for `solution` in the background; `version`
+        identifies the session state the result is valid for.
+        """
+        self.cancel(session_id)
+        if not self.enabled or not solution.strip():
+            return
+        self._prune()
+        if sum(not s.task.done() for s in self._running.values()) >= self.max_pending:
+            self.skipped += 1
+            SPECULATIONS.inc(outcome="skipped")
+            return
+        spec = Speculation(normalize_solution(solution), version)
+
+        async def run() -> Dict[str, Any]:
+            async with self._slots:
+                with lane(BATCH), track_usage() as usage:
+                    spec.usage = usage
+                    return await compute()
+
+        spec.task = asyncio.create_task(run())
+        spec.task.add_done_callback(self._log_failure)
+        self._running[session_id] = spec
+        self.started += 1
+
+    def _log_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            SPECULATIONS.inc(outcome="failed")
+            logger.warning("Speculative analysis failed: %s", task.exception())
+
+    async def take(self, session_id: str, version: int, solution: str) -> Optional[Dict[str, Any]]:
+        """
+        The precomputed result if it matches this solution and session version,
+        waiting for it if it is still running; otherwise None (and it is dropped).
+        """
+        spec = self._running.pop(session_id, None)
+        if spec is None:
+            return None
+        if spec.version != version or spec.solution != normalize_solution(solution):
+            self._discard(spec)
+            return None
+        try:
+            result = await asyncio.shield(spec.task)
+        except asyncio.CancelledError:
+            if not spec.task.done():
+                # the request itself went away; let the speculation finish for the retry
+                self._running.setdefault(session_id, spec)
+            raise
+        except Exception:
+            return None
+        self.hits += 1
+        SPECULATIONS.inc(outcome="hit")
+        return result
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - SPECULATION_TTL
+        for session_id, spec in list(self._running.items()):
+            if spec.task.done() and spec.created < cutoff:
+                del self._running[session_id]
+                self._discard(spec)
+
+    def cancel(self, session_id: str) -> None:
+        spec = self._running.pop(session_id, None)
+        if spec is not None:
+            self._discard(spec)
+
+    def _discard(self, spec: Speculation) -> None:
+        self.misses += 1
+        SPECULATIONS.inc(outcome="miss")
+        spent = spec.usage.get("total_tokens", 0)
+        self.wasted_tokens += spent
+        SPECULATION_WASTED_TOKENS.inc(spent)
+        spec.task.cancel()
+
+    def close(self) -> None:
+        """Cancel everything still running (application shutdown)."""
+        for spec in self._running.values():
+            spec.task.cancel()
+        self._running.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        decided = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "running": len(self._running),
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "hit_rate": round(self.hits / decided, 3) if decided else None,
+            "wasted_tokens": self.wasted_tokens,
+        }
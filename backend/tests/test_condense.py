@@ -0,0 +1,30 @@
+import json
+
+from condense import condense_results
+from conversation import count_tokens
+
+
+def _body(*results):
+    return json.dumps({"answer": None, "results": [
+        {"url": url, "title": url, "content": content, "score": score} for url, content, score in results
+    ]})
+
+
+def test_oversized_result_does_not_stop_smaller_ones():
+    long = " ".join(f"word{i}" for i in range(400))
+    short = "The bridge on the north road is closed after the flood."
+    text, _ = condense_results({
+        "q": _body(("a.example/long", long, 0.9), ("b.example/short", short, 0.5)),
+    }, budget=count_tokens(short) + 40)
+    assert "b.example/short" in text
+    assert "a.example/long" not in text
+
+
+def test_skipped_result_does_not_mark_duplicates():
+    chunk = "Shelters are open at the stadium and the main school for displaced families."
+    long = chunk + " [...] " + " ".join(f"word{i}" for i in range(400))
+    text, stats = condense_results({
+        "q": _body(("a.example/long", long, 0.9), ("b.example/short", chunk, 0.5)),
+    }, budget=count_tokens(chunk) + 40)
+    assert "b.example/short" in text
+    assert stats["duplicate_chunks"] == 0
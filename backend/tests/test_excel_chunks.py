@@ -0,0 +1,54 @@
+import io
+import os
+
+from aihandler import split_tsv
+from excelio import read_sheet, read_tsv, read_workbook, remove_tsv
+
+TITLED = [
+    ("Flood response inventory – Valencia",),
+    (),
+    ("Item", "Quantity", "Depot"),
+] + [(f"Sandbag pallet {i}", i, f"Depot {i % 3}") for i in range(60)]
+
+
+def test_read_sheet_finds_header_below_title():
+    tsv = io.StringIO()
+    sheet = read_sheet("Inventory", iter(TITLED), tsv)
+    assert sheet["rows"] == 62
+    assert tsv.getvalue().splitlines()[sheet["header"]] == "Item\tQuantity\tDepot"
+
+
+def test_chunks_repeat_header_not_title():
+    tsv = io.StringIO()
+    sheet = read_sheet("Inventory", iter(TITLED), tsv)
+    chunks = split_tsv(tsv.getvalue(), max_tokens=60, header=sheet["header"])
+    assert len(chunks) > 2
+    assert chunks[0].splitlines()[:2] == ["Flood response inventory – Valencia", "Item\tQuantity\tDepot"]
+    for chunk in chunks[1:]:
+        assert chunk.splitlines()[0] == "Item\tQuantity\tDepot"
+        assert "Flood response inventory" not in chunk
+    rows = [line for chunk in chunks for line in chunk.splitlines()[1:] if line.startswith("Sandbag")]
+    assert len(rows) == 60
+
+
+def test_first_line_is_header_by_default():
+    chunks = split_tsv("Item\tQuantity\n" + "\n".join(f"Boat {i}\t{i}" for i in range(50)), max_tokens=40)
+    assert all(chunk.startswith("Item\tQuantity\n") for chunk in chunks)
+
+
+def test_read_workbook_spools_tsv(tmp_path):
+    import openpyxl
+
+    path = str(tmp_path / "inventory.xlsx")
+    book = openpyxl.Workbook()
+    book.active.append(["Resource", "Quantity"])
+    book.active.append(["Ambulances", 4])
+    book.create_sheet("Notes").append(["call the depot first"])
+    book.save(path)
+
+    sheets = read_workbook(path, "inventory.xlsx")
+    assert [s["rows"] for s in sheets] == [2, 1]
+    assert sheets[0]["resources"]["Medical Resources"]["Ambulances"] == 4
+    assert read_tsv(sheets[1]) == "call the depot first\n"
+    remove_tsv(path)
+    assert sorted(os.listdir(tmp_path)) == ["inventory.xlsx"]
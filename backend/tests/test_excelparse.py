@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from excelparse import LAYOUT_SAMPLE_ROWS, SheetParser, match_resource, parse_sheet
+
+
+@pytest.mark.parametrize("label, item", [
+    ("Doctors", "Doctors"),
+    ("rescue boats", "Rescue Boats"),
+    ("Ambulances (qty)", "Ambulances"),
+    ("Water Units in stock", "Water Units"),
+    ("Fuel reserves (l)", "Fuel Reserves"),
+    ("First aid kits", "Medical Kits"),
+])
+def test_match_resource(label, item):
+    assert match_resource(label) == item
+
+
+@pytest.mark.parametrize("label", [
+    "Water damage claims", "Shelter needed", "Tent pegs", "Boat trailers", "Ambulance drivers",
+    "Water", "Fuel", "Medics",
+])
+def test_match_resource_rejects_unrelated_labels(label):
+    assert match_resource(label) is None
+
+
+def test_unrelated_rows_are_not_mapped():
+    df = pd.DataFrame([["Water damage claims", 40], ["Shelter needed", 3], ["Doctors", 2]])
+    resources, confidence = parse_sheet(df)
+    assert resources is None
+    assert confidence == pytest.approx(1 / 3)
+
+
+def test_long_sheet():
+    df = pd.DataFrame([["Resource", "Quantity"], ["Ambulances", 4], ["Rescue boats", 2], ["Ambulances", 1]])
+    resources, confidence = parse_sheet(df)
+    assert confidence == 1.0
+    assert resources["Medical Resources"]["Ambulances"] == 5
+    assert resources["Logistics & Support"]["Rescue Boats"] == 2
+
+
+def test_rows_past_the_layout_window_are_summed():
+    parser = SheetParser()
+    parser.feed(["Resource", "Quantity"])
+    for i in range(LAYOUT_SAMPLE_ROWS * 3):
+        parser.feed(["Ambulances" if i % 2 else "Rescue boats", 1])
+    resources, confidence = parser.result()
+    assert confidence == 1.0
+    assert resources["Medical Resources"]["Ambulances"] == LAYOUT_SAMPLE_ROWS * 3 // 2
+    assert resources["Logistics & Support"]["Rescue Boats"] == LAYOUT_SAMPLE_ROWS * 3 // 2
+
+
+def test_wide_sheet():
+    df = pd.DataFrame([["Depot", "Ambulances", "Doctors"], ["North", 3, 10], ["South", 2, None]])
+    resources, confidence = parse_sheet(df)
+    assert confidence == 1.0
+    assert resources["Medical Resources"]["Ambulances"] == 5
+    assert resources["Medical Resources"]["Doctors"] == 10
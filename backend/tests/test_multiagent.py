@@ -0,0 +1,35 @@
+import asyncio
+import json
+
+import multiagent
+
+
+def test_threats_are_reported_once_across_rounds(monkeypatch):
+    replies = [3, 7]                            # a short answer first, so the loop asks again
+
+    async def stream(conversation, **kw):
+        days = replies.pop(0)
+        reply = {"use_internet": False, "search_queries": [], "final_answer": {
+            "daily_threats": [{"day": d, "threat": f"flooding {d}"} for d in range(1, days + 1)],
+            "most_potential_threat": [],
+        }}
+        text = json.dumps(reply)
+        for i in range(0, len(text), 40):
+            yield text[i:i + 40]
+
+    monkeypatch.setattr(multiagent, "stream_openai_api", stream)
+    monkeypatch.setattr(multiagent, "split_scene", lambda: False)
+
+    async def main():
+        threats = []
+
+        async def on_event(name, data):
+            if name == "threat":
+                threats.append(data["day"])
+
+        final, _ = await multiagent.multiagent_scene("Valencia", on_event=on_event)
+        return final, threats
+
+    final, threats = asyncio.run(main())
+    assert len(final["daily_threats"]) == 7
+    assert threats == [1, 2, 3, 4, 5, 6, 7]
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from priority import PriorityLimiter
+
+
+async def _hold_and_queue(limiter: PriorityLimiter):
+    await limiter._acquire("interactive")
+    waiter = asyncio.ensure_future(limiter._acquire("interactive"))
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting_interactive"] == 1
+    return waiter
+
+
+def test_cancel_after_slot_was_handed_over():
+    async def main():
+        limiter = PriorityLimiter(1)
+        waiter = await _hold_and_queue(limiter)
+        limiter._release("interactive")         # hands the slot to the waiter ...
+        waiter.cancel()                         # ... which is cancelled before it runs
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.stats()["active"] == 0
+        await asyncio.wait_for(limiter._acquire("interactive"), 1)
+
+    asyncio.run(main())
+
+
+def test_cancel_racing_with_release():
+    async def main():
+        limiter = PriorityLimiter(1)
+        waiter = await _hold_and_queue(limiter)
+        waiter.cancel()                         # cancels the queued future ...
+        limiter._release("interactive")         # ... which _wake pops and skips
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        stats = limiter.stats()
+        assert stats["active"] == 0 and stats["waiting_interactive"] == 0
+        await asyncio.wait_for(limiter._acquire("interactive"), 1)
+
+    asyncio.run(main())
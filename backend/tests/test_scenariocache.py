@@ -0,0 +1,58 @@
+import asyncio
+
+from scenariocache import ScenarioCache
+
+
+def test_streams_share_one_computation_and_its_events():
+    async def main():
+        cache = ScenarioCache(bucket_seconds=0)
+        calls = []
+
+        async def compute(location, on_event=None):
+            calls.append(on_event is not None)
+            for day in range(1, 4):
+                await on_event("threat", {"day": day})
+                await asyncio.sleep(0.01)
+            return ({"daily_threats": [1, 2, 3]}, [], {})
+
+        def listener(events):
+            async def on_event(name, data):
+                events.append((name, data["day"]))
+            return on_event
+
+        first, late = [], []
+        a = asyncio.ensure_future(cache.get("Valencia", compute, on_event=listener(first)))
+        await asyncio.sleep(0.015)              # the late stream misses the first events
+        b = asyncio.ensure_future(cache.get(" valencia ", compute, on_event=listener(late)))
+        c = asyncio.ensure_future(cache.get("Valencia", compute))
+        results = await asyncio.gather(a, b, c)
+
+        assert calls == [True]
+        assert first == late == [("threat", 1), ("threat", 2), ("threat", 3)]
+        assert all(r[0] == {"daily_threats": [1, 2, 3]} for r in results)
+        assert cache.stats()["joins"] == 2
+
+    asyncio.run(main())
+
+
+def test_stream_joining_a_plain_computation_gets_no_events():
+    async def main():
+        cache = ScenarioCache(bucket_seconds=0)
+
+        async def compute(location, on_event=None):
+            assert on_event is None
+            await asyncio.sleep(0.01)
+            return ({"daily_threats": []}, [], {})
+
+        events = []
+
+        async def on_event(name, data):
+            events.append(name)
+
+        plain = asyncio.ensure_future(cache.get("Valencia", compute))
+        await asyncio.sleep(0)
+        await cache.get("Valencia", compute, on_event=on_event)
+        await plain
+        assert events == []
+
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from bench.stubs import RespStandIn
+from sessionstore import RedisSessionStore, SessionBusy, SqliteSessionStore
+
+
+async def _lock_release_lock(store):
+    async with store.lock("s1", wait=0.2):
+        with pytest.raises(SessionBusy):
+            async with store.lock("s1", wait=0.2):
+                pass
+    async with store.lock("s1", wait=0.2):     # released, so free again right away
+        pass
+
+
+def test_redis_lock_is_released():
+    async def main():
+        async with RespStandIn() as redis:
+            store = RedisSessionStore(redis.url)
+            await _lock_release_lock(store)
+            await store.close()
+    asyncio.run(main())
+
+
+def test_redis_release_keeps_a_lease_taken_over():
+    async def main():
+        async with RespStandIn() as redis:
+            store = RedisSessionStore(redis.url)
+            assert await store._acquire("s1", "old", 0.05)
+            await asyncio.sleep(0.1)            # the old lease expires ...
+            assert await store._acquire("s1", "new", 60)
+            await store._release("s1", "old")   # ... and its late release must not drop the new one
+            assert not await store._acquire("s1", "other", 60)
+            await store.close()
+    asyncio.run(main())
+
+
+def test_sqlite_lock_is_released(tmp_path):
+    async def main():
+        store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+        await _lock_release_lock(store)
+        await store.close()
+    asyncio.run(main())
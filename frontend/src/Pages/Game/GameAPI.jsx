@@ -1,5 +1,33 @@
 const API_BASE = 'http://localhost:8000';
 
+// conversation already received for the current session; solves are requested
+// in compact mode and only the messages from `stable` on are fetched again
+// (the browser revalidates those pages with their ETag)
+let history = { session_id: null, rev: 0, messages: [] };
+
+async function syncConversation(session_id, info) {
+  if (history.session_id !== session_id) {
+    history = { session_id, rev: 0, messages: [] };
+  }
+  if (info.rev === history.rev && history.messages.length === info.total) {
+    return history.messages;
+  }
+  // `stable` is relative to the previous revision; further behind, start over
+  let messages = history.messages.slice(0, info.rev === history.rev + 1 ? info.stable : 0);
+  let offset = messages.length;
+  while (offset !== null) {
+    const response = await fetch(`${API_BASE}/session/${session_id}/conversation?offset=${offset}`);
+    if (!response.ok) {
+      throw new Error(await response.text() || response.status);
+    }
+    const page = await response.json();
+    messages = messages.concat(page.messages);
+    history = { session_id, rev: page.rev, messages };
+    offset = page.next;
+  }
+  return history.messages;
+}
+
 
 export async function fetchInitialBubbles(location) {
   const response = await fetch(`${API_BASE}/session/start`, {
@@ -12,7 +40,9 @@ export async function fetchInitialBubbles(location) {
   if (!response.ok) {
     throw new Error(await response.text() || response.status);
   }
-  return response.json();
+  const data = await response.json();
+  history = { session_id: data.session_id, rev: 0, messages: data.conversation };
+  return data;
 }
 
 
@@ -21,7 +51,7 @@ export async function submitGameAction(session_id, solution) {
     throw new Error('No sessionId found in localStorage');
   }
 
-  const response = await fetch(`${API_BASE}/session/solve`, {
+  const response = await fetch(`${API_BASE}/session/solve?compact=true`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({
@@ -33,5 +63,7 @@ export async function submitGameAction(session_id, solution) {
   if (!response.ok) {
     throw new Error(await response.text() || response.status);
   }
-  return response.json();
+  const result = await response.json();
+  result.analysis.updated_conversation = await syncConversation(session_id, result.conversation);
+  return result;
 }